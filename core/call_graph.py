@@ -0,0 +1,204 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .project import Function
+
+# Call graph of all functions in compressed sparse row form. Functions are numbered by
+# entry point, the edges of function i are stored at [start[i], start[i + 1]) of the edge
+# arrays, sorted by the other function and the call site. There is one edge per call site,
+# so a function calling another one twice has two edges to it.
+#
+# Built from Function.callees by Project.get_calls, Function.analyze replaces the edges
+# of the function it analyzed.
+
+class Adjacency:
+    def __init__(self, n: int, edges: list[tuple[int, int, int]]):
+        # edges are (from, to, call site pc)
+        edges.sort()
+        self.start = [0] * (n + 1)
+        for a, _, _ in edges:
+            self.start[a + 1] += 1
+        for i in range(n):
+            self.start[i + 1] += self.start[i]
+        self.targets = [b for _, b, _ in edges]
+        self.sites = [pc for _, _, pc in edges]
+
+        # Number of distinct functions and call sites per function
+        self.degree = [0] * n
+        self.site_count = [0] * n
+        for i in range(n):
+            lo, hi = self.start[i], self.start[i + 1]
+            self.degree[i] = sum(1 for j in range(lo, hi) if j == lo or self.targets[j] != self.targets[j - 1])
+            self.site_count[i] = len(set(self.sites[lo:hi]))
+
+    def neighbours(self, i: int) -> list[int]:
+        lo, hi = self.start[i], self.start[i + 1]
+        return [self.targets[j] for j in range(lo, hi) if j == lo or self.targets[j] != self.targets[j - 1]]
+
+    def edges(self, i: int) -> list[tuple[int, int]]:
+        lo, hi = self.start[i], self.start[i + 1]
+        return list(zip(self.sites[lo:hi], self.targets[lo:hi]))
+
+    # Call sites of the edges from i to j
+    def sites_to(self, i: int, j: int) -> list[int]:
+        lo, hi = self.start[i], self.start[i + 1]
+        return self.sites[bisect_left(self.targets, j, lo, hi):bisect_right(self.targets, j, lo, hi)]
+
+class CallIndex:
+    def __init__(self, functions: Iterable["Function"]):
+        functions = list(functions)
+        self.eps = sorted(fun.ep for fun in functions)
+        self.ids = {ep: i for i, ep in enumerate(self.eps)}
+
+        calls: list[tuple[int, int, int]] = []
+        for fun in functions:
+            calls.extend(self._edges(fun))
+        self._build(calls)
+
+    # (from, to, call site pc) for the calls of fun
+    def _edges(self, fun: "Function") -> list[tuple[int, int, int]]:
+        a = self.ids[fun.ep]
+        res: list[tuple[int, int, int]] = []
+        for pc, ep in getattr(fun, "callees", []):
+            b = self.ids.get(ep)
+            if b is not None: res.append((a, b, pc))
+        return res
+
+    def _build(self, calls: list[tuple[int, int, int]]):
+        n = len(self.eps)
+        self.out = Adjacency(n, calls)
+        self.into = Adjacency(n, [(b, a, pc) for a, b, pc in calls])
+
+        self.component = self._components()
+        size = [0] * n
+        for c in self.component: size[c] += 1
+        self.recursive = [
+            size[self.component[i]] > 1 or bool(self.out.sites_to(i, i))
+            for i in range(n)
+        ]
+
+    # Strongly connected components with Tarjan's algorithm, without recursion
+    # because call chains can be deeper than the interpreter stack.
+    # Components are numbered in reverse topological order, callees first.
+    def _components(self) -> list[int]:
+        n = len(self.eps)
+        index = [-1] * n
+        low = [0] * n
+        component = [-1] * n
+        on_stack = [False] * n
+        stack: list[int] = []
+        counter = 0
+        count = 0
+
+        for root in range(n):
+            if index[root] >= 0: continue
+            work = [(root, 0)]
+            while work:
+                v, k = work.pop()
+                if k == 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+                children = self.out.neighbours(v)
+                if k > 0:
+                    low[v] = min(low[v], low[children[k - 1]])
+                while k < len(children):
+                    w = children[k]
+                    if index[w] < 0: break
+                    if on_stack[w]: low[v] = min(low[v], index[w])
+                    k += 1
+                if k < len(children):
+                    work.append((v, k + 1))
+                    work.append((children[k], 0))
+                    continue
+                if low[v] == index[v]:
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component[w] = count
+                        if w == v: break
+                    count += 1
+        return component
+
+    # Replaces the edges of a function that was analyzed again. Returns False if the function
+    # isn't indexed, the index has to be rebuilt then.
+    def update(self, fun: "Function") -> bool:
+        a = self.ids.get(fun.ep)
+        if a is None: return False
+        edges = sorted(self._edges(fun))
+        if edges == [(a, b, pc) for pc, b in self.out.edges(a)]: return True
+
+        calls = [
+            (i, self.out.targets[j], self.out.sites[j])
+            for i in range(len(self.eps)) if i != a
+            for j in range(self.out.start[i], self.out.start[i + 1])
+        ]
+        calls.extend(edges)
+        self._build(calls)
+        return True
+
+    def __contains__(self, ep: int) -> bool:
+        return ep in self.ids
+
+    def callees(self, ep: int) -> list[int]:
+        return [self.eps[j] for j in self.out.neighbours(self.ids[ep])]
+
+    def callers(self, ep: int) -> list[int]:
+        return [self.eps[j] for j in self.into.neighbours(self.ids[ep])]
+
+    # (call site, callee) for every call in the function
+    def call_sites(self, ep: int) -> list[tuple[int, int]]:
+        return [(pc, self.eps[j]) for pc, j in self.out.edges(self.ids[ep])]
+
+    # (call site, caller) for every call of the function
+    def caller_sites(self, ep: int) -> list[tuple[int, int]]:
+        return [(pc, self.eps[j]) for pc, j in self.into.edges(self.ids[ep])]
+
+    # Call sites in caller that call callee
+    def sites(self, caller: int, callee: int) -> list[int]:
+        return self.out.sites_to(self.ids[caller], self.ids[callee])
+
+    def out_degree(self, ep: int) -> int:
+        return self.out.degree[self.ids[ep]]
+
+    def in_degree(self, ep: int) -> int:
+        return self.into.degree[self.ids[ep]]
+
+    # Number of distinct call sites calling the function
+    def frequency(self, ep: int) -> int:
+        return self.into.site_count[self.ids[ep]]
+
+    def is_recursive(self, ep: int) -> bool:
+        return self.recursive[self.ids[ep]]
+
+    def same_component(self, a: int, b: int) -> bool:
+        return self.component[self.ids[a]] == self.component[self.ids[b]]
+
+    # Functions reachable from ep through calls, or the ones reaching it with reverse
+    def reachable(self, ep: int, reverse: bool = False) -> set[int]:
+        adj = self.into if reverse else self.out
+        seen = {self.ids[ep]}
+        work = [self.ids[ep]]
+        while work:
+            for j in adj.neighbours(work.pop()):
+                if j not in seen:
+                    seen.add(j)
+                    work.append(j)
+        return {self.eps[i] for i in seen}
+
+    def reaches(self, a: int, b: int) -> bool:
+        if self.same_component(a, b): return True
+        # Components are numbered callees first, anything further down can't reach back up
+        target = self.ids[b]
+        limit = self.component[target]
+        seen = {self.ids[a]}
+        work = [self.ids[a]]
+        while work:
+            for j in self.out.neighbours(work.pop()):
+                if j == target: return True
+                if j not in seen and self.component[j] >= limit:
+                    seen.add(j)
+                    work.append(j)
+        return False
@@ -0,0 +1,137 @@
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from tcls_900.tlcs_900 import BYTE, WORD, LWORD
+
+from .project import CodeSection, DataSection
+
+if TYPE_CHECKING:
+    from .project import Project
+
+# Finds typed data in the parts of the ROM that weren't disassembled:
+#   - arrays of 24 bit pointers, stored in 4 bytes each
+#   - arrays of structures that have a pointer at the same offset, by their stride
+#   - zero terminated strings that any of those point to, which makes an array of them a string table
+# A pointer is only taken if it points at an instruction, a label or a string, and it takes
+# MIN_ELEMENTS of them in a row to make an array. Padding like 00 00 00 00 or FF FF FF 00
+# is never a pointer, and an array needs at least two different targets.
+
+POINTER_SIZE = 4
+PADDING = (0x000000, 0xFFFFFF)
+MIN_ELEMENTS = 3
+MAX_STRIDE = 32
+MIN_STRING = 2
+MAX_STRING = 256
+
+TYPE_SIZE = {BYTE: 1, WORD: 2, LWORD: 4}
+
+PRINTABLE = frozenset(range(0x20, 0x7F)) | {0x09, 0x0A, 0x0D}
+
+@dataclass
+class DataType:
+    address: int
+    type: int # Size of one value, BYTE for strings
+    elements: int
+    stride: int
+    string: bool = False
+
+    def type_size(self) -> int:
+        return TYPE_SIZE[self.type]
+
+class PointerScanner:
+    def __init__(self, proj: "Project"):
+        self.proj = proj
+        self.ib = proj.ib
+        self.plausible: dict[int, bool] = {}
+        self.strings: dict[int, int] = {}
+
+    # Length of the string at address including the terminator, 0 if there is none
+    def string_length(self, address: int) -> int:
+        if address in self.strings: return self.strings[address]
+        buffer = self.ib.buffer
+        start = address - self.ib.entry_point
+        end = min(start + MAX_STRING, len(buffer))
+        res = 0
+        if not self.ib.was_read(address):
+            i = start
+            while i < end and buffer[i] in PRINTABLE: i += 1
+            if i < end and buffer[i] == 0 and i - start >= MIN_STRING:
+                res = i - start + 1
+        self.strings[address] = res
+        return res
+
+    def is_plausible(self, ptr: int) -> bool:
+        if ptr in self.plausible: return self.plausible[ptr]
+        res = False
+        if self.proj.ob.label(ptr) is not None: res = True
+        elif self.ib.was_read(ptr):
+            located = self.proj.locate(ptr)
+            res = located is not None and isinstance(located[0], CodeSection)
+        else: res = self.string_length(ptr) > 0
+        self.plausible[ptr] = res
+        return res
+
+    def pointer(self, address: int) -> int:
+        o = address - self.ib.entry_point
+        return int.from_bytes(self.ib.buffer[o:o + POINTER_SIZE], "little")
+
+    # Addresses of all plausible pointers in [start, end)
+    def scan(self, start: int, end: int) -> list[int]:
+        ib = self.ib
+        # Only the two upper bytes need to be checked to find candidates, the highest one is always 0
+        lo, hi = ib.min >> 16, (ib.max - 1) >> 16
+        pattern = re.compile(b"(?=..[" + re.escape(bytes([lo])) + b"-" + re.escape(bytes([hi])) + b"]\x00)", re.DOTALL)
+        res: list[int] = []
+        base = ib.entry_point
+        for m in pattern.finditer(ib.buffer, start - base, end - base):
+            address = m.start() + base
+            if address + POINTER_SIZE > end: break
+            ptr = self.pointer(address)
+            if ptr in PADDING: continue
+            if ib.min <= ptr < ib.max and self.is_plausible(ptr):
+                res.append(address)
+        return res
+
+# Contiguous runs of data sections
+def data_regions(proj: "Project") -> list[tuple[int, int]]:
+    regions: list[tuple[int, int]] = []
+    for section in proj.sections.values():
+        if not isinstance(section, DataSection): continue
+        end = section.offset + section.length
+        if regions and regions[-1][1] == section.offset:
+            regions[-1] = (regions[-1][0], end)
+        else: regions.append((section.offset, end))
+    return regions
+
+def find_data_types(proj: "Project") -> list[DataType]:
+    scanner = PointerScanner(proj)
+    res: list[DataType] = []
+    strings: set[int] = set()
+
+    for start, end in data_regions(proj):
+        positions = scanner.scan(start, end)
+        found = set(positions)
+        covered = start
+        for p in positions:
+            if p < covered: continue
+            stride = POINTER_SIZE
+            n = 1
+            while p + n * stride in found: n += 1
+            if n < MIN_ELEMENTS:
+                # Structures with a pointer at the same offset
+                for stride in range(POINTER_SIZE + 1, MAX_STRIDE + 1):
+                    n = 1
+                    while p + n * stride in found: n += 1
+                    if n >= MIN_ELEMENTS: break
+            if n < MIN_ELEMENTS: continue
+
+            targets = [scanner.pointer(p + i * stride) for i in range(n)]
+            if len(set(targets)) < 2: continue
+            res.append(DataType(p, LWORD, n, stride))
+            strings.update(t for t in targets if scanner.string_length(t) > 0)
+            covered = p + n * stride
+
+    for address in sorted(strings):
+        res.append(DataType(address, BYTE, scanner.string_length(address), 1, True))
+    return res
@@ -0,0 +1,140 @@
+from enum import Enum
+
+from disapi import Loc
+from tcls_900.tlcs_900 import Mem, MemReg
+
+from .project import Project
+from .fingerprint import Fingerprint, fingerprints, block_order, is_default_name
+
+# Matches functions of two revisions of the same firmware.
+#
+# 1. Functions with the same normalized instruction stream (unchanged, only moved)
+# 2. Functions with the same control flow graph and length
+# 3. Unmatched callers and callees of matched functions, these are paired up
+#    if their shape is unique among the neighbors or if only one is left on both sides
+#
+# Every step only pairs functions that are unique in their bucket, so nothing is compared pairwise.
+
+class MatchReason(Enum):
+    BODY = 1
+    SHAPE = 2
+    CALLS = 3
+
+class FunctionMatch:
+    def __init__(self, old: Fingerprint, new: Fingerprint, reason: MatchReason):
+        self.old = old
+        self.new = new
+        self.reason = reason
+
+    @property
+    def modified(self) -> bool:
+        return self.old.body != self.new.body
+
+def unique_buckets(prints: dict[int, Fingerprint], key) -> dict:
+    buckets: dict = {}
+    for ep, fp in prints.items():
+        buckets.setdefault(key(fp), []).append(ep)
+    return {k: eps[0] for k, eps in buckets.items() if len(eps) == 1}
+
+def shape_key(fp: Fingerprint) -> tuple[str, int]:
+    return fp.shape, fp.length
+
+def body_key(fp: Fingerprint) -> str:
+    return fp.body
+
+class ProjectDiff:
+    def __init__(self, old: Project, new: Project):
+        self.old = old
+        self.new = new
+        self.old_prints = fingerprints(old)
+        self.new_prints = fingerprints(new)
+
+        self.matches: dict[int, FunctionMatch] = {} # old ep -> match
+        self.reverse: dict[int, int] = {} # new ep -> old ep
+
+        queue: list[FunctionMatch] = []
+        for reason, key in ((MatchReason.BODY, body_key), (MatchReason.SHAPE, shape_key)):
+            old_left = {ep: fp for ep, fp in self.old_prints.items() if ep not in self.matches}
+            new_left = {ep: fp for ep, fp in self.new_prints.items() if ep not in self.reverse}
+            new_buckets = unique_buckets(new_left, key)
+            for k, ep in unique_buckets(old_left, key).items():
+                if k in new_buckets:
+                    queue.append(self._match(ep, new_buckets[k], reason))
+
+        while queue:
+            match = queue.pop()
+            for old_eps, new_eps in ((match.old.callees, match.new.callees), (match.old.callers, match.new.callers)):
+                queue.extend(self._match_neighbors(old_eps, new_eps))
+
+        self.removed = sorted(ep for ep in self.old_prints if ep not in self.matches)
+        self.added = sorted(ep for ep in self.new_prints if ep not in self.reverse)
+        self.modified = sorted(ep for ep, m in self.matches.items() if m.modified)
+        self.unchanged = sorted(ep for ep, m in self.matches.items() if not m.modified)
+
+    def _match(self, old_ep: int, new_ep: int, reason: MatchReason) -> FunctionMatch:
+        match = FunctionMatch(self.old_prints[old_ep], self.new_prints[new_ep], reason)
+        self.matches[old_ep] = match
+        self.reverse[new_ep] = old_ep
+        return match
+
+    def _match_neighbors(self, old_eps: list[int], new_eps: list[int]) -> list[FunctionMatch]:
+        old_left = {ep: self.old_prints[ep] for ep in old_eps if ep in self.old_prints and ep not in self.matches}
+        new_left = {ep: self.new_prints[ep] for ep in new_eps if ep in self.new_prints and ep not in self.reverse}
+        if not old_left or not new_left: return []
+
+        if len(old_left) == 1 and len(new_left) == 1:
+            return [self._match(next(iter(old_left)), next(iter(new_left)), MatchReason.CALLS)]
+
+        res = []
+        for key in (body_key, shape_key):
+            new_buckets = unique_buckets(new_left, key)
+            for k, ep in unique_buckets(old_left, key).items():
+                if k in new_buckets and ep not in self.matches and new_buckets[k] not in self.reverse:
+                    res.append(self._match(ep, new_buckets[k], MatchReason.CALLS))
+        return res
+
+    def carry_labels(self) -> int:
+        # Copies the names of matched functions into the new project. For unchanged functions the
+        # instruction streams line up, so labels of branch targets and data are copied as well.
+        # Only default names in the new project are replaced, returns the number of renamed labels.
+        renamed = 0
+        def copy(old_loc: int, new_loc: int):
+            nonlocal renamed
+            old_label = self.old.ob.label(old_loc)
+            new_label = self.new.ob.label(new_loc)
+            if old_label is None or new_label is None: return
+            if is_default_name(old_label) or not is_default_name(new_label): return
+            if old_label.name == new_label.name: return
+            self.new.rename_label(new_loc, old_label.name)
+            renamed += 1
+
+        for old_ep, match in self.matches.items():
+            copy(old_ep, match.new.ep)
+            if match.modified: continue
+
+            old_fun = self.old.functions[old_ep]
+            new_fun = self.new.functions[match.new.ep]
+            for old_block, new_block in zip(block_order(old_fun), block_order(new_fun)):
+                for old_insn, new_insn in zip(old_fun.blocks[old_block].insn, new_fun.blocks[new_block].insn):
+                    copy(old_insn.entry.pc, new_insn.entry.pc)
+                    for old_op, new_op in zip(old_insn.entry.instructions, new_insn.entry.instructions):
+                        if isinstance(old_op, Loc) and isinstance(new_op, Loc):
+                            copy(old_op.loc, new_op.loc)
+                        elif isinstance(old_op, Mem) and isinstance(new_op, Mem) and not isinstance(old_op, MemReg):
+                            copy(old_op.address, new_op.address)
+
+        return renamed
+
+    def report(self) -> list[str]:
+        def name(project: Project, ep: int) -> str:
+            return str(project.ob.label(ep) or format(ep, "X"))
+
+        res = [f"{len(self.unchanged)} unchanged, {len(self.modified)} modified, {len(self.added)} added, {len(self.removed)} removed"]
+        for ep in self.modified:
+            match = self.matches[ep]
+            res.append(f"~ {name(self.old, ep)} -> {name(self.new, match.new.ep)} ({match.reason.name.lower()})")
+        for ep in self.added:
+            res.append(f"+ {name(self.new, ep)}")
+        for ep in self.removed:
+            res.append(f"- {name(self.old, ep)}")
+        return res
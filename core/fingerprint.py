@@ -0,0 +1,248 @@
+import json, os
+from hashlib import md5
+from pathlib import Path
+
+from disapi import Label, Loc
+from tcls_900.tlcs_900 import Reg, Mem, MemReg
+
+from .project import Function, Project, Instruction
+
+# Immediates below this are kept when normalizing, bigger ones are likely addresses
+MAX_IMMEDIATE = 0x100
+# Length of the opcode n-grams
+NGRAM = 3
+# Number of minhash values per function, split into bands of BAND_ROWS values each
+MINHASH_SIZE = 32
+BAND_ROWS = 4
+# Mersenne prime for the minhash permutations
+PRIME = (1 << 61) - 1
+
+def normalize_operand(op) -> str:
+    # Operand kinds with the absolute addresses removed, register and SFR names are kept
+    if isinstance(op, Reg): return str(op)
+    elif isinstance(op, MemReg): return f"({op.name})"
+    elif isinstance(op, Mem):
+        if op.special: return op.name
+        return "mem" if op.plain_addr else "(mem)"
+    elif isinstance(op, Loc): return "loc"
+    elif isinstance(op, int): return str(op) if op < MAX_IMMEDIATE else "#"
+    elif isinstance(op, (bytes, bytearray)): return "db"
+    return str(op)
+
+def normalize_insn(insn: Instruction) -> str:
+    return insn.entry.opcode + " " + ",".join(map(normalize_operand, insn.entry.instructions))
+
+def block_order(fun: Function) -> list[int]:
+    # Blocks reachable from the entry point in depth first order, stable across revisions
+    order: list[int] = []
+    visited: set[int] = set()
+    stack = [fun.start.ep]
+    while stack:
+        ep = stack.pop()
+        if ep in visited or ep not in fun.blocks: continue
+        visited.add(ep)
+        order.append(ep)
+        stack.extend(succ for succ, _ in reversed(fun.blocks[ep].succ))
+    return order
+
+class Fingerprint:
+    def __init__(self, fun: Function):
+        self.ep = fun.ep
+        self.order = block_order(fun)
+        index = {ep: i for i, ep in enumerate(self.order)}
+
+        body = md5()
+        shape = md5()
+        self.blocks: list[str] = []
+        self.length = 0
+        opcodes: list[str] = []
+        for ep in self.order:
+            block = fun.blocks[ep]
+            opcodes.extend(insn.entry.opcode for insn in block.insn)
+            text = "\n".join(map(normalize_insn, block.insn)).encode()
+            self.blocks.append(md5(text).hexdigest())
+            body.update(text + b"\n")
+            self.length += len(block.insn)
+            shape.update(repr((len(block.insn), [(index.get(succ, -1), cond) for succ, cond in block.succ])).encode())
+
+        # Normalized instruction stream
+        self.body = body.hexdigest()
+        # Control flow graph, only the number of instructions per block and the edges
+        self.shape = shape.hexdigest()
+
+        # Opcode n-grams, these survive small changes to the function
+        self.ngrams = {stable_hash(" ".join(opcodes[i:i + NGRAM])) for i in range(max(1, len(opcodes) - NGRAM + 1))}
+
+        self.callees = list(dict.fromkeys(ep for _, ep in getattr(fun, "callees", [])))
+        self.callers = list(dict.fromkeys(ep for _, ep in getattr(fun, "callers", [])))
+
+def analyzed_functions(project: Project) -> dict[int, Function]:
+    # Without functions every comparison would come out empty
+    if project.functions is None:
+        raise ValueError(f"Functions of {project.filename} haven't been analyzed")
+    return project.functions
+
+def fingerprints(project: Project) -> dict[int, Fingerprint]:
+    functions = analyzed_functions(project)
+    project.load_blocks(block for fun in functions.values() for block in fun.blocks.values())
+    return {ep: Fingerprint(fun) for ep, fun in functions.items()}
+
+def stable_hash(text: str) -> int:
+    # Python's hash is salted per process, the index is persistent
+    return int.from_bytes(md5(text.encode()).digest()[:8], "little")
+
+PERMUTATIONS = [(stable_hash(f"a{i}") | 1, stable_hash(f"b{i}")) for i in range(MINHASH_SIZE)]
+
+def minhash(values: set[int]) -> list[int]:
+    return [min((a * v + b) % PRIME for v in values) for a, b in PERMUTATIONS]
+
+def is_default_name(label: Label) -> bool:
+    return label.name == Label(label.location, kind=label.kind).name
+
+class Suggestion:
+    def __init__(self, ep: int, name: str, score: float, reason: str):
+        self.ep = ep
+        self.name = name
+        self.score = score
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"{self.ep:X} -> {self.name} ({self.reason} {self.score:.2f})"
+
+# Buckets bigger than this are ignored, they only contain trivial blocks or functions
+MAX_BUCKET = 64
+# Blocks with less instructions are too generic to identify a function
+MIN_BLOCK_LENGTH = 3
+
+# Fingerprints of named functions from reference projects.
+# Lookups go through hash buckets for the whole body, the individual blocks and
+# the minhash bands of the opcode n-grams, so matching never scans the whole index.
+class FingerprintIndex:
+    def __init__(self):
+        self.entries: list[dict] = []
+        self.body: dict[str, list[int]] = {}
+        self.blocks: dict[str, list[int]] = {}
+        self.bands: dict[str, list[int]] = {}
+
+    def _insert(self, entry: dict):
+        i = len(self.entries)
+        self.entries.append(entry)
+        self.body.setdefault(entry["body"], []).append(i)
+        for block in set(entry["blocks"]):
+            self.blocks.setdefault(block, []).append(i)
+        for band in bands(entry["minhash"]):
+            self.bands.setdefault(band, []).append(i)
+
+    def remove_project(self, filename: str):
+        # The buckets hold positions in entries, so they are built again
+        entries = [entry for entry in self.entries if entry["project"] != filename]
+        if len(entries) == len(self.entries): return
+        self.entries = []
+        self.body.clear()
+        self.blocks.clear()
+        self.bands.clear()
+        for entry in entries:
+            self._insert(entry)
+
+    def add_project(self, project: Project) -> int:
+        # Only functions with a given name are indexed, returns the number of new entries.
+        # Entries from an earlier run on the same project are replaced.
+        self.remove_project(project.filename)
+        functions = analyzed_functions(project)
+        project.load_blocks(block for fun in functions.values() for block in fun.blocks.values())
+        count = 0
+        for ep, fun in functions.items():
+            label = project.ob.label(ep)
+            if label is None or is_default_name(label): continue
+            fp = Fingerprint(fun)
+            if fp.length == 0: continue
+            self._insert({
+                "name": label.name,
+                "project": project.filename,
+                "body": fp.body,
+                "length": fp.length,
+                "blocks": [h for h, ep in zip(fp.blocks, fp.order) if len(fun.blocks[ep].insn) >= MIN_BLOCK_LENGTH],
+                "minhash": minhash(fp.ngrams)
+            })
+            count += 1
+        return count
+
+    def add_project_folder(self, project_folder: Path) -> int:
+        return self.add_project(Project.read_from_file(project_folder))
+
+    def _best(self, fp: Fingerprint, signature: list[int], blocks: set[str]) -> tuple[str, float, str] | None:
+        candidates = self.body.get(fp.body, [])
+        if candidates and len(candidates) <= MAX_BUCKET:
+            names = {self.entries[i]["name"] for i in candidates}
+            if len(names) == 1: return names.pop(), 1.0, "body"
+
+        votes: dict[int, int] = {}
+        for band in bands(signature):
+            bucket = self.bands.get(band, ())
+            if len(bucket) > MAX_BUCKET: continue
+            for i in bucket: votes[i] = votes.get(i, 0)
+        for block in blocks:
+            bucket = self.blocks.get(block, ())
+            if len(bucket) > MAX_BUCKET: continue
+            for i in bucket: votes[i] = votes.get(i, 0) + 1
+
+        best: tuple[str, float, str] | None = None
+        for i, shared in votes.items():
+            entry = self.entries[i]
+            similarity = sum(a == b for a, b in zip(signature, entry["minhash"])) / MINHASH_SIZE
+            block_score = shared / max(len(blocks), len(entry["blocks"]), 1)
+            score = max(similarity, block_score) * min(fp.length, entry["length"]) / max(fp.length, entry["length"])
+            if best is None or score > best[1]:
+                best = (entry["name"], score, "blocks" if block_score > similarity else "ngrams")
+        return best
+
+    def suggest(self, project: Project, min_score: float = 0.5) -> list[Suggestion]:
+        # Suggestions for every function that still has its default name, at most one per name
+        res: dict[str, Suggestion] = {}
+        functions = analyzed_functions(project)
+        project.load_blocks(block for fun in functions.values() for block in fun.blocks.values())
+        for ep, fun in functions.items():
+            label = project.ob.label(ep)
+            if label is None or not is_default_name(label): continue
+            fp = Fingerprint(fun)
+            if fp.length == 0: continue
+
+            blocks = {h for h, b in zip(fp.blocks, fp.order) if len(fun.blocks[b].insn) >= MIN_BLOCK_LENGTH}
+            best = self._best(fp, minhash(fp.ngrams), blocks)
+            if best is None or best[1] < min_score: continue
+            name, score, reason = best
+            if name not in res or res[name].score < score:
+                res[name] = Suggestion(ep, name, score, reason)
+        return sorted(res.values(), key=lambda s: s.ep)
+
+    def apply(self, project: Project, suggestions: list[Suggestion]) -> int:
+        # Renames in bulk, names that are already used in the project are skipped
+        used = {label.name for label in project.ob.labels.values()}
+        count = 0
+        for suggestion in suggestions:
+            label = project.ob.label(suggestion.ep)
+            if label is None or suggestion.name in used: continue
+            project.rename_label(suggestion.ep, suggestion.name)
+            used.add(suggestion.name)
+            count += 1
+        return count
+
+    def save(self, path: Path):
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as fp:
+            json.dump({"version": 1, "ngram": NGRAM, "entries": self.entries}, fp)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path: Path) -> "FingerprintIndex":
+        index = FingerprintIndex()
+        if not path.exists(): return index
+        with open(path, "r") as fp:
+            data = json.load(fp)
+        if data.get("version") != 1 or data.get("ngram") != NGRAM: return index
+        for entry in data["entries"]:
+            index._insert(entry)
+        return index
+
+def bands(signature: list[int]) -> list[str]:
+    return [f"{i}:" + ",".join(map(str, signature[i:i + BAND_ROWS])) for i in range(0, len(signature), BAND_ROWS)]
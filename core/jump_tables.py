@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from tcls_900.tlcs_900 import Reg, Mem, MemReg, BYTE, WORD, LWORD
+
+from .project import CodeSection, CodeBlock, Instruction, get_store
+
+if TYPE_CHECKING:
+    from .project import Project
+
+# Finds the targets of register indirect JP and CALL instructions that go through a table
+# of pointers, like
+#
+#   LD XIX, table          LDA XIY, table
+#   LD XIX, (XIX+WA)       ADD XIY, XWA
+#   JP T, XIX              LD XIY, (XIY)
+#                          CALL T, XIY
+#
+# Register values are tracked forward through every block, a block with a single predecessor
+# starts with the values its predecessor ends with. Tables are read from the InputBuffer,
+# one 24 bit pointer per 4 bytes, up to the first entry that doesn't look like one.
+
+MAX_ENTRIES = 256
+POINTER_SIZE = 4
+
+REG_BYTES = {BYTE: 1, WORD: 2, LWORD: 4}
+
+# What is known about a 32 bit register
+@dataclass(frozen=True)
+class Value:
+    kind: int
+    value: int
+
+CONST = 0 # Holds value
+INDEX = 1 # value plus some unknown offset
+TABLE = 2 # Was loaded from an unknown entry of the table at value
+
+def plain_reg(mem: MemReg) -> bool:
+    # (r32) and (r32+r) but not (r32+d), (-r32) or (r32+)
+    if mem.reg2 is not None: return mem.name == f"{mem.reg1}+{mem.reg2}"
+    return mem.name == str(mem.reg1)
+
+def reg_key(reg: Reg) -> int | None:
+    reg = reg.normalize()
+    if reg.size != LWORD: return None
+    return reg.addr
+
+class ValueState:
+    def __init__(self, values: dict[int, Value] | None = None):
+        self.values = values or {}
+
+    def copy(self) -> "ValueState":
+        return ValueState(self.values.copy())
+
+    def get(self, reg: Reg | None) -> Value | None:
+        if reg is None: return None
+        key = reg_key(reg)
+        return self.values.get(key) if key is not None else None
+
+    def kill(self, reg: Reg):
+        reg = reg.normalize()
+        start, end = reg.addr, reg.addr + REG_BYTES[reg.size]
+        for key in [k for k in self.values if k < end and start < k + 4]:
+            del self.values[key]
+
+    def step(self, proj: "Project", insn: Instruction):
+        entry = insn.entry
+        ops = entry.instructions
+        if entry.opcode in ("CALL", "CALR"):
+            self.values.clear() # The callee can change anything
+            return
+
+        value: Value | None = None
+        if len(ops) == 2 and isinstance(ops[0], Reg) and reg_key(ops[0]) is not None:
+            src = ops[1]
+            if entry.opcode in ("LD", "LDA"):
+                if isinstance(src, int):
+                    value = Value(CONST, src)
+                elif isinstance(src, Reg):
+                    value = self.get(src)
+                elif isinstance(src, MemReg):
+                    base = self.get(src.reg1) if plain_reg(src) else None
+                    if base is None or base.kind == TABLE: pass
+                    elif entry.opcode == "LDA":
+                        value = Value(INDEX, base.value) if src.reg2 is not None else base
+                    elif src.reg2 is not None or base.kind == INDEX:
+                        value = Value(TABLE, base.value)
+                    else:
+                        ptr = read_pointer(proj, base.value)
+                        if ptr is not None: value = Value(CONST, ptr)
+                elif isinstance(src, Mem) and (src.plain_addr or entry.opcode == "LDA"):
+                    value = Value(CONST, src.address)
+            elif entry.opcode == "ADD":
+                dst = self.get(ops[0])
+                if dst is not None and dst.kind in (CONST, INDEX):
+                    if isinstance(src, int) and dst.kind == CONST:
+                        value = Value(CONST, dst.value + src)
+                    else: value = Value(INDEX, dst.value)
+
+        for reg in get_store(insn):
+            if isinstance(reg, Reg): self.kill(reg)
+        if value is not None:
+            key = reg_key(ops[0])
+            assert key is not None
+            self.values[key] = value
+
+def read_pointer(proj: "Project", address: int) -> int | None:
+    ib = proj.ib
+    offset = address - ib.entry_point
+    if offset < 0 or offset + POINTER_SIZE > len(ib.buffer): return None
+    ptr = int.from_bytes(ib.buffer[offset:offset + POINTER_SIZE], "little")
+    if ptr >> 24: return None
+    if ptr < ib.min or ptr >= ib.max: return None
+    return ptr
+
+def is_target(proj: "Project", address: int) -> bool:
+    # Either undecoded bytes or the start of an instruction, never the middle of one
+    if not proj.ib.was_read(address): return True
+    res = proj.locate(address)
+    return res is not None and isinstance(res[0], CodeSection)
+
+def read_table(proj: "Project", base: int) -> list[int]:
+    targets: list[int] = []
+    for i in range(MAX_ENTRIES):
+        address = base + i * POINTER_SIZE
+        # Decoded code, another label or one of the targets ends the table
+        if proj.ib.was_read(address) or address in targets: break
+        if i > 0 and proj.ob.label(address) is not None: break
+        ptr = read_pointer(proj, address)
+        if ptr is None or not is_target(proj, ptr): break
+        targets.append(ptr)
+    return targets
+
+@dataclass
+class JumpTable:
+    pc: int # The JP or CALL
+    end: int # Address after it
+    targets: list[int]
+    call: bool
+
+# Every indirect JP or CALL in the blocks that could be resolved
+def find_jump_tables(proj: "Project", blocks: list[CodeBlock]) -> list[JumpTable]:
+    res: list[JumpTable] = []
+    states: dict[int, ValueState] = {}
+    # Predecessors are created before their successors, a block with a single predecessor
+    # always comes after it
+    for block in blocks:
+        if len(block.pred) == 1 and block.pred[0] in states:
+            state = states[block.pred[0]].copy()
+        else: state = ValueState()
+
+        for insn in block.insn:
+            entry = insn.entry
+            if entry.opcode in ("JP", "CALL") and len(entry.instructions) == 2:
+                mem = entry.instructions[1]
+                if isinstance(mem, MemReg) and mem.reg2 is None and plain_reg(mem):
+                    value = state.get(mem.reg1)
+                    targets: list[int] = []
+                    if value is not None and value.kind == TABLE:
+                        targets = read_table(proj, value.value)
+                    elif value is not None and value.kind == CONST and is_target(proj, value.value):
+                        targets = [value.value]
+                    if targets:
+                        res.append(JumpTable(entry.pc, entry.pc + entry.length, targets, entry.opcode == "CALL"))
+            state.step(proj, insn)
+
+        states[block.ep] = state
+    return res
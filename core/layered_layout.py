@@ -0,0 +1,257 @@
+# Layered (Sugiyama style) layout for control flow graphs.
+#
+# 1. Cycles are broken by reversing the back edges of a depth first search
+# 2. Nodes are assigned to layers by their longest path from a source, edges
+#    that span multiple layers get a dummy node in every layer they cross
+# 3. Crossings are reduced with barycenter sweeps over the layers
+# 4. x coordinates are pulled towards the neighbors while keeping the order
+#    of every layer, y coordinates follow from the layer heights
+# 5. Edges become cubic splines through their dummy nodes
+#
+# The result has the same structure as graphviz json0 output, all coordinates are
+# in points with the origin in the bottom left corner and sizes are in inches.
+#
+# Plain Python on purpose: every step works on one layer at a time and walks the edges
+# of its nodes, which doesn't vectorize, and NumPy isn't a dependency of the tool.
+
+from .nonoverlap import ordered_nonoverlap
+
+# Part of the key of cached layouts, bump it whenever the output of layered_layout changes
+LAYOUT_VERSION = 1
+
+NODE_SEP = 18.0
+RANK_SEP = 36.0
+DUMMY_WIDTH = 8.0
+PADDING = 4.0
+ARROW_LENGTH = 12.0
+LOOP_WIDTH = 30.0
+SWEEPS = 8
+POSITION_PASSES = 4
+# Number of node visits after which the sweeps and passes are reduced, long edges
+# in big functions can add hundreds of thousands of dummy nodes
+WORK_LIMIT = 1_000_000
+
+Point = tuple[float, float]
+
+def spline(points: list[Point]) -> list[Point]:
+    # Cubic segments with vertical tangents through all points
+    res = [points[0]]
+    for p, q in zip(points, points[1:]):
+        dy = (q[1] - p[1]) / 2
+        res.extend(((p[0], p[1] + dy), (q[0], q[1] - dy), q))
+    return res
+
+def format_points(tip: Point, points: list[Point]) -> str:
+    return " ".join([f"e,{tip[0]:.2f},{tip[1]:.2f}"] + [f"{x:.2f},{y:.2f}" for x, y in points])
+
+def mean(values: list[float], default: float) -> float:
+    if not values: return default
+    return sum(values) / len(values)
+
+# nodes are in declaration order, the first one is the entry point.
+# edges are (tail, head, color) tuples.
+def layered_layout(nodes: list[int], sizes: dict[int, tuple[float, float]], edges: list[tuple[int, int, str]]) -> dict:
+    index = {v: i for i, v in enumerate(nodes)}
+    n = len(nodes)
+
+    # Virtual graph, real nodes first and dummy nodes appended to it
+    width = [sizes[v][0] * 72 for v in nodes]
+    height = [sizes[v][1] * 72 for v in nodes]
+
+    out_edges: list[list[int]] = [[] for _ in range(n)]
+    loops: list[int] = []
+    for e, (tail, head, _) in enumerate(edges):
+        if tail == head: loops.append(e)
+        else: out_edges[index[tail]].append(e)
+
+    # 1. Reverse back edges
+    reverse = [False] * len(edges)
+    state = [0] * n # 0 = unvisited, 1 = on the stack, 2 = done
+    for root in range(n):
+        if state[root]: continue
+        state[root] = 1
+        stack = [(root, 0)]
+        while stack:
+            v, i = stack[-1]
+            if i < len(out_edges[v]):
+                stack[-1] = (v, i + 1)
+                e = out_edges[v][i]
+                w = index[edges[e][1]]
+                if state[w] == 1: reverse[e] = True
+                elif state[w] == 0:
+                    state[w] = 1
+                    stack.append((w, 0))
+            else:
+                state[v] = 2
+                stack.pop()
+
+    dag: list[tuple[int, int, int]] = [] # (upper, lower, edge)
+    for v in range(n):
+        for e in out_edges[v]:
+            w = index[edges[e][1]]
+            dag.append((w, v, e) if reverse[e] else (v, w, e))
+
+    # 2. Longest path layering
+    successors: list[list[int]] = [[] for _ in range(n)]
+    indegree = [0] * n
+    for a, b, _ in dag:
+        successors[a].append(b)
+        indegree[b] += 1
+
+    layer = [0] * n
+    queue = [v for v in range(n) if indegree[v] == 0]
+    i = 0
+    while i < len(queue):
+        v = queue[i]
+        i += 1
+        for w in successors[v]:
+            layer[w] = max(layer[w], layer[v] + 1)
+            indegree[w] -= 1
+            if indegree[w] == 0: queue.append(w)
+
+    up: list[list[int]] = [[] for _ in range(n)]
+    down: list[list[int]] = [[] for _ in range(n)]
+    chains: list[tuple[int, list[int]]] = [] # (edge, upper to lower)
+    for a, b, e in dag:
+        chain = [a]
+        for l in range(layer[a] + 1, layer[b]):
+            d = len(width)
+            width.append(DUMMY_WIDTH)
+            height.append(0)
+            layer.append(l)
+            up.append([])
+            down.append([])
+            chain.append(d)
+        chain.append(b)
+        for u, w in zip(chain, chain[1:]):
+            down[u].append(w)
+            up[w].append(u)
+        chains.append((e, chain))
+
+    total = len(width)
+    layer_count = max(layer, default=0) + 1
+
+    # Initial order from a depth first search, keeps related blocks close
+    layers: list[list[int]] = [[] for _ in range(layer_count)]
+    seen = [False] * total
+    for root in range(total):
+        if seen[root]: continue
+        seen[root] = True
+        stack = [root]
+        while stack:
+            v = stack.pop()
+            layers[layer[v]].append(v)
+            for w in reversed(down[v]):
+                if not seen[w]:
+                    seen[w] = True
+                    stack.append(w)
+
+    # 3. Barycenter sweeps
+    pos = [0] * total
+    def number(l: int):
+        for i, v in enumerate(layers[l]): pos[v] = i
+
+    sweeps = max(2, min(SWEEPS, WORK_LIMIT // total))
+    passes = max(1, min(POSITION_PASSES, WORK_LIMIT // (2 * total)))
+
+    for l in range(layer_count): number(l)
+    for sweep in range(sweeps):
+        if sweep % 2 == 0: order, neighbors = range(1, layer_count), up
+        else: order, neighbors = range(layer_count - 2, -1, -1), down
+        for l in order:
+            layers[l].sort(key=lambda v: mean([pos[u] for u in neighbors[v]], pos[v]))
+            number(l)
+
+    # 4. Coordinates
+    x = [0.0] * total
+    for nodes_in_layer in layers:
+        offset = 0.0
+        for v in nodes_in_layer:
+            x[v] = offset + width[v] / 2
+            offset += width[v] + NODE_SEP
+
+    def place(l: int, neighbors: list[list[list[int]]]):
+        nodes_in_layer = layers[l]
+        if not nodes_in_layer: return
+        ideal = [mean([x[u] for ns in neighbors for u in ns[v]], x[v]) for v in nodes_in_layer]
+        xs = ordered_nonoverlap(ideal, [width[v] for v in nodes_in_layer], NODE_SEP)
+        for v, nx in zip(nodes_in_layer, xs): x[v] = nx
+
+    for _ in range(passes):
+        for l in range(1, layer_count): place(l, [up])
+        for l in range(layer_count - 2, -1, -1): place(l, [down])
+    for l in range(layer_count): place(l, [up, down])
+
+    layer_height = [0.0] * layer_count
+    for v in range(total):
+        layer_height[layer[v]] = max(layer_height[layer[v]], height[v])
+    layer_top = []
+    offset = PADDING
+    for h in layer_height:
+        layer_top.append(offset)
+        offset += h + RANK_SEP
+    graph_height = offset - RANK_SEP + PADDING
+
+    left = min((x[v] - width[v] / 2 for v in range(total)), default=0)
+    for v in range(total): x[v] += PADDING - left
+    right = max((x[v] + width[v] / 2 for v in range(total)), default=0)
+    if loops: right = max(right, max(x[index[edges[e][0]]] + width[index[edges[e][0]]] / 2 + LOOP_WIDTH for e in loops))
+    graph_width = right + PADDING
+
+    # Layout is computed top down, graphviz coordinates are bottom up
+    def center_y(v: int) -> float:
+        return graph_height - (layer_top[layer[v]] + layer_height[layer[v]] / 2)
+
+    def top(v: int) -> float: return center_y(v) + height[v] / 2
+    def bottom(v: int) -> float: return center_y(v) - height[v] / 2
+
+    # 5. Edges, ports are spread over the bottom and top of a node in the order of the other end
+    out_port: dict[tuple[int, int], float] = {}
+    in_port: dict[tuple[int, int], float] = {}
+    outgoing: list[list[tuple[int, int]]] = [[] for _ in range(n)]
+    incoming: list[list[tuple[int, int]]] = [[] for _ in range(n)]
+    for i, (e, chain) in enumerate(chains):
+        outgoing[chain[0]].append((i, chain[1]))
+        incoming[chain[-1]].append((i, chain[-2]))
+    for v in range(n):
+        for ports, lst in ((out_port, outgoing[v]), (in_port, incoming[v])):
+            lst.sort(key=lambda p: x[p[1]])
+            for k, (i, _) in enumerate(lst):
+                ports[(i, v)] = x[v] - width[v] / 2 + width[v] * (k + 1) / (len(lst) + 1)
+
+    res_edges = []
+    for i, (e, chain) in enumerate(chains):
+        a, b = chain[0], chain[-1]
+        points: list[Point] = [(out_port[(i, a)], bottom(a))]
+        for d in chain[1:-1]:
+            l = layer[d]
+            # Straight runs of dummy nodes only need their end points
+            if len(points) > 1 and points[-1][0] == points[-2][0] == x[d]: points.pop()
+            else: points.append((x[d], graph_height - layer_top[l]))
+            points.append((x[d], graph_height - layer_top[l] - layer_height[l]))
+        points.append((in_port[(i, b)], top(b)))
+
+        if reverse[e]: points.reverse()
+        tip = points[-1]
+        direction = 1 if reverse[e] else -1
+        points[-1] = (tip[0], tip[1] - direction * ARROW_LENGTH)
+        res_edges.append({
+            "tail": index[edges[e][0]], "head": index[edges[e][1]],
+            "pos": format_points(tip, spline(points)), "color": edges[e][2]})
+
+    for e in loops:
+        v = index[edges[e][0]]
+        r, cy, q = x[v] + width[v] / 2, center_y(v), height[v] / 4
+        tip = (r, cy - q)
+        points = [(r, cy + q), (r + LOOP_WIDTH, cy + q), (r + LOOP_WIDTH, cy - q), (r + ARROW_LENGTH, cy - q)]
+        res_edges.append({"tail": v, "head": v, "pos": format_points(tip, points), "color": edges[e][2]})
+
+    objects = []
+    for v in range(n):
+        objects.append({
+            "name": str(nodes[v]),
+            "pos": f"{x[v]:.2f},{center_y(v):.2f}",
+            "width": str(sizes[nodes[v]][0]),
+            "height": str(sizes[nodes[v]][1])})
+
+    return {"bb": f"0,0,{graph_width:.2f},{graph_height:.2f}", "objects": objects, "edges": res_edges}
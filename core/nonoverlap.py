@@ -0,0 +1,54 @@
+# Vertical placement of call graph blocks without overlaps.
+#
+# Blocks are sorted top to bottom (largest y first) and every block has to end above the next one:
+#   y[i] <= y[i-1] - heights[i-1]
+# Minimizing the squared distance to the ideal positions under these constraints is an isotonic
+# regression: with z[i] = y[i] + sum(heights[:i]) the constraints become z[i] <= z[i-1], which
+# pool adjacent violators solves exactly in linear time.
+
+def isotonic_decreasing(values: list[float]) -> list[float]:
+    # Pools as [sum, count], merged while the mean of a pool is lower than the one following it
+    pools: list[list[float]] = []
+    for v in values:
+        total, count = v, 1
+        while pools and pools[-1][0] * count < total * pools[-1][1]:
+            t, c = pools.pop()
+            total += t
+            count += c
+        pools.append([total, count])
+
+    res: list[float] = []
+    for total, count in pools:
+        res.extend([total / count] * int(count))
+    return res
+
+def vertical_nonoverlap(ideal_y: list[float], heights: list[float]) -> list[float]:
+    n = len(ideal_y)
+    if n == 0: return []
+
+    order = sorted(range(n), key=lambda i: -ideal_y[i])
+
+    targets = []
+    offset = 0.0
+    for i in order:
+        targets.append(ideal_y[i] + offset)
+        offset += heights[i]
+
+    res = [0.0] * n
+    offset = 0.0
+    for i, z in zip(order, isotonic_decreasing(targets)):
+        res[i] = z - offset
+        offset += heights[i]
+    return res
+
+def ordered_nonoverlap(ideal_x: list[float], widths: list[float], sep: float = 0) -> list[float]:
+    # Same problem horizontally for centers that have to stay in the given order,
+    # x[i] >= x[i-1] + (widths[i-1] + widths[i]) / 2 + sep
+    offsets = []
+    offset = 0.0
+    for i in range(len(ideal_x)):
+        if i > 0: offset += (widths[i - 1] + widths[i]) / 2 + sep
+        offsets.append(offset)
+
+    z = isotonic_decreasing([offset - x for x, offset in zip(ideal_x, offsets)])
+    return [offset - v for v, offset in zip(z, offsets)]
@@ -3,22 +3,28 @@ import dataclasses
 from hashlib import md5
 import os, json
 from threading import Thread
-from typing import Callable, cast, overload
-from pytreemap import TreeMap
+from typing import Any, Callable, Iterable, cast, overload
 from abc import ABC
 from functools import reduce
-from itertools import takewhile
-from graphviz import Digraph
+from itertools import takewhile, islice
+from bisect import bisect_left, bisect_right
 from pathlib import Path
 
-from tcls_900 import tlcs_900 as proc
+from tcls_900 import tlcs_900 as proc, microc
+from tcls_900 import tlcs_900_timing as timing
 from disapi import InputBuffer, OutputBuffer, InsnPool, Insn, InsnEntry, Label, LabelKind, Loc, insnentry_to_str
 from tcls_900.tlcs_900 import Reg, Mem, MemReg, CReg, RReg, LWORD, WORD, BYTE # TODO Specific import
-from .popup import InvalidInsnPopup
+from .signatures import BytePattern, SignatureSet
+from .layered_layout import layered_layout
+from .timing import Timing, estimate_wcet
+from .startup import profile
+from .sorted_map import SortedMap
+from .summary import FunctionSummary
 
 DATA_PER_ROW = 7
 MAX_SECTION_LENGTH = DATA_PER_ROW * 40
 FUN_SECTION_LENGTH = 0x8000
+DEFAULT_MICROCONTROLLER = "TMP91C016"
 
 class VirtualByteArray:
     def __init__(self, size, value=0):
@@ -62,6 +68,8 @@ class Section(ABC):
         self.labels = labels
         self.data = data
         self.instructions = instructions
+        # Sorted pcs of the instructions, for range lookups
+        self.pcs = [insn.entry.pc for insn in instructions]
 
     def __str__(self):
         return f"{self.__class__.__name__}: {list(map(str, self.labels))} {self.offset:X} -> {self.offset + self.length:X}"
@@ -103,6 +111,7 @@ class CodeBlock:
 
         self.pred = pred or []
         self.succ = succ or []
+        self._cycles: int | None = None
 
     @property
     def insn(self):
@@ -111,6 +120,18 @@ class CodeBlock:
         self._insn = self.proj.insn(self.ep, self.len)
         return self._insn
 
+    @property
+    def cycles(self) -> int:
+        # Worst case states of the block, repeating instructions use their loop bound
+        if self._cycles is None:
+            total = 0
+            for insn in self.insn:
+                n, repeat = timing.states(insn.entry.bytes(self.proj.ib))
+                if repeat: n *= self.proj.loop_bounds.get(insn.entry.pc, 1)
+                total += n
+            self._cycles = total
+        return self._cycles
+
     def serialize(self) -> dict:
         res = {}
         res["ep"] = self.ep
@@ -425,8 +446,6 @@ class FunctionState:
 
 class Underflow(Exception): pass
 
-from ui.main import app 
-
 class Function:
     def __init__(self, ep: int, start: CodeBlock, blocks: dict[int, CodeBlock]):
         self.ep = ep
@@ -437,6 +456,12 @@ class Function:
         self.callers: list[tuple[int, int]]
         self.callees: list[tuple[int, int]]
         self.text: dict[int, str] | None = None
+        self.sizes: tuple[dict[int, str], dict[int, tuple[float, float]]] | None = None
+        self.timing: "Timing | None" = None
+        self._sections: list[CodeSection] | None = None
+        self.summary: "FunctionSummary | None" = None
+        # Layouts of the views showing this function, shared between all of their tabs
+        self.layouts: dict[str, Any] = {}
 
     def __gt__(self, other: "Function") -> bool:
         return self.ep > other.ep
@@ -446,15 +471,32 @@ class Function:
     
     @property
     def frequency(self) -> int:
-        return len(set(map(lambda c: c[0], self.callers)))
+        return self.proj.get_calls().frequency(self.ep)
+
+    @property
+    def proj(self) -> "Project":
+        return self.start.proj
+
+    def get_summary(self) -> "FunctionSummary":
+        if self.summary is None or self.summary.state is not self.state:
+            self.proj.load_blocks(self.blocks.values())
+            self.summary = FunctionSummary(self)
+        return self.summary
+
+    # Sections of the blocks sorted by offset
+    def get_sections(self) -> list[CodeSection]:
+        if self._sections is None:
+            self.proj.load_blocks(self.blocks.values())
+            self._sections = sorted((block.to_section() for block in self.blocks.values()), key=lambda s: s.offset)
+        return self._sections
 
     @property
     def name(self) -> str:
-        return str(app().project.ob.label(self.ep))
+        return str(self.proj.ob.label(self.ep))
     
     @name.setter
     def name(self, name: str):
-        app().project.rename_label(self.ep, name)
+        self.proj.rename_label(self.ep, name)
 
     def serialize(self) -> dict:
         res = {}
@@ -495,40 +537,63 @@ class Function:
 
         return fun
     
-    def _graph(self, block: CodeBlock, visited: set[CodeBlock], dig: Digraph, ob: OutputBuffer):
-        if block in visited: return
-        visited.add(block)
-        #text = "".join(map(lambda insn: insnentry_to_str(insn.entry, ob) + "\\l", block.insn))
-        #dig.node(str(block.ep), text)
+    def block_sizes(self, text: dict[int, str]) -> dict[int, tuple[float, float]]:
+        # Node sizes in inches, text is the disassembly as returned by Project.get_text.
+        # They only change when the text does, which replaces the dict.
+        if self.sizes is not None and self.sizes[0] is text:
+            return self.sizes[1]
+
         FONT_HEIGHT = 14
         LINE_HEIGHT = 1.05
         SCALE = 96 / (72**2)
-        width = max(map(lambda insn: (len(insnentry_to_str(insn.entry, ob)) * FONT_HEIGHT * 17 / 37 + 8) * SCALE, block.insn))
-        dig.node(str(block.ep), "", width=str(width), height=str((len(block.insn) * FONT_HEIGHT * LINE_HEIGHT + 8) * SCALE), fixedsize="true")
-        for succ, branch in block.succ:
-            dig.edge(str(block.ep), str(succ), color="red" if branch else "black")
-            self._graph(self.blocks[succ], visited, dig, ob)
-
-    def graph(self, ob: OutputBuffer) -> Digraph:
-        visited: set[CodeBlock] = set()
-        dig = Digraph(self.name)
-        dig.attr("node", shape="box", fontname="Roboto Mono")
-        self._graph(self.start, visited, dig, ob)
-        return dig
-    
-    def graph_svg(self, out_folder: str, ob: OutputBuffer) -> str:
-        dig = self.graph(ob)
-        return dig.render(directory=out_folder, format="svg")
-
-    def graph_json(self, out_folder: str, ob: OutputBuffer) -> str:
-        dig = self.graph(ob)
-        return dig.render(directory=out_folder, format="json0")
+        sizes = {}
+        for ep, block in self.blocks.items():
+            width = max(map(lambda insn: (len(text[insn.entry.pc]) * FONT_HEIGHT * 17 / 37 + 8) * SCALE, block.insn))
+            height = (len(block.insn) * FONT_HEIGHT * LINE_HEIGHT + 8) * SCALE
+            sizes[ep] = (width, height)
+        self.sizes = (text, sizes)
+        return sizes
+
+    def graph_layout(self, sizes: dict[int, tuple[float, float]]) -> dict:
+        # Blocks reachable from the entry point in depth first order
+        nodes: list[int] = []
+        edges: list[tuple[int, int, str]] = []
+        visited: set[int] = set()
+        stack = [self.start.ep]
+        while stack:
+            ep = stack.pop()
+            if ep in visited: continue
+            visited.add(ep)
+            nodes.append(ep)
+            for succ, branch in self.blocks[ep].succ:
+                edges.append((ep, succ, "red" if branch else "black"))
+            stack.extend(succ for succ, _ in reversed(self.blocks[ep].succ))
+
+        return layered_layout(nodes, sizes, edges)
+
+    # The estimates of all functions that call this one include it
+    def invalidate_timing(self, proj: "Project"):
+        assert proj.functions is not None
+        seen = {self.ep}
+        work = [self]
+        while work:
+            fun = work.pop()
+            fun.timing = None
+            for _, ep in getattr(fun, "callers", []):
+                caller = proj.functions.get(ep)
+                if caller is not None and ep not in seen:
+                    seen.add(ep)
+                    work.append(caller)
 
     def analyze(self, proj: "Project", tick: Callable[[str], None] | None = None):
         assert proj.functions is not None
         if self.state: return
         self.state = FunctionState(proj)
         self.underflow = False
+        self.invalidate_timing(proj)
+        self._sections = None
+        self.summary = None
+        self.layouts.clear()
         self.callers = []
         self.callees = []
 
@@ -583,14 +648,17 @@ class Function:
                                 state.unclobber(last)
                         else: raise Underflow()
                     elif insn.entry.opcode in ("CALL", "CALR"):
-                        fun = None
+                        targets: list[int] = []
                         if len(insn.entry.instructions) == 1:
-                            fun = proj.functions.get(int(insn.entry.instructions[0]))
+                            targets = [int(insn.entry.instructions[0])]
                         else:
                             loc = insn.entry.instructions[1]
-                            if isinstance(loc, Loc): fun = proj.functions.get(int(loc))
+                            if isinstance(loc, Loc): targets = [int(loc)]
+                            else: targets = proj.jump_tables.get(insn.entry.pc, [])
 
-                        if fun:
+                        for target in targets:
+                            fun = proj.functions.get(target)
+                            if not fun: continue
                             if not fun.state: fun.analyze(proj, tick)
                             fun.callers.append((insn.entry.pc, self.ep))
                             self.callees.append((insn.entry.pc, fun.ep))
@@ -615,6 +683,9 @@ class Function:
             self.state = reduce(FunctionState.merge, res, FunctionState(proj))
         except Underflow:
             self.underflow = True
+
+        # The edges of this function changed
+        if proj.calls is not None and not proj.calls.update(self): proj.calls = None
         
         if tick: tick(self.name)
 
@@ -630,14 +701,20 @@ class MemoryRegion:
 
 class ProjectLoadException(Exception): pass
 
+# Gets notified about changes to the project, the GUI uses it to refresh its views
+class ProjectListener:
+    def label_renamed(self, ep: int): pass
+    def sections_changed(self): pass
+
 class Project:
-    def __init__(self, project_folder: Path, path: Path, org: int, ep: int | list[int]):
+    def __init__(self, project_folder: Path, path: Path, org: int, ep: int | list[int], microcontroller: str = DEFAULT_MICROCONTROLLER):
         self.project_folder = project_folder
         self.path = path
         self.filename = os.path.basename(path)
-        self.sections = TreeMap()
+        self.sections: SortedMap[Section] = SortedMap()
         self.org = org
         self.ep = ep
+        self.microcontroller = microc.load_microcontroller(microcontroller)
         self.ib: InputBuffer
         self.ob: OutputBuffer
         self.pool: InsnPool
@@ -645,10 +722,69 @@ class Project:
         self.addresses: list[MemoryRegion] = []
         self.functions = cast(dict[int, Function], None)
         self.text: dict[int, str] | None = None
+        self.index: "InsnIndex | None" = None
+        self.calls: "CallIndex | None" = None
+        self.annotations: dict[int, str] | None = None
+        # Iteration counts of loops by the address of their header, or of a repeating instruction
+        self.loop_bounds: dict[int, int] = {}
+        # Targets of register indirect JP and CALL instructions by their address
+        self.jump_tables: dict[int, list[int]] = {}
+        self.listeners: list[ProjectListener] = []
 
     def invalidate(self):
         self.text = None
 
+    # Called whenever the sections change, the sections and layouts of the functions are built from them
+    def invalidate_index(self):
+        self.index = None
+        self.annotations = None
+        for fun in (self.functions or {}).values():
+            fun._sections = None
+            fun.layouts.clear()
+
+    def get_index(self) -> "InsnIndex":
+        if self.index is None:
+            self.index = InsnIndex(self.sections.values())
+        return self.index
+
+    def get_calls(self) -> "CallIndex":
+        calls = self.calls
+        if calls is None:
+            assert self.functions is not None
+            calls = self.calls = CallIndex(list(self.functions.values()))
+        return calls
+
+    def get_annotations(self) -> dict[int, str]:
+        # Computed for the whole project at once, rendering only does a lookup
+        if self.annotations is None:
+            self.annotations = sfr_annotations(self.get_index(), self.microcontroller)
+        return self.annotations
+
+    def set_loop_bound(self, pc: int, bound: int | None):
+        if bound is None: self.loop_bounds.pop(pc, None)
+        else: self.loop_bounds[pc] = bound
+        # Every function could contain or call the loop
+        for fun in (self.functions or {}).values():
+            fun.timing = None
+            for block in fun.blocks.values():
+                block._cycles = None
+
+    def wcet(self, fun: Function) -> "Timing":
+        return estimate_wcet(fun, self)
+
+    def query(self, predicate: "Predicate | str", fun: Function | None = None) -> list[int]:
+        if isinstance(predicate, str):
+            predicate = parse_query(predicate, self)
+        res = evaluate(self.get_index(), predicate)
+        if fun is not None:
+            blocks = sorted((b.ep, b.ep + b.len) for b in fun.blocks.values())
+            starts = [s for s, _ in blocks]
+            def in_function(pc: int) -> bool:
+                i = bisect_right(starts, pc) - 1
+                return i >= 0 and pc < blocks[i][1]
+            res = list(filter(in_function, res))
+        return res
+
     def _load_text(self):
         self.text = {}
         section: Section
@@ -665,28 +801,32 @@ class Project:
                 res.append((pc, line))
         return res
     
-    def search_in_data(self, search: bytearray, fun: Function | None = None) -> list[int]:
+    def search_ranges(self, fun: Function | None = None, kind: type[Section] | None = None) -> list[tuple[int, int]]:
+        # Buffer index ranges to search, adjacent ranges are merged so that matches can cross block boundaries
         if fun is not None:
-            res = []
-            for block in fun.blocks.values():
-                section = block.to_section()
-                data = section.data
-                if isinstance(data, VirtualByteArray): continue
-
-                index = 0
-                while (index := data.find(search, index)) != -1:
-                    res.append(index + section.offset)
-                    index += len(search)
-            
-            return res
-        else: 
-            res = []
-            index = 0
-            while (index := self.ib.buffer.find(search, index)) != -1:
-                res.append(index + self.org)
-                index += len(search)
-            
-            return res
+            ranges = sorted((b.ep - self.org, b.ep + b.len - self.org) for b in fun.blocks.values())
+        elif kind is not None:
+            ranges = [(s.offset - self.org, s.offset + s.length - self.org) for s in self.sections.values() if isinstance(s, kind)]
+        else:
+            return [(0, len(self.ib.buffer))]
+
+        res: list[tuple[int, int]] = []
+        for start, end in ranges:
+            start, end = max(start, 0), min(end, len(self.ib.buffer))
+            if start >= end: continue
+            if res and res[-1][1] >= start:
+                res[-1] = (res[-1][0], max(res[-1][1], end))
+            else: res.append((start, end))
+        return res
+
+    def search_signatures(self, signatures: SignatureSet, fun: Function | None = None, kind: type[Section] | None = None) -> list[tuple[int, BytePattern]]:
+        res = signatures.search(self.ib.buffer, self.search_ranges(fun, kind))
+        return [(offset + self.org, pattern) for offset, pattern in res]
+
+    def search_in_data(self, search: bytearray | BytePattern, fun: Function | None = None) -> list[int]:
+        if not isinstance(search, BytePattern):
+            search = BytePattern.literal(search)
+        return [pc for pc, _ in self.search_signatures(SignatureSet([search]), fun)]
 
     def get_text(self, fun: Function | None = None) -> dict[int, str]:
         if self.text is None:
@@ -713,8 +853,8 @@ class Project:
         if label:
             if label.name == name: return # No change
             label.name = name
-            app().main_dock.refresh(ep = ep)
             self.invalidate()
+            for listener in self.listeners: listener.label_renamed(ep)
 
     def get_project_id(self) -> str:
         return md5(str(self.path).encode()).hexdigest()
@@ -732,6 +872,9 @@ class Project:
                 label["callers"] = list(l.callers)
             if l.kind == LabelKind.DATA:
                 label["type"] = l.type
+                if l.elements != 1: label["elements"] = l.elements
+                if l.stride is not None: label["stride"] = l.stride
+                if l.string: label["string"] = True
 
             labels[ep] = label
 
@@ -742,7 +885,10 @@ class Project:
             "rom": self.path.relative_to(project_folder).as_posix(),
             "ep": self.ep,
             "org": self.org,
-            "address_map": [dataclasses.asdict(addr) for addr in self.addresses]
+            "microcontroller": self.microcontroller.name,
+            "address_map": [dataclasses.asdict(addr) for addr in self.addresses],
+            "loop_bounds": {str(pc): bound for pc, bound in self.loop_bounds.items()},
+            "jump_tables": {str(pc): targets for pc, targets in self.jump_tables.items()}
         }
         with open(project_folder / "proj.json", "w") as fp:
             json.dump(proj, fp, indent=2, sort_keys=True)
@@ -760,7 +906,10 @@ class Project:
                     json.dump(fun.serialize(), fp, indent=2, sort_keys=True)
 
     @staticmethod
-    def read_from_file(project_folder: Path) -> "Project":
+    # progress is called with a description of the current step and the fraction done,
+    # the GUI loads projects on a background thread.
+    def read_from_file(project_folder: Path, progress: Callable[[str, float], None] | None = None) -> "Project":
+        if not progress: progress = lambda text, value: None
         if not project_folder.is_dir(): 
             raise ProjectLoadException("Not a directory")
         if not project_folder.name.endswith(".disproj"): 
@@ -776,15 +925,22 @@ class Project:
         path = project_folder / proj_json["rom"]
         file_len = os.path.getsize(path)
 
-        project = Project(project_folder, path, proj_json["org"], proj_json["ep"])
+        project = Project(project_folder, path, proj_json["org"], proj_json["ep"],
+            proj_json.get("microcontroller", DEFAULT_MICROCONTROLLER))
         project.file_len = file_len
 
         if "address_map" in proj_json:
             for addr in proj_json["address_map"]:
                 project.addresses.append(MemoryRegion(**addr))
 
+        for pc, bound in proj_json.get("loop_bounds", {}).items():
+            project.loop_bounds[int(pc)] = bound
+        for pc, targets in proj_json.get("jump_tables", {}).items():
+            project.jump_tables[int(pc)] = targets
+
         with open(path, "rb") as fp:
-            project.ib = InputBuffer(fp, file_len, entry_point=project.org, exit_on_invalid=True)
+            project.ib = InputBuffer(fp, file_len, entry_point=project.org, exit_on_invalid=True,
+                microcontroller=project.microcontroller)
             project.ob = OutputBuffer(None)
 
         project.pool = InsnPool(proc)
@@ -806,26 +962,38 @@ class Project:
             l = Label(ep, count, name, kind)
             l.callers = set(label.get("callers", []))
             l.type = label.get("type", None)
+            l.elements = label.get("elements", 1)
+            l.stride = label.get("stride", None)
+            l.string = label.get("string", False)
             project.ob.labels[ep] = l
 
         project_eps = project.ep if isinstance(project.ep, list) else [project.ep]
         
-        for ep in label_eps + project_eps:
-            project.pool.query(Insn(project.pool, project.ib, project.ob, ep, do_branch=False))
-        project.pool.poll_all(threaded=False)
-        project._load_sections()
+        progress("Decoding " + path.name, 0.1)
+        with profile.phase("decode"):
+            for ep in label_eps + project_eps:
+                project.pool.query(Insn(project.pool, project.ib, project.ob, ep, do_branch=False))
+            project.pool.poll_all(threaded=False)
+
+        progress("Building sections", 0.6)
+        with profile.phase("sections"):
+            project._load_sections()
 
         # Load functions
+        # The folder is always written, it stays empty until the functions are analyzed
         fun_folder = project_folder / "fun"
-        if fun_folder.exists() and fun_folder.is_dir():
+        if fun_folder.is_dir() and any(fun_folder.iterdir()):
+            progress("Loading functions", 0.8)
             project.functions = {}
+            project.calls = None
 
-            for fun_file in fun_folder.rglob("*"):
-                if fun_file.is_dir(): continue
-                with open(fun_file, "r") as fp:
-                    fun_data = json.load(fp)
-                fun = Function.deserialize(fun_data, project)
-                project.functions[fun.ep] = fun
+            with profile.phase("functions"):
+                for fun_file in fun_folder.rglob("*"):
+                    if fun_file.is_dir(): continue
+                    with open(fun_file, "r") as fp:
+                        fun_data = json.load(fp)
+                    fun = Function.deserialize(fun_data, project)
+                    project.functions[fun.ep] = fun
 
 
         return project
@@ -834,9 +1002,14 @@ class Project:
     def is_function(self, ep: int) -> bool:
         return ep in self.ob.calls
 
-    def disassemble(self, ep: int, callback):
+    # on_error is called with the address of an invalid instruction and two functions
+    # to either keep the result or to discard it. Without it the result is discarded.
+    # Multiple entry points are disassembled in a single run of the pool.
+    def disassemble(self, ep: int | list[int], callback: Callable[[], None],
+                    on_error: Callable[[int, Callable[[], None], Callable[[], None]], None] | None = None):
         self.invalidate()
-        clear_cache()
+        self.invalidate_index()
+        for listener in self.listeners: listener.sections_changed()
         # TODO make this part of the API instead of messing with the internals manually
         old_map = self.ob.insnmap
         old_locations = self.pool.locations.copy()
@@ -844,30 +1017,106 @@ class Project:
 
         new_map = {}
         self.ob.insnmap = new_map # Reset instruction map to get a diff later
-        self.pool.query(Insn(self.pool, self.ib, self.ob, ep))
+        for entry in ([ep] if isinstance(ep, int) else ep):
+            self.pool.query(Insn(self.pool, self.ib, self.ob, entry))
         error = self.pool.poll_all()
 
-        def cont(popup):
+        def cont():
             self._update_data(new_map)
+            # Anything built while on_error was deciding saw the old sections
+            self.invalidate_index()
 
             old_map.update(new_map)
             self.ob.insnmap = old_map
             callback()
-            if popup: 
-                popup.dismiss()
 
-        def close(popup):
+        def close():
             self.ob.insnmap = old_map
             self.ib.access = old_access
             self.pool.locations = old_locations
-            popup.dismiss()
 
         if error > 0:
-            popup = InvalidInsnPopup(instruction=error)
-            popup.bind(on_close=close)
-            popup.bind(on_continue=cont)
-            popup.open()
-        else: cont(None)
+            if on_error: on_error(error, cont, close)
+            else: close()
+        else: cont()
+
+    # Disassembles the targets of all jump and call tables found by core.jump_tables, and
+    # repeats that for the tables in the new code. Every round is one run of the pool and
+    # one update of the sections.
+    def resolve_jump_tables(self, callback: Callable[[int], None],
+                            on_error: Callable[[int, Callable[[], None], Callable[[], None]], None] | None = None,
+                            found: int = 0):
+        roots = set(self.ob.calls)
+        roots.update([self.ep] if isinstance(self.ep, int) else self.ep)
+        tables: dict[int, JumpTable] = {}
+        for ep in sorted(roots):
+            if ep not in self.sections: continue
+            fun = self.extract_function(ep)
+            if fun is None: continue
+            blocks = list(fun.blocks.values())
+            self.load_blocks(blocks)
+            for table in find_jump_tables(self, blocks):
+                if table.pc not in self.jump_tables: tables[table.pc] = table
+
+        if not tables:
+            callback(found)
+            return
+
+        # The branches have to be there before the pool runs so that the targets get labels,
+        # they are taken out again if the new code is discarded
+        eps: list[int] = []
+        new_calls: set[int] = set()
+        start = len(self.ob.branchlist)
+        for table in tables.values():
+            if table.call: new_calls.update(t for t in table.targets if t not in self.ob.calls)
+            for target in table.targets:
+                self.ob.branch(table.end, target, True, table.call)
+            eps.extend(table.targets)
+            # The decoder stops at an indirect CALL T because it can't know where it goes
+            if table.call: eps.append(table.end)
+        branches = list(islice(self.ob.branchlist, start, None))
+
+        def cont():
+            for table in tables.values():
+                self.jump_tables[table.pc] = table.targets
+            self.resolve_jump_tables(callback, on_error, found + len(tables))
+
+        def close(close_pool: Callable[[], None]):
+            close_pool()
+            for branch in branches: self.ob.branchlist.remove(branch)
+            self.ob.calls.difference_update(new_calls)
+            callback(found)
+
+        def error(pc: int, keep: Callable[[], None], close_pool: Callable[[], None]):
+            if on_error: on_error(pc, keep, lambda: close(close_pool))
+            else: close(close_pool)
+
+        self.disassemble(sorted(set(eps)), cont, error)
+
+    # Types the pointer arrays, structure arrays and strings found by core.data_pointers.
+    # All labels are added first and the sections are rebuilt once.
+    def recover_data_pointers(self) -> int:
+        count = 0
+        for data_type in find_data_types(self):
+            label = self.ob.label(data_type.address)
+            if label is None:
+                name = f"str_{data_type.address:X}" if data_type.string else None
+                label = Label(data_type.address, name=name, kind=LabelKind.DATA)
+                self.ob.labels[data_type.address] = label
+            elif label.kind != LabelKind.DATA or label.elements != 1 or label.string:
+                continue # Already typed
+            label.type = data_type.type
+            label.elements = data_type.elements
+            label.stride = data_type.stride if data_type.stride != data_type.type_size() else None
+            label.string = data_type.string
+            count += 1
+
+        if count > 0:
+            for listener in self.listeners: listener.sections_changed()
+            self.invalidate()
+            self.invalidate_index()
+            self._load_sections()
+        return count
 
     def _update_data(self, new_map: dict):
         self.ob.compute_labels(self.ib.entry_point, self.file_len + self.ib.entry_point)
@@ -878,9 +1127,15 @@ class Project:
             self.extract_sections(v, sections)
 
         sections: list[Section] = reduce(list.__add__, map(self.split_section, sections), [])
-        in_sections = list(self.sections.values())
         
         if len(sections) > 0:
+            # Only the sections from the one containing the new code up to its end are affected
+            start = sections[0].offset
+            end = max(s.offset + s.length for s in sections)
+            lo = max(self.sections.floor_index(start), 0)
+            first = min(self.sections.keys()[lo], start) if self.sections else start
+            in_sections = self.sections.range(first, end)
+
             i, j = 0, 0
             total = len(in_sections)
             while i < total:
@@ -944,10 +1199,7 @@ class Project:
                     # TODO We might want to merge sections together if the result is smaller than MAX_SECTION_LENGTH
                 i += 1
 
-            # TODO Don't recreate the map from scratch, this only makes things slower and not faster
-            self.sections.clear()
-            for section in in_sections:
-                self.sections[section.offset] = section
+            self.sections.splice(first, end, ((section.offset, section) for section in in_sections))
                 
 
     def extract_sections(self, v: list[InsnEntry], out_list: list[Section]) -> int:
@@ -1059,20 +1311,20 @@ class Project:
         output_db(self.file_len + org, last)
 
         sections = reduce(list.__add__, map(self.split_section, sections), [])
-
-        for section in sections:
-            self.sections[section.offset] = section
+        self.sections.build((section.offset, section) for section in sections)
 
     def rescan(self, ep: int | list[int], org: int):
         self.ep = ep
         self.org = org
         
-        clear_cache()
+        for listener in self.listeners: listener.sections_changed()
+        self.invalidate()
+        self.invalidate_index()
         self.sections.clear()
         self.file_len = os.path.getsize(self.path)
 
         with open(self.path, 'rb') as f:
-            ib = InputBuffer(f, self.file_len, entry_point=org, exit_on_invalid=True)
+            ib = InputBuffer(f, self.file_len, entry_point=org, exit_on_invalid=True, microcontroller=self.microcontroller)
             ob = OutputBuffer(None)
             self.ob = ob
             self.ib = ib
@@ -1095,6 +1347,7 @@ class Project:
     def analyze_functions(self, callback: Callable[[], None], progress: Callable[[int, str], None]) -> int:
         def analyze():
             self.functions = {}
+            self.calls = None
             # Find all functions
             for i, ep in enumerate(self.ob.calls):
                 fun = self.extract_function(ep)
@@ -1120,34 +1373,46 @@ class Project:
         return len(self.ob.calls)
     
     def insn(self, start: int, ln: int) -> list[Instruction]:
-        entry = self.sections.floor_entry(start)
-        res = []
-
-        assert entry is not None
-        section: Section = cast(Section, entry.get_value())
-        s = start - section.offset
-        end = min(section.length - s, ln)
-        res.extend([i for i in section.instructions if section.offset + s <= i.entry.pc < start + end])
-        read = end
-        if read < ln:
-            entry = self.sections.floor_entry(section.offset + section.length + 1)
-            if entry is None: return res
-            section = cast(Section, entry.get_value())
-
-            while section.offset + section.length < start + ln:
-                res.extend(section.instructions[:])
-                read += section.length
-                entry = self.sections.floor_entry(section.offset + section.length + 1)
-                if entry is None: return res
-                section = cast(Section, entry.get_value())
-            rest = ln - read
-            if rest > 0:
-                res.extend([i for i in section.instructions if i.entry.pc < start + ln])
+        res = self._insn_range(self.sections.floor_index(start), start, start + ln)
 
         last_offset = res[-1].entry.pc + res[-1].entry.length
         first_offset = res[0].entry.pc
         assert last_offset - first_offset == ln
         return res
+    
+    # Instructions with start <= pc < end, beginning at the section with index k
+    def _insn_range(self, k: int, start: int, end: int) -> list[Instruction]:
+        assert k >= 0
+        sections = self.sections.values()
+        section = sections[k]
+        i = bisect_left(section.pcs, start)
+        res = []
+        while True:
+            j = bisect_left(section.pcs, end, i)
+            res.extend(section.instructions[i:j])
+            if j < len(section.pcs): break
+            k += 1
+            if k == len(sections) or sections[k].offset >= end: break
+            section = sections[k]
+            i = 0
+        return res
+    
+    # Section and index of the instruction at pc
+    def locate(self, pc: int) -> tuple[Section, int] | None:
+        section = self.sections.floor(pc)
+        if section is None: return None
+        i = bisect_left(section.pcs, pc)
+        if i < len(section.pcs) and section.pcs[i] == pc:
+            return section, i
+        return None
+    
+    # Fills in the instructions of all blocks in a single pass over the sections
+    def load_blocks(self, blocks: Iterable[CodeBlock]):
+        sections = self.sections.values()
+        k = 0
+        for block in sorted((b for b in blocks if not b._insn), key=lambda b: b.ep):
+            while k + 1 < len(sections) and sections[k + 1].offset <= block.ep: k += 1
+            block._insn = self._insn_range(k, block.ep, block.ep + block.len)
 
     def extract_function(self, ep: int):
         section = self.sections.get(ep)
@@ -1156,9 +1421,8 @@ class Project:
         blocks: dict[int, CodeBlock] = {}    
         def next_block(ep: int, pred: CodeBlock | None = None, branch = False) -> CodeBlock | None:
             insn: list[Instruction] = []
-            entry = self.sections.get_floor_entry(ep)
-            if not entry: return None
-            next_section: Section = entry.get_value()
+            next_section = self.sections.floor(ep)
+            if not next_section: return None
             instructions = list(filter(lambda i: i.entry.pc >= ep, next_section.instructions))
             if len(instructions) == 0: return None
             ep2 = instructions[0].entry.pc
@@ -1183,9 +1447,8 @@ class Project:
                             pred.succ.append((block.ep, branch))
 
                         return block
-                    next_entry = self.sections.get_higher_entry(last_insn.entry.pc)
-                    if next_entry is None: return None
-                    next_section = next_entry.get_value()
+                    next_section = self.sections.higher(last_insn.entry.pc)
+                    if next_section is None: return None
                     if len(next_section.labels) > 0:
                         pc = insn[0].entry.pc
                         block = CodeBlock(self, insn)
@@ -1211,14 +1474,15 @@ class Project:
 
                     cond = is_unconditional_jump(last_insn)
                     loc = get_jump_location(last_insn)
-                    if loc and cond != -1:
-                        ep = int(loc)
-                        if ep in blocks:
-                            target = blocks[ep]
-                            target.pred.append(block.ep)
-                            block.succ.append((target.ep, True))
-                        else:
-                            next_block(ep, block, True)
+                    targets = [int(loc)] if loc else self.jump_tables.get(last_insn.entry.pc, [])
+                    if cond != -1:
+                        for ep in targets:
+                            if ep in blocks:
+                                target = blocks[ep]
+                                target.pred.append(block.ep)
+                                block.succ.append((target.ep, True))
+                            else:
+                                next_block(ep, block, True)
 
                     if cond != 1:
                         next_block(last_insn.entry.pc + last_insn.entry.length, block)
@@ -1237,4 +1501,7 @@ def new_project(path: Path, ep: int | list[int], org: int) -> Project:
     proj.rescan(ep, org)
     return proj
 
-from .arrow import clear_cache
\ No newline at end of file
+from .call_graph import CallIndex
+from .jump_tables import JumpTable, find_jump_tables
+from .data_pointers import find_data_types
+from .query import InsnIndex, Predicate, evaluate, parse_query, sfr_annotations
\ No newline at end of file
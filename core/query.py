@@ -0,0 +1,332 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from typing import Iterable, TYPE_CHECKING
+
+from disapi import Loc
+from tcls_900 import microc
+from tcls_900.tlcs_900 import Reg, Mem, MemReg, BYTE, WORD, LWORD, regname, reg_addr
+
+from .project import Section, CodeSection, Instruction, get_load, get_store, get_loc, overlaps
+
+if TYPE_CHECKING:
+    from .project import Project
+
+REG_BYTES = {BYTE: 1, WORD: 2, LWORD: 4}
+
+def reg_bytes(reg: Reg) -> range:
+    return range(reg.addr, reg.addr + REG_BYTES[reg.size])
+
+def operand_regs(value) -> list[Reg]:
+    # Like get_loc but only registers, including the ones used to address memory
+    try:
+        return [r for r in get_loc(value) if isinstance(r, Reg) and r.addr >= 0]
+    except (KeyError, AssertionError):
+        return [] # Control registers without an address, INVALID etc.
+
+def _safe(fn, insn: Instruction) -> list[Reg | int]:
+    try:
+        return [r for r in fn(insn) if not isinstance(r, Reg) or r.addr >= 0]
+    except (KeyError, IndexError, AssertionError):
+        return []
+
+class AddressIndex:
+    # Sorted (address, pc) pairs, answers range queries with two bisects
+    def __init__(self, pairs: list[tuple[int, int]]):
+        pairs.sort()
+        self.addresses = [a for a, _ in pairs]
+        self.pcs = [pc for _, pc in pairs]
+
+    def range(self, start: int, end: int) -> list[int]:
+        i = bisect_left(self.addresses, start)
+        j = bisect_right(self.addresses, end)
+        return self.pcs[i:j]
+
+class RegisterIndex:
+    # Maps every register byte address to the pcs that touch it,
+    # a register query is the union over the bytes it covers.
+    def __init__(self):
+        self.table: dict[int, list[int]] = {}
+
+    def add(self, reg: Reg, pc: int):
+        for b in reg_bytes(reg):
+            self.table.setdefault(b, []).append(pc)
+
+    def lookup(self, reg: Reg) -> set[int]:
+        res: set[int] = set()
+        for b in reg_bytes(reg):
+            res.update(self.table.get(b, ()))
+        return res
+
+class InsnIndex:
+    def __init__(self, sections: Iterable[Section]):
+        self.insn: dict[int, Instruction] = {}
+        self.pcs: list[int] = []
+
+        self.loads: dict[int, list[Reg | int]] = {}
+        self.stores: dict[int, list[Reg | int]] = {}
+        self.regs: dict[int, list[Reg]] = {}
+        self.mems: dict[int, list[int]] = {}
+
+        self.opcodes: dict[str, list[int]] = {}
+        self.reg_ref = RegisterIndex()
+        self.reg_load = RegisterIndex()
+        self.reg_store = RegisterIndex()
+
+        mem_ref: list[tuple[int, int]] = []
+        mem_load: list[tuple[int, int]] = []
+        mem_store: list[tuple[int, int]] = []
+        targets: list[tuple[int, int]] = []
+
+        for section in sections:
+            if not isinstance(section, CodeSection): continue
+            for insn in section.instructions:
+                entry = insn.entry
+                pc = entry.pc
+                self.insn[pc] = insn
+                self.pcs.append(pc)
+                self.opcodes.setdefault(entry.opcode, []).append(pc)
+
+                regs: list[Reg] = []
+                mems: list[int] = []
+                for op in entry.instructions:
+                    regs.extend(operand_regs(op))
+                    if isinstance(op, Mem) and not isinstance(op, MemReg):
+                        mems.append(op.address)
+                    elif isinstance(op, Loc):
+                        targets.append((op.loc, pc))
+                self.regs[pc] = regs
+                self.mems[pc] = mems
+                for r in regs: self.reg_ref.add(r, pc)
+                for m in mems: mem_ref.append((m, pc))
+
+                loads = _safe(get_load, insn)
+                stores = _safe(get_store, insn)
+                self.loads[pc] = loads
+                self.stores[pc] = stores
+                for v in loads:
+                    if isinstance(v, Reg): self.reg_load.add(v, pc)
+                    else: mem_load.append((v, pc))
+                for v in stores:
+                    if isinstance(v, Reg): self.reg_store.add(v, pc)
+                    else: mem_store.append((v, pc))
+
+        self.pcs.sort()
+        self.mem_ref = AddressIndex(mem_ref)
+        self.mem_load = AddressIndex(mem_load)
+        self.mem_store = AddressIndex(mem_store)
+        self.targets = AddressIndex(targets)
+
+class Predicate(ABC):
+    # Returns a set of pcs that is guaranteed to contain all matches,
+    # or None if the predicate can't be answered from an index
+    def candidates(self, index: InsnIndex) -> set[int] | None:
+        return None
+
+    @abstractmethod
+    def test(self, index: InsnIndex, pc: int) -> bool: pass
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return And([self, other])
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return Or([self, other])
+
+    def __invert__(self) -> "Predicate":
+        return Not(self)
+
+class And(Predicate):
+    def __init__(self, terms: list[Predicate]):
+        self.terms = terms
+
+    def candidates(self, index):
+        res: set[int] | None = None
+        for term in self.terms:
+            c = term.candidates(index)
+            if c is None: continue
+            res = c if res is None else res & c
+        return res
+
+    def test(self, index, pc):
+        return all(term.test(index, pc) for term in self.terms)
+
+class Or(Predicate):
+    def __init__(self, terms: list[Predicate]):
+        self.terms = terms
+
+    def candidates(self, index):
+        res: set[int] = set()
+        for term in self.terms:
+            c = term.candidates(index)
+            if c is None: return None
+            res |= c
+        return res
+
+    def test(self, index, pc):
+        return any(term.test(index, pc) for term in self.terms)
+
+class Not(Predicate):
+    def __init__(self, term: Predicate):
+        self.term = term
+
+    def test(self, index, pc):
+        return not self.term.test(index, pc)
+
+class Opcode(Predicate):
+    def __init__(self, *opcodes: str):
+        # LD also matches LDW, LDIR also matches LDIRW, etc.
+        self.opcodes: set[str] = set()
+        for opc in opcodes:
+            opc = opc.upper()
+            self.opcodes.add(opc)
+            self.opcodes.add(opc + "W")
+
+    def candidates(self, index):
+        res: set[int] = set()
+        for opc in self.opcodes:
+            res.update(index.opcodes.get(opc, ()))
+        return res
+
+    def test(self, index, pc):
+        return index.insn[pc].entry.opcode in self.opcodes
+
+# access is one of None (any operand), "load" or "store"
+class Register(Predicate):
+    def __init__(self, reg: Reg, access: str | None = None):
+        self.reg = reg.normalize()
+        self.access = access
+
+    def _values(self, index: InsnIndex, pc: int) -> list:
+        if self.access == "load": return index.loads[pc]
+        if self.access == "store": return index.stores[pc]
+        return index.regs[pc]
+
+    def candidates(self, index):
+        if self.access == "load": return index.reg_load.lookup(self.reg)
+        if self.access == "store": return index.reg_store.lookup(self.reg)
+        return index.reg_ref.lookup(self.reg)
+
+    def test(self, index, pc):
+        return any(overlaps(v, self.reg) for v in self._values(index, pc) if isinstance(v, Reg))
+
+class Memory(Predicate):
+    def __init__(self, start: int, end: int | None = None, access: str | None = None):
+        self.start = start
+        self.end = start if end is None else end
+        self.access = access
+
+    def candidates(self, index):
+        if self.access == "load": return set(index.mem_load.range(self.start, self.end))
+        if self.access == "store": return set(index.mem_store.range(self.start, self.end))
+        return set(index.mem_ref.range(self.start, self.end))
+
+    def test(self, index, pc):
+        if self.access == "load": values = index.loads[pc]
+        elif self.access == "store": values = index.stores[pc]
+        else: values = index.mems[pc]
+        return any(self.start <= v <= self.end for v in values if isinstance(v, int))
+
+class Target(Predicate):
+    # Branches and calls to a location
+    def __init__(self, start: int, end: int | None = None):
+        self.start = start
+        self.end = start if end is None else end
+
+    def candidates(self, index):
+        return set(index.targets.range(self.start, self.end))
+
+    def test(self, index, pc):
+        return any(isinstance(op, Loc) and self.start <= op.loc <= self.end for op in index.insn[pc].entry.instructions)
+
+def evaluate(index: InsnIndex, predicate: Predicate) -> list[int]:
+    candidates = predicate.candidates(index)
+    if candidates is None: pcs = index.pcs
+    else: pcs = sorted(candidates)
+    return [pc for pc in pcs if predicate.test(index, pc)]
+
+def parse_register(name: str) -> Reg | None:
+    name = name.upper()
+    addr = reg_addr.get(name)
+    if addr is None or addr < 0: return None
+    for size in (BYTE, WORD, LWORD):
+        reg = Reg(True, size, addr)
+        if regname(reg) == name: return reg
+    return None
+
+def parse_address(text: str, project: "Project") -> tuple[int, int]:
+    if "-" in text:
+        start, end = text.split("-", 1)
+        return parse_address(start, project)[0], parse_address(end, project)[1]
+    if (location := project.microcontroller.names.get(text)):
+        return location.address, location.address
+    for label in project.ob.labels.values():
+        if label.name == text: return label.location, label.location
+    address = int(text.removesuffix("h"), 16)
+    return address, address
+
+# Simple query syntax used by the listing search, all terms are combined with AND.
+#   LDIR                   opcode
+#   op:LD,LDW              any of the opcodes
+#   reg:XHL                register used by any operand
+#   reads:XHL  writes:P1CR register or memory (address, range, SFR or label)
+#   mem:400000-40FFFF      memory operand in range
+#   to:fun_F3D3F2          branch or call target
+# A leading ! negates a term.
+def parse_query(text: str, project: "Project") -> Predicate:
+    terms: list[Predicate] = []
+    for word in text.split():
+        negate = word.startswith("!")
+        if negate: word = word[1:]
+
+        key, _, value = word.partition(":")
+        if not value: key, value = "op", key
+        key = key.lower()
+
+        options: list[Predicate] = []
+        for v in value.split(","):
+            if key == "op":
+                options.append(Opcode(v))
+            elif key in ("reg", "reads", "writes", "mem"):
+                access = {"reads": "load", "writes": "store"}.get(key)
+                reg = parse_register(v) if key != "mem" else None
+                if reg is not None:
+                    options.append(Register(reg, access))
+                else:
+                    start, end = parse_address(v, project)
+                    options.append(Memory(start, end, access))
+            elif key == "to":
+                start, end = parse_address(v, project)
+                options.append(Target(start, end))
+            else:
+                raise ValueError(f"Unknown query term {key}")
+
+        term = options[0] if len(options) == 1 else Or(options)
+        terms.append(Not(term) if negate else term)
+
+    if not terms: raise ValueError("Empty query")
+    return terms[0] if len(terms) == 1 else And(terms)
+
+BIT_OPCODES = ("SET", "RES", "BIT", "CHG", "TSET")
+LOAD_SIZES = {"LD": 1, "LDW": 2}
+
+# Symbolic names for immediate values written to SFRs and for the bits addressed by bit instructions.
+# Candidates come from the memory index so only instructions that touch the SFR window are decoded.
+def sfr_annotations(index: InsnIndex, mc: microc.Microcontroller | None) -> dict[int, str]:
+    res: dict[int, str] = {}
+    if mc is None or not mc.table: return res
+
+    sfr = set(index.mem_ref.range(mc.start, mc.start + len(mc.table) - 1))
+    for opcode in BIT_OPCODES + tuple(LOAD_SIZES):
+        for pc in sfr.intersection(index.opcodes.get(opcode, ())):
+            ops = index.insn[pc].entry.instructions
+            if len(ops) != 2: continue
+            if opcode in BIT_OPCODES:
+                bit, mem = ops
+                if isinstance(mem, Mem) and mem.special and isinstance(bit, int):
+                    name = mc.bit_name(mem.address, bit)
+                    if name: res[pc] = name
+            else:
+                mem, value = ops
+                if isinstance(mem, Mem) and mem.special and isinstance(value, int):
+                    names = mc.decode(mem.address, value, LOAD_SIZES[opcode])
+                    if names: res[pc] = "|".join(names)
+    return res
@@ -0,0 +1,113 @@
+import re, json
+from pathlib import Path
+
+# Byte signatures with wildcards, used to search the ROM for known routines.
+#
+# A pattern is a list of hex bytes, whitespace is optional:
+#   3C 1F 00      literal bytes
+#   ??            any byte
+#   F? / ?F       nibble wildcard
+#   80&C0         value & mask, matches any byte b with b & C0 == 80
+# Separated bytes may have a 0x prefix or a single digit, "0x3C 1 ?" is "3C 01 ??".
+
+class BytePattern:
+    def __init__(self, text: str, name: str | None = None):
+        self.text = text
+        self.name = name or text
+        # Per byte (value, mask), mask 0 is a full wildcard
+        self.bytes: list[tuple[int, int]] = []
+
+        tokens: list[str] = []
+        for token in text.split():
+            if "&" in token:
+                tokens.append(token)
+                continue
+            if token[:2] in ("0x", "0X"): token = token[2:]
+            if len(token) == 1: token = "??" if token == "?" else "0" + token
+            tokens.extend(token[i:i + 2] for i in range(0, len(token), 2))
+
+        for token in tokens:
+            if "&" in token:
+                value, mask = token.split("&")
+                m = int(mask, 16)
+                self.bytes.append((int(value, 16) & m, m))
+                continue
+            if len(token) != 2:
+                raise ValueError(f"Invalid pattern byte {token}")
+            hi, lo = token[0], token[1]
+            value, mask = 0, 0
+            if hi != "?":
+                value |= int(hi, 16) << 4
+                mask |= 0xF0
+            if lo != "?":
+                value |= int(lo, 16)
+                mask |= 0x0F
+            self.bytes.append((value, mask))
+
+        if len(self.bytes) == 0: raise ValueError("Empty pattern")
+
+        self.regex = re.compile(b"".join(map(byte_regex, self.bytes)), re.DOTALL)
+
+    @staticmethod
+    def literal(data: bytes | bytearray, name: str | None = None) -> "BytePattern":
+        return BytePattern(" ".join(format(b, "02X") for b in data), name)
+
+    def __len__(self) -> int:
+        return len(self.bytes)
+
+    def __str__(self) -> str:
+        return self.name
+
+def byte_regex(byte: tuple[int, int]) -> bytes:
+    value, mask = byte
+    if mask == 0xFF: return re.escape(bytes([value]))
+    if mask == 0: return b"."
+    return b"[" + b"".join(re.escape(bytes([b])) for b in range(256) if b & mask == value) + b"]"
+
+class SignatureSet:
+    def __init__(self, patterns: list[BytePattern] | None = None):
+        self.patterns = patterns or []
+        self._regex: re.Pattern[bytes] | None = None
+        self._compiled = 0 # Number of patterns in _regex
+
+    def add(self, pattern: BytePattern | str, name: str | None = None):
+        if isinstance(pattern, str):
+            pattern = BytePattern(pattern, name)
+        self.patterns.append(pattern)
+
+    @property
+    def regex(self) -> re.Pattern[bytes]:
+        # All patterns in one regex, every pattern is a lookahead with its own group so that
+        # overlapping matches of different patterns at the same offset are all reported.
+        # The leading alternation skips offsets where nothing matches.
+        if self._regex is None or self._compiled != len(self.patterns):
+            self._compiled = len(self.patterns)
+            groups = [b"(?=(" + p.regex.pattern + b"))?" for p in self.patterns]
+            anyone = b"(?=" + b"|".join(p.regex.pattern for p in self.patterns) + b")"
+            self._regex = re.compile(anyone + b"".join(groups), re.DOTALL)
+        return self._regex
+
+    # Returns sorted (offset, pattern) tuples for all matches that lie completely inside of one of the ranges.
+    # Ranges are given as (start, end) indices into buffer, the buffer is never copied.
+    def search(self, buffer: bytearray, ranges: list[tuple[int, int]] | None = None) -> list[tuple[int, BytePattern]]:
+        if ranges is None: ranges = [(0, len(buffer))]
+        if not self.patterns: return []
+
+        res: list[tuple[int, BytePattern]] = []
+        regex = self.regex
+        for start, end in ranges:
+            # endpos keeps the lookaheads inside of the range
+            for match in regex.finditer(buffer, start, end):
+                offset = match.start()
+                for i, pattern in enumerate(self.patterns):
+                    if match.start(i + 1) != -1:
+                        res.append((offset, pattern))
+
+        res.sort(key=lambda m: m[0])
+        return res
+
+def load_signatures(path: Path) -> SignatureSet:
+    # JSON object of name -> pattern
+    with open(path, "r") as fp:
+        data = json.load(fp)
+    return SignatureSet([BytePattern(pattern, name) for name, pattern in data.items()])
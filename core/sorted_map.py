@@ -0,0 +1,99 @@
+from bisect import bisect_left, bisect_right
+from typing import Generic, Iterable, Iterator, TypeVar
+
+V = TypeVar("V")
+
+# Map from int keys to values sorted by key, stored as two parallel lists.
+# Lookups are a bisect over the keys, building from scratch is a single sort
+# and replacing a range of keys is a slice assignment.
+class SortedMap(Generic[V]):
+    def __init__(self, items: Iterable[tuple[int, V]] = ()):
+        self._keys: list[int] = []
+        self._values: list[V] = []
+        self.build(items)
+
+    def build(self, items: Iterable[tuple[int, V]]):
+        # Later items replace earlier ones with the same key
+        data = dict(items)
+        self._keys = sorted(data)
+        self._values = [data[k] for k in self._keys]
+
+    def clear(self):
+        self._keys.clear()
+        self._values.clear()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._keys)
+
+    def __contains__(self, key: int) -> bool:
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def __getitem__(self, key: int) -> V:
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._values[i]
+        raise KeyError(key)
+
+    def __setitem__(self, key: int, value: V):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            self._values[i] = value
+        else:
+            self._keys.insert(i, key)
+            self._values.insert(i, value)
+
+    def __delitem__(self, key: int):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+            del self._values[i]
+        else: raise KeyError(key)
+
+    def get(self, key: int, default: V | None = None) -> V | None:
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._values[i]
+        return default
+
+    def keys(self) -> list[int]:
+        return self._keys
+
+    def values(self) -> list[V]:
+        return self._values
+
+    def items(self) -> Iterator[tuple[int, V]]:
+        return zip(self._keys, self._values)
+
+    # Index of the greatest key <= key, -1 if there is none
+    def floor_index(self, key: int) -> int:
+        return bisect_right(self._keys, key) - 1
+
+    # Value of the greatest key <= key
+    def floor(self, key: int) -> V | None:
+        i = bisect_right(self._keys, key) - 1
+        return self._values[i] if i >= 0 else None
+
+    # Value of the least key > key
+    def higher(self, key: int) -> V | None:
+        i = bisect_right(self._keys, key)
+        return self._values[i] if i < len(self._keys) else None
+
+    # Values with start <= key < end
+    def range(self, start: int, end: int) -> list[V]:
+        return self._values[bisect_left(self._keys, start):bisect_left(self._keys, end)]
+
+    # Replaces all entries with start <= key < end, the new items have to lie between the
+    # entries that are kept
+    def splice(self, start: int, end: int, items: Iterable[tuple[int, V]]):
+        lo = bisect_left(self._keys, start)
+        hi = bisect_left(self._keys, end)
+        items = sorted(items, key=lambda item: item[0])
+        if items:
+            assert lo == 0 or self._keys[lo - 1] < items[0][0]
+            assert hi == len(self._keys) or items[-1][0] < self._keys[hi]
+        self._keys[lo:hi] = [k for k, _ in items]
+        self._values[lo:hi] = [v for _, v in items]
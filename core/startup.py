@@ -0,0 +1,32 @@
+import time
+from contextlib import contextmanager
+
+# Wall clock time spent in the phases of a cold start, disgui.py --profile-startup prints
+# the report once the ui state is restored. Phases can be entered multiple times and
+# from multiple threads, the times are added up.
+
+class StartupProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.enabled = False
+
+    @contextmanager
+    def phase(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - t
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.start
+        lines = ["Startup profile:"]
+        for name, t in self.phases.items():
+            lines.append(f"  {name:<12} {t * 1000:9.1f} ms {t / total * 100:5.1f}%")
+        rest = total - sum(self.phases.values())
+        lines.append(f"  {'other':<12} {rest * 1000:9.1f} ms {rest / total * 100:5.1f}%")
+        lines.append(f"  {'total':<12} {total * 1000:9.1f} ms")
+        return "\n".join(lines)
+
+profile = StartupProfile()
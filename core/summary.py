@@ -0,0 +1,48 @@
+from itertools import groupby
+from typing import TYPE_CHECKING
+
+from tcls_900.tlcs_900 import Reg
+
+if TYPE_CHECKING:
+    from .project import Function, FunctionState, Instruction
+
+# Analysis results of a function grouped for display. Computed once per FunctionState,
+# Function.get_summary caches it until the function is analyzed again.
+
+CALL_OPCODES = ("CALL", "CALR")
+
+def group_mems(mems: list[int]) -> list[list[int]]:
+    # Runs of consecutive addresses
+    return [[num for _, num in g] for _, g in groupby(enumerate(sorted(mems)), lambda x: x[1] - x[0])]
+
+def split_regs(values: "set[Reg | int]") -> tuple[list[Reg], list[list[int]]]:
+    regs = sorted((v for v in values if isinstance(v, Reg)), key=lambda r: r.addr)
+    mems = group_mems([v for v in values if isinstance(v, int)])
+    return regs, mems
+
+class ClobberGroup:
+    def __init__(self, ep: int, call: "Instruction | None", regs: list[Reg], mems: list[list[int]]):
+        self.ep = ep
+        self.call = call # The call instruction at ep if the clobbers come from a callee
+        self.regs = regs
+        self.mems = mems
+
+class FunctionSummary:
+    def __init__(self, fun: "Function"):
+        state = fun.state
+        assert state is not None
+        self.state: "FunctionState" = state
+
+        self.input_regs, self.input_mems = split_regs(state.input)
+        self.output_regs, self.output_mems = split_regs(state.output)
+
+        calls: dict[int, "Instruction"] = {}
+        for block in fun.blocks.values():
+            for insn in block.insn:
+                if insn.entry.opcode in CALL_OPCODES:
+                    calls[insn.entry.pc] = insn
+
+        self.clobbers: list[ClobberGroup] = []
+        for ep, group in groupby(sorted(state.clobbers, key=lambda c: c[2]), key=lambda c: c[2]):
+            regs, mems = split_regs({value for _, value, _ in group})
+            self.clobbers.append(ClobberGroup(ep, calls.get(ep), regs, mems))
@@ -0,0 +1,110 @@
+from bisect import bisect_right
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .project import Function, Project
+
+# Worst case execution time of a function in states.
+#
+# Back edges of a depth first search from the entry point mark the loops, a loop
+# consists of the blocks that reach the back edge without passing its header.
+# Every block is weighted with the bounds of the loops it is part of, calls add the
+# estimate of the callee. The result is the longest path through the remaining DAG.
+# Loops without a bound in Project.loop_bounds count once and make the result unbounded.
+#
+# Recursive calls are cut off where they reach a function that is already being estimated,
+# so inside of a strongly connected component of the call graph the estimate depends on the
+# function it was started from. Only the estimate of that function is stored in Function.timing,
+# the others in the component are kept for the current estimate only. Functions of other
+# components can't call back into it and are stored as usual.
+
+class Timing:
+    def __init__(self, wcet: int, unbounded: list[int]):
+        self.wcet = wcet
+        self.unbounded = unbounded # Headers of loops without a bound, or recursive calls
+
+    @property
+    def bounded(self) -> bool:
+        return not self.unbounded
+
+    def __str__(self) -> str:
+        return str(self.wcet) if self.bounded else f">= {self.wcet}"
+
+def estimate_wcet(fun: "Function", proj: "Project") -> Timing:
+    if fun.timing is None: fun.timing = _estimate(fun, proj, set(), {})
+    return fun.timing
+
+def _estimate(fun: "Function", proj: "Project", active: set[int], local: dict[int, Timing]) -> Timing:
+    if fun.ep in local: return local[fun.ep]
+    active.add(fun.ep)
+    graph = proj.get_calls()
+
+    blocks = fun.blocks
+    order: list[int] = [] # Post order
+    back_edges: list[tuple[int, int]] = []
+    state: dict[int, int] = {fun.start.ep: 1} # 1 = on the stack, 2 = done
+    stack = [(fun.start.ep, 0)]
+    while stack:
+        ep, i = stack[-1]
+        succ = blocks[ep].succ
+        if i < len(succ):
+            stack[-1] = (ep, i + 1)
+            to = succ[i][0]
+            if to not in blocks: continue
+            s = state.get(to)
+            if s == 1: back_edges.append((ep, to))
+            elif s is None:
+                state[to] = 1
+                stack.append((to, 0))
+        else:
+            state[ep] = 2
+            order.append(ep)
+            stack.pop()
+
+    pred: dict[int, list[int]] = {ep: [] for ep in order}
+    for ep in order:
+        for to, _ in blocks[ep].succ:
+            if to in pred: pred[to].append(ep)
+
+    unbounded: list[int] = []
+    multiplier = dict.fromkeys(order, 1)
+    for tail, header in back_edges:
+        bound = proj.loop_bounds.get(header)
+        if bound is None:
+            if header not in unbounded: unbounded.append(header)
+            continue
+        body = {header}
+        work = [tail]
+        while work:
+            ep = work.pop()
+            if ep in body: continue
+            body.add(ep)
+            work.extend(pred[ep])
+        for ep in body: multiplier[ep] *= bound
+
+    # Calls are attributed to the block that contains them
+    starts = sorted(blocks)
+    calls = dict.fromkeys(order, 0)
+    for pc, callee_ep in getattr(fun, "callees", []):
+        i = bisect_right(starts, pc) - 1
+        if i < 0 or starts[i] not in calls: continue
+        callee = proj.functions.get(callee_ep) if proj.functions else None
+        if callee is None: continue
+        if callee_ep in active:
+            if callee_ep not in unbounded: unbounded.append(callee_ep)
+            continue
+        if graph.same_component(fun.ep, callee_ep):
+            timing = _estimate(callee, proj, active, local)
+        else: timing = estimate_wcet(callee, proj)
+        unbounded.extend(ep for ep in timing.unbounded if ep not in unbounded)
+        calls[starts[i]] += timing.wcet
+
+    back = set(back_edges)
+    dist: dict[int, int] = {}
+    for ep in reversed(order):
+        cost = (blocks[ep].cycles + calls[ep]) * multiplier[ep]
+        dist[ep] = max((dist[p] for p in pred[ep] if (p, ep) not in back), default=0) + cost
+
+    active.discard(fun.ep)
+    timing = local[fun.ep] = Timing(max(dist.values(), default=0), unbounded)
+    return timing
@@ -71,6 +71,10 @@ class Label:
         self.kind = kind
         self.callers = set()
         self.type = type
+        # Arrays of type, stride is the distance between elements if it isn't the size of type
+        self.elements = 1
+        self.stride = None
+        self.string = False
 
     def __str__(self):
         return self.name
@@ -132,7 +136,7 @@ class OutputBuffer:
 
 
 class InputBuffer:
-    def __init__(self, data, available, bounds = None, entry_point = 0, exit_on_invalid = False):
+    def __init__(self, data, available, bounds = None, entry_point = 0, exit_on_invalid = False, microcontroller = None):
         self.min = 0
         self.max = available
         if bounds is not None:
@@ -154,6 +158,8 @@ class InputBuffer:
         self.access = bytearray(math.ceil(available / 8))
         self.entry_point = entry_point
         self.exit_on_invalid = exit_on_invalid
+        # Names special function registers, see tcls_900.microc
+        self.microcontroller = microcontroller
         data.readinto(self.buffer)
 
     def was_read(self, o):
@@ -1,20 +1,34 @@
+import argparse
 from pathlib import Path
-from tcls_900 import microc
 
-from kivy.config import Config
-Config.set('input', 'mouse', 'mouse,multitouch_on_demand')
-
-from ui import main
-from ui.project import Project, new_project
+from core.startup import profile
 
 if __name__ == "__main__":
-    microc.load_microcontroller("TMP91C016")
+    parser = argparse.ArgumentParser(description="TLCS-900 disassembler GUI")
+    parser.add_argument("project", nargs="?", default="el9900.disproj", help="Project folder to open")
+    parser.add_argument("--profile-startup", action="store_true",
+        help="Print the time spent importing, loading the microcontroller, decoding, building sections and restoring the ui state")
+    args = parser.parse_args()
+    profile.enabled = args.profile_startup
+
+    with profile.phase("import"):
+        from kivy.config import Config
+        Config.set('input', 'mouse', 'mouse,multitouch_on_demand')
+
+        from tcls_900 import microc
+        from ui import main
+
+    with profile.phase("yaml"):
+        microc.load_microcontroller("TMP91C016")
+
     eps = [
-        0xFFEC19, 0xFFEC18, 0xFFBFA4, 0xFFBFA0, 
-        0xFFBFAC, 0xFFBFB0, 0xFFBF94, 0xFFBF98, 
+        0xFFEC19, 0xFFEC18, 0xFFBFA4, 0xFFBFA0,
+        0xFFBFAC, 0xFFBFB0, 0xFFBF94, 0xFFBF98,
         0xFFF10E, 0xFFBF9C, 0xFFBFA8
     ]
     org = 0xF00000
     #proj = new_project(Path("el9900.disproj/el9900.rom"), eps, org)
     #main.main(proj)
-    main.main(Project.read_from_file(Path("el9900.disproj")))
\ No newline at end of file
+
+    # The window opens right away, the project is read in the background
+    main.main(Path(args.project))
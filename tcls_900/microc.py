@@ -1,4 +1,7 @@
-import yaml, sys
+import pickle, os
+from hashlib import md5
+from pathlib import Path
+from platformdirs import user_cache_path
 
 class Location:
     def __init__(self, name, address, constants):
@@ -6,13 +9,64 @@ class Location:
         self.address = address
         self.constants = constants
 
-ADDRESS_TABLE = {}
+        # Decode table of the named bits, (mask, name) with the most significant bit first
+        self.fields: list[tuple[int, str]] = sorted(((1 << bit, k) for k, bit in (constants or {}).items()
+            if isinstance(bit, int) and 0 <= bit < 8), reverse=True)
+        self.bits: list[str | None] = [None] * 8
+        for mask, k in self.fields:
+            self.bits[mask.bit_length() - 1] = k
 
-def load_microcontroller(name):
-    with open(name + ".yaml", "rb") as fp:
-        data = yaml.safe_load(fp)
-    
-    for k, v in data.items():
+    def decode(self, value: int) -> list[str]:
+        return [k for mask, k in self.fields if value & mask]
+
+class Microcontroller:
+    def __init__(self, name: str, locations: list[Location]):
+        self.name = name
+        self.locations: dict[int, Location] = {l.address: l for l in locations}
+        self.names: dict[str, Location] = {l.name: l for l in locations}
+
+        # Dense table over the SFR window, lookups are a single index
+        self.start = min(self.locations, default=0)
+        self.table: list[Location | None] = [None] * (max(self.locations, default=-1) + 1 - self.start)
+        for l in locations:
+            self.table[l.address - self.start] = l
+
+    def check_address(self, loc: int) -> Location | None:
+        i = loc - self.start
+        if 0 <= i < len(self.table):
+            return self.table[i]
+        return None
+
+    def bit_name(self, address: int, bit: int) -> str | None:
+        location = self.check_address(address + bit // 8)
+        if location: return location.bits[bit % 8]
+        return None
+
+    # Names of the bits set in a value written to address, size is in bytes
+    def decode(self, address: int, value: int, size: int = 1) -> list[str]:
+        res = []
+        for i in reversed(range(size)):
+            location = self.check_address(address + i)
+            if location: res.extend(location.decode((value >> (i * 8)) & 0xFF))
+        return res
+
+# The yaml files live next to the tcls_900 package
+MICROC_FOLDER = Path(__file__).parent.parent
+CACHE_FOLDER = user_cache_path("PyDis", appauthor=False) / "microc"
+# Bumped whenever the compiled format changes
+CACHE_VERSION = 2
+
+_loaded: dict[Path, Microcontroller] = {}
+
+def find_microcontroller(name: str) -> Path:
+    for path in (Path(name), Path(name + ".yaml"), MICROC_FOLDER / (name + ".yaml")):
+        if path.is_file(): return path.resolve()
+    raise FileNotFoundError(f"No definition for microcontroller {name}")
+
+def compile_microcontroller(path: Path, data: bytes) -> Microcontroller:
+    import yaml # Only needed on a cache miss
+    locations = []
+    for k, v in yaml.safe_load(data).items():
         constants = None
         if isinstance(v, dict):
             address = v["$"]
@@ -20,9 +74,53 @@ def load_microcontroller(name):
             del constants["$"]
         else: address = v
 
-        ADDRESS_TABLE[address] = Location(k, address, constants)
-        
-def check_address(loc):
-    if loc in ADDRESS_TABLE:
-        return ADDRESS_TABLE[loc]
-    return None
\ No newline at end of file
+        locations.append(Location(k, address, constants))
+    return Microcontroller(path.stem, locations)
+
+# Parsing the yaml is slow, the compiled definition is cached in the user cache folder.
+# The cache is used as is if the mtime and size match, otherwise the content hash decides.
+def read_microcontroller(path: Path) -> Microcontroller:
+    stat = path.stat()
+    cache = CACHE_FOLDER / (md5(str(path).encode()).hexdigest() + ".microc")
+
+    header = None
+    try:
+        with open(cache, "rb") as fp:
+            header = pickle.load(fp)
+            if header[:3] == (CACHE_VERSION, stat.st_mtime_ns, stat.st_size):
+                return pickle.load(fp)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError, IndexError, TypeError):
+        header = None
+
+    with open(path, "rb") as fp:
+        data = fp.read()
+    digest = md5(data).hexdigest()
+
+    mc = None
+    if header is not None and header[:1] == (CACHE_VERSION,) and header[3] == digest:
+        try:
+            with open(cache, "rb") as fp:
+                pickle.load(fp)
+                mc = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError): pass
+    if mc is None:
+        mc = compile_microcontroller(path, data)
+
+    try:
+        CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+        tmp = cache.with_suffix(".tmp")
+        with open(tmp, "wb") as fp:
+            pickle.dump((CACHE_VERSION, stat.st_mtime_ns, stat.st_size, digest), fp)
+            pickle.dump(mc, fp)
+        os.replace(tmp, cache)
+    except OSError: pass
+    return mc
+
+# Loads a definition by name or path, different variants can be loaded side by side.
+# The one used for decoding is passed to the InputBuffer.
+def load_microcontroller(name: str) -> Microcontroller:
+    path = find_microcontroller(name)
+    mc = _loaded.get(path)
+    if mc is None:
+        mc = _loaded[path] = read_microcontroller(path)
+    return mc
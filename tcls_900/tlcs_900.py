@@ -1,5 +1,4 @@
 from disapi import Insn
-from . import microc
 
 # Constants
 BYTE = 0
@@ -64,8 +63,12 @@ class RReg(Reg):
 
 # Class that holds memory addresses
 class Mem:
-    def __init__(self, address, name = None, plain_addr = False):
-        location = microc.check_address(address)
+    # Addresses of special function registers are named after them, the microcontroller
+    # comes from the InputBuffer of insn
+    def __init__(self, address, name = None, plain_addr = False, insn = None):
+        location = None
+        if name is None and insn is not None and insn.ibuffer.microcontroller is not None:
+            location = insn.ibuffer.microcontroller.check_address(address)
 
         self.special = False
         if name is None and location:
@@ -203,11 +206,11 @@ def popmem(insn):
     else:
         n = mem & 0x3
         if n == 0: 
-            return Mem(insn.pop()) # 8
+            return Mem(insn.pop(), insn=insn) # 8
         elif n == 1:
-            return Mem(insn.popw()) # 16
+            return Mem(insn.popw(), insn=insn) # 16
         elif n == 2:
-            return Mem(insn.popw() | (insn.pop() << 16)) # 24
+            return Mem(insn.popw() | (insn.pop() << 16), insn=insn) # 24
         else:
             mem = insn.pop()
             n = mem & 0x3
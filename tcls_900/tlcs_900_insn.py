@@ -8,7 +8,7 @@ WA = Reg(False, WORD, 0)
 # If a displacement looks like an address, insert a memory location here
 def check_address(insn, address, pc):
     if insn.ibuffer.min <= address < insn.ibuffer.max:
-        mem = Mem(address, plain_addr=True)
+        mem = Mem(address, plain_addr=True, insn=insn)
         mem.datalabel(insn, pc)
         return mem
     return address
@@ -41,13 +41,13 @@ def LD_R_mem(insn):
 
 def LD_n_n(insn):
     if (insn.pop() & 0x2) == 0: #BYTE
-        return "LD", Mem(insn.pop()), insn.pop()
+        return "LD", Mem(insn.pop(), insn=insn), insn.pop()
     else: #WORD
-        return "LDW", Mem(insn.pop()), insn.popw()
+        return "LDW", Mem(insn.pop(), insn=insn), insn.popw()
         
 def LD_nn_m(insn):
     insn.pop()
-    return ("LDW" if insn.lastsize == WORD else "LD"), Mem(insn.popw()), insn.lastmem
+    return ("LDW" if insn.lastsize == WORD else "LD"), Mem(insn.popw(), insn=insn), insn.lastmem
 def LDB_mem_R(insn): 
     return "LD", insn.lastmem, popR(insn, '?', BYTE)
 def LDW_mem_R(insn): 
@@ -67,14 +67,14 @@ def LDW_m_X(insn):
 def LDW_n_nn(insn):
     insn.lastsize = WORD
     insn.pop()
-    return "LDW", Mem(insn.pop()), insn.popw()
+    return "LDW", Mem(insn.pop(), insn=insn), insn.popw()
 
 def LDB_m_nn(insn):
     insn.lastsize = BYTE
-    return "LD", insn.lastmem, Mem(insn.popw())
+    return "LD", insn.lastmem, Mem(insn.popw(), insn=insn)
 def LDW_m_nn(insn):
     insn.lastsize = WORD
-    return "LDW", insn.lastmem, Mem(insn.popw())
+    return "LDW", insn.lastmem, Mem(insn.popw(), insn=insn)
     
 #PUSH
 def PUSH_F(insn):
@@ -682,7 +682,7 @@ def LDX(insn):
     insn.pop()
     r2 = insn.pop()
     insn.pop()
-    return "LDX", Mem(r1), r2
+    return "LDX", Mem(r1, insn=insn), r2
 
 #LINK
 def LINK(insn): 
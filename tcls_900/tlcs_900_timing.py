@@ -0,0 +1,99 @@
+from tcls_900 import tlcs_900 as proc
+from tcls_900.tlcs_900_optable import optable, optable_src, optable_dst, optable_reg
+
+# Execution time in states for the TLCS-900/H1, keyed by the handler that decodes
+# the instruction in tlcs_900_optable. Conditional branches use the time of the taken
+# branch, the repeating block instructions are counted per iteration.
+# Instructions with a memory operand get the cost of their addressing mode on top.
+# Bus wait states are not included.
+
+TIMING = {
+    # optable
+    "NOP": 1, "NORMAL": 4, "PUSH_SR": 3, "POP_SR": 4, "MAX": 4, "HALT": 6, "EI": 3, "RETI": 12,
+    "LD_n_n": 5, "PUSH_n": 4, "LDW_n_nn": 6, "PUSHW_nn": 5, "INCF": 2, "DECF": 2, "RET": 9, "RETD": 9,
+    "RCF": 2, "SCF": 2, "CCF": 2, "ZCF": 2, "PUSH_A": 3, "POP_A": 4, "EX_F_F1": 2, "LDF_n": 2,
+    "PUSH_F": 3, "POP_F": 4, "JP_nn": 7, "JP_nnn": 7, "CALL_nn": 12, "CALL_nnn": 12, "CALR": 12,
+    "LD_R_n": 2, "PUSH_RR": 3, "LD_RR_nn": 3, "LD_XRR_nnnn": 5, "POP_RR": 4, "POP_XRR": 5,
+    "JR_cc": 8, "JRL_cc": 8, "LDX": 9, "SWI_N": 19,
+
+    # optable_reg
+    "LD_r_X": 3, "PUSH_r": 4, "POP_r": 5, "CPL_r": 2, "NEG_r": 2,
+    "MUL_rr_X": 14, "MULS_rr_X": 14, "DIV_rr_X": 22, "DIVS_rr_X": 24,
+    "LINK": 10, "UNLK": 8, "BS1F": 4, "BS1B": 4, "DAA": 4, "EXTZ": 3, "EXTS": 3, "PAA": 4, "MIRR": 3,
+    "MULA": 31, "DJNZ": 11,
+    "ANDCF_X_r": 3, "ORCF_X_r": 3, "XORCF_X_r": 3, "LDCF_X_r": 3, "STCF_X_r": 3,
+    "ANDCF_A_r": 3, "ORCF_A_r": 3, "XORCF_A_r": 3, "LDCF_A_r": 3, "STCF_A_r": 3,
+    "LDC_cr_r": 3, "LDC_r_cr": 3,
+    "RES_X_r": 3, "SET_X_r": 3, "CHG_X_r": 3, "BIT_X_r": 3, "TSET_X_r": 4, "MINCN": 5, "MDECN": 5,
+    "MUL_RR_r": 14, "MULS_RR_r": 14, "DIV_RR_r": 22, "DIVS_RR_r": 24,
+    "INC_N_r": 2, "DEC_N_r": 2, "SCC": 3,
+    "ADD_R_r": 2, "LD_R_r": 2, "ADC_R_r": 2, "LD_r_R": 2, "SUB_R_r": 2, "LD_N": 2, "SBC_R_r": 2,
+    "EX_R_r": 3, "AND_R_r": 2, "XOR_R_r": 2, "OR_R_r": 2, "CP_R_r": 2, "CP_R_N": 2,
+    "ADD_r_X": 3, "ADC_r_X": 3, "SUB_r_X": 3, "SBC_r_X": 3, "AND_r_X": 3, "XOR_r_X": 3, "OR_r_X": 3, "CP_r_X": 3,
+    "RLC_X_r": 4, "RRC_X_r": 4, "RL_X_r": 4, "RR_X_r": 4, "SLA_X_r": 4, "SRA_X_r": 4, "SLL_X_r": 4, "SRL_X_r": 4,
+    "RLC_A_r": 4, "RRC_A_r": 4, "RL_A_r": 4, "RR_A_r": 4, "SLA_A_r": 4, "SRA_A_r": 4, "SLL_A_r": 4, "SRL_A_r": 4,
+
+    # optable_src
+    "PUSH_mem": 6, "RLD": 14, "RRD": 14, "LDI": 8, "LDIR": 8, "LDD": 8, "LDDR": 8,
+    "CPI": 6, "CPIR": 6, "CPD": 6, "CPDR": 6, "LD_nn_m": 8, "LD_R_mem": 4, "EX_mem_R": 6,
+    "ADD_mem_X": 7, "ADC_mem_X": 7, "SUB_mem_X": 7, "SBC_mem_X": 7, "AND_mem_X": 7, "XOR_mem_X": 7, "OR_mem_X": 7, "CP_mem_X": 6,
+    "MUL_RR_mem": 16, "MULS_RR_mem": 16, "DIV_RR_mem": 24, "DIVS_RR_mem": 26,
+    "INC_N_mem": 6, "DEC_N_mem": 6,
+    "RLC_mem": 6, "RRC_mem": 6, "RL_mem": 6, "RR_mem": 6, "SLA_mem": 6, "SRA_mem": 6, "SLL_mem": 6, "SRL_mem": 6,
+    "ADD_R_mem": 4, "ADC_R_mem": 4, "SUB_R_mem": 4, "SBC_R_mem": 4, "AND_R_mem": 4, "XOR_R_mem": 4, "OR_R_mem": 4, "CP_R_mem": 4,
+    "ADD_mem_R": 6, "ADC_mem_R": 6, "SUB_mem_R": 6, "SBC_mem_R": 6, "AND_mem_R": 6, "XOR_mem_R": 6, "OR_mem_R": 6, "CP_mem_R": 4,
+
+    # optable_dst
+    "LDB_m_X": 5, "LDW_m_X": 6, "POPB_mem": 6, "POPW_mem": 6, "LDAR": 7, "LDB_m_nn": 8, "LDW_m_nn": 8,
+    "LDAW_R_mem": 4, "LDAL_R_mem": 4,
+    "ANDCF_A_mem": 6, "ORCF_A_mem": 6, "XORCF_A_mem": 6, "LDCF_A_mem": 6, "STCF_A_mem": 7,
+    "LDB_mem_R": 4, "LDW_mem_R": 4, "LDL_mem_R": 4,
+    "ANDCF_N_mem": 6, "ORCF_N_mem": 6, "XORCF_N_mem": 6, "LDCF_N_mem": 6, "STCF_N_mem": 7,
+    "TSET_N_mem": 10, "RES_N_mem": 8, "SET_N_mem": 8, "CHG_N_mem": 8, "BIT_N_mem": 6,
+    "JP_cc_mem": 9, "CALL_cc_mem": 12, "RET_cc": 9,
+}
+
+# Instructions that repeat until BC is zero
+REPEAT = {"LDIR", "LDDR", "CPIR", "CPDR"}
+
+def addressing(mem: int, data: bytes | bytearray, i: int) -> tuple[int, int]:
+    # Returns the number of bytes after the prefix and the additional states, follows popmem
+    if (mem & 0x40) == 0:
+        if (mem & 0x8) == 0: return 0, 0 # (R)
+        return 1, 1                      # (R + d8)
+    elif (mem & 0x4) == 0x4:
+        return 1, 1                      # (-r32), (r32+)
+    n = mem & 0x3
+    if n == 0: return 1, 1               # (#8)
+    elif n == 1: return 2, 2             # (#16)
+    elif n == 2: return 3, 3             # (#24)
+    if i >= len(data): return 1, 1
+    m = data[i]
+    if (m & 0x3) == 0: return 1, 1       # (r32)
+    elif (m & 0x3) == 1: return 3, 2     # (r32 + d16)
+    return 3, 3                          # (r32 + r8), (r32 + r16)
+
+def handler(data: bytes | bytearray) -> tuple[str | None, int]:
+    # Decodes the handler name of an instruction and the cost of its addressing mode
+    if not data: return None, 0
+    fn = optable[data[0] >> 4][data[0] & 0xF]
+    extra = 0
+    if fn is proc.src or fn is proc.dst:
+        length, extra = addressing(data[0], data, 1)
+        i = 1 + length
+        table = optable_src if fn is proc.src else optable_dst
+    elif fn is proc.reg:
+        i = 2 if (data[0] & 0x7) == 0x7 else 1
+        table = optable_reg
+    else:
+        return (fn.__name__ if fn else None), 0
+
+    if i >= len(data): return None, 0
+    fn = table[data[i] >> 4][data[i] & 0xF]
+    return (fn.__name__ if fn else None), extra
+
+def states(data: bytes | bytearray) -> tuple[int, bool]:
+    # Worst case states of a single instruction, and whether it repeats
+    name, extra = handler(data)
+    if name is None: return 0, False
+    return TIMING.get(name, 0) + extra, name in REPEAT
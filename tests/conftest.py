@@ -0,0 +1,30 @@
+import sys, threading
+from pathlib import Path
+
+import pytest
+
+# The repository isn't installed, the tests import core from the checkout
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.project import Project
+from roms import ORG
+
+@pytest.fixture
+def rom_project(tmp_path: Path):
+    # Builds a project from a ROM image at org, decoded from the given entry points.
+    # Functions are analyzed unless analyze is False.
+    count = 0
+    def build(rom: bytes, eps: list[int] | None = None, analyze: bool = True, org: int = ORG) -> Project:
+        nonlocal count
+        count += 1
+        path = tmp_path / f"rom{count}.bin"
+        path.write_bytes(rom)
+        eps = eps or [org]
+        proj = Project(tmp_path, path, org, eps)
+        proj.rescan(eps, org)
+        if analyze:
+            done = threading.Event()
+            proj.analyze_functions(done.set, lambda i, name: None)
+            done.wait()
+        return proj
+    return build
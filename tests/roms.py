@@ -0,0 +1,30 @@
+# Encodings for the synthetic ROMs the tests decode
+
+ORG = 0xF00000
+
+RET = bytes([0x0E])
+
+def call(address: int) -> bytes:
+    return bytes([0x1D, address & 0xFF, (address >> 8) & 0xFF, (address >> 16) & 0xFF])
+
+def jr(condition: int, offset: int) -> bytes:
+    # JR cc, relative to the end of the instruction
+    return bytes([0x60 | condition, offset & 0xFF])
+
+def ld_a(value: int) -> bytes:
+    return bytes([0x21, value])
+
+def pointer(address: int) -> bytes:
+    # 24 bit pointer stored in 4 bytes
+    return address.to_bytes(4, "little")
+
+T = 0x8
+Z = 0x6
+NZ = 0xE
+
+def image(size: int, parts: dict[int, bytes]) -> bytes:
+    # ROM of size bytes with parts at offsets from ORG
+    rom = bytearray(size)
+    for offset, data in parts.items():
+        rom[offset:offset + len(data)] = data
+    return bytes(rom)
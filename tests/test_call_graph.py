@@ -0,0 +1,50 @@
+from core.call_graph import CallIndex
+from roms import ORG, RET, T, call, jr, ld_a, image
+
+A, B, C, D = (ORG + 0x100 * i for i in range(1, 5))
+
+def build(rom_project):
+    return rom_project(image(0x1000, {
+        0x000: call(A) + jr(T, -2),
+        0x100: call(B) + call(B) + call(D) + RET,
+        0x200: call(C) + RET,
+        0x300: ld_a(1) + call(B) + RET,
+        0x400: RET,
+    }))
+
+def test_index(rom_project):
+    calls = build(rom_project).get_calls()
+    assert calls.callees(A) == [B, D]
+    assert calls.callers(B) == [A, C]
+    assert calls.sites(A, B) == [A, A + 4]
+    assert calls.out_degree(A) == 2 and calls.in_degree(B) == 2
+    assert calls.frequency(B) == 3
+
+    assert calls.is_recursive(B) and calls.is_recursive(C)
+    assert not calls.is_recursive(A) and not calls.is_recursive(D)
+    assert calls.same_component(B, C) and not calls.same_component(A, B)
+    assert calls.reachable(A) == {A, B, C, D}
+    assert calls.reachable(B, reverse=True) == {A, B, C}
+    assert calls.reaches(C, B) and not calls.reaches(D, A)
+
+def test_update(rom_project):
+    proj = build(rom_project)
+    calls = proj.get_calls()
+    c = proj.functions[C]
+
+    # C stops calling back into B
+    c.callees = []
+    assert calls.update(c)
+    assert not calls.is_recursive(B)
+    assert calls.callers(B) == [A]
+
+    fresh = CallIndex(proj.functions.values())
+    for ep in (A, B, C, D):
+        assert calls.call_sites(ep) == fresh.call_sites(ep)
+        assert calls.caller_sites(ep) == fresh.caller_sites(ep)
+
+    # Analyzing a function again updates the index in place
+    c.state = None
+    c.analyze(proj)
+    assert proj.calls is calls
+    assert calls.is_recursive(B)
@@ -0,0 +1,33 @@
+from core.data_pointers import PointerScanner, find_data_types
+from tcls_900.tlcs_900 import BYTE, LWORD
+from roms import ORG, RET, pointer, image
+
+STRINGS = [ORG + 0x900, ORG + 0x906, ORG + 0x909]
+
+def data_rom() -> bytes:
+    return image(0x1000, {
+        0x000: RET,
+        0x800: b"".join(map(pointer, STRINGS)),
+        0x900: b"HELLO\0AB\0XYZ\0",
+        # Padding after the strings
+        0xA00: bytes(16) + b"\xFF\xFF\xFF\x00" * 4,
+    })
+
+def test_string_table(rom_project):
+    proj = rom_project(data_rom(), analyze=False)
+    types = {(t.address, t.type, t.elements, t.stride, t.string) for t in find_data_types(proj)}
+    assert types == {
+        (ORG + 0x800, LWORD, 3, 4, False),
+        (ORG + 0x900, BYTE, 6, 1, True),
+        (ORG + 0x906, BYTE, 3, 1, True),
+        (ORG + 0x909, BYTE, 4, 1, True),
+    }
+
+def test_padding(rom_project):
+    # At org 0 zero padding points at the first instruction and FF FF FF 00 at the end of the ROM
+    rom = RET + bytes(255) + b"\xFF" * 252 + b"\xFF\xFF\xFF\x00"
+    proj = rom_project(rom, analyze=False, org=0)
+    scanner = PointerScanner(proj)
+    assert scanner.is_plausible(0)
+    assert scanner.scan(1, len(rom)) == []
+    assert find_data_types(proj) == []
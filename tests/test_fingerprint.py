@@ -0,0 +1,61 @@
+from core.fingerprint import FingerprintIndex
+from roms import ORG, RET, T, Z, call, jr, ld_a, image
+
+BODIES = [
+    b"".join(ld_a(v) for v in (1, 2, 3, 4)) + RET,
+    ld_a(9) + jr(Z, 2) + ld_a(8) + ld_a(7) + RET,
+    b"".join(ld_a(v) for v in (5, 6, 7)) + call(ORG + 0x800) + RET,
+]
+NAMES = ["clear", "check", "update"]
+
+def revision(offset: int) -> tuple[bytes, list[int]]:
+    # The same functions moved by offset
+    eps = [ORG + 0x100 + offset + i * 0x40 for i in range(len(BODIES))]
+    parts = {0: b"".join(map(call, eps)) + jr(T, -2), 0x800: RET}
+    for ep, body in zip(eps, BODIES): parts[ep - ORG] = body
+    return image(0x1000, parts), eps
+
+def reference(rom_project):
+    rom, eps = revision(0)
+    proj = rom_project(rom)
+    for ep, name in zip(eps, NAMES): proj.rename_label(ep, name)
+    return proj
+
+def test_suggest(rom_project):
+    index = FingerprintIndex()
+    assert index.add_project(reference(rom_project)) == len(NAMES)
+
+    rom, eps = revision(0x200)
+    proj = rom_project(rom)
+    suggestions = index.suggest(proj)
+    assert [(s.ep, s.name, s.reason) for s in suggestions] == [(ep, name, "body") for ep, name in zip(eps, NAMES)]
+
+    assert index.apply(proj, suggestions) == len(NAMES)
+    assert [proj.ob.label(ep).name for ep in eps] == NAMES
+    # Named functions don't get suggestions anymore
+    assert index.suggest(proj) == []
+
+def test_add_project_again(rom_project):
+    index = FingerprintIndex()
+    proj = reference(rom_project)
+    index.add_project(proj)
+    index.add_project(proj)
+    assert len(index.entries) == len(NAMES)
+    assert sum(map(len, index.body.values())) == len(NAMES)
+
+def test_save_load(rom_project, tmp_path):
+    index = FingerprintIndex()
+    index.add_project(reference(rom_project))
+    path = tmp_path / "index.json"
+    index.save(path)
+
+    loaded = FingerprintIndex.load(path)
+    assert loaded.entries == index.entries
+    assert loaded.body == index.body
+    assert loaded.blocks == index.blocks
+    assert loaded.bands == index.bands
+
+    # Missing files and other versions give an empty index
+    assert FingerprintIndex.load(tmp_path / "missing.json").entries == []
+    path.write_text('{"version": 0, "entries": []}')
+    assert FingerprintIndex.load(path).entries == []
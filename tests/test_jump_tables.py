@@ -0,0 +1,67 @@
+from core.jump_tables import find_jump_tables
+from core.project import CodeSection
+from roms import ORG, RET, T, call, jr, ld_a, pointer, image
+
+JUMP = ORG + 0x100
+CALLS = ORG + 0x140
+JUMP_TABLE = ORG + 0x400
+CALL_TABLE = ORG + 0x440
+JUMP_TARGETS = [ORG + 0x200 + i * 0x10 for i in range(4)]
+CALL_TARGETS = [ORG + 0x300 + i * 0x10 for i in range(3)]
+
+def table_rom() -> bytes:
+    parts = {
+        0x000: call(JUMP) + call(CALLS) + jr(T, -2),
+        # LD XIX, table; LD XIX, (XIX+WA); JP T, XIX
+        0x100: bytes([0x44]) + pointer(JUMP_TABLE) + bytes([0xE3, 0x07, 0xF0, 0xE0, 0x24, 0xB4, 0xD8]),
+        # LDA XIY, table; ADD XIY, XWA; LD XIY, (XIY); CALL T, XIY; RET
+        0x140: bytes([0xF2]) + CALL_TABLE.to_bytes(3, "little") + bytes([0x35, 0xE8, 0x85, 0xA5, 0x25, 0xB5, 0xE8]) + RET,
+        0x400: b"".join(map(pointer, JUMP_TARGETS)),
+        0x440: b"".join(map(pointer, CALL_TARGETS)),
+    }
+    for i, target in enumerate(JUMP_TARGETS + CALL_TARGETS):
+        parts[target - ORG] = ld_a(i) + RET
+    return image(0x1000, parts)
+
+def test_find_jump_tables(rom_project):
+    proj = rom_project(table_rom(), analyze=False)
+    tables = []
+    for ep in (JUMP, CALLS):
+        blocks = list(proj.extract_function(ep).blocks.values())
+        proj.load_blocks(blocks)
+        tables.extend(find_jump_tables(proj, blocks))
+
+    jump, calls = tables
+    assert (jump.pc, jump.end, jump.targets, jump.call) == (JUMP + 0xA, JUMP + 0xC, JUMP_TARGETS, False)
+    # The table ends at the first entry that isn't a pointer
+    assert (calls.pc, calls.end, calls.targets, calls.call) == (CALLS + 0x9, CALLS + 0xB, CALL_TARGETS, True)
+
+def test_resolve_jump_tables(rom_project):
+    proj = rom_project(table_rom(), analyze=False)
+    assert not any(isinstance(proj.sections.floor(t), CodeSection) for t in JUMP_TARGETS + CALL_TARGETS)
+
+    found = []
+    proj.resolve_jump_tables(found.append)
+    assert found == [2]
+    assert proj.jump_tables == {JUMP + 0xA: JUMP_TARGETS, CALLS + 0x9: CALL_TARGETS}
+    for target in JUMP_TARGETS + CALL_TARGETS:
+        located = proj.locate(target)
+        assert located is not None and isinstance(located[0], CodeSection)
+    # Call table targets are functions, jump table targets are labels
+    assert all(t in proj.ob.calls for t in CALL_TARGETS)
+    assert not any(t in proj.ob.calls for t in JUMP_TARGETS)
+    assert proj.locate(CALLS + 0xB) is not None
+
+def test_resolve_jump_tables_discarded(rom_project):
+    proj = rom_project(table_rom(), analyze=False)
+    branches = list(proj.ob.branchlist)
+    calls = set(proj.ob.calls)
+
+    # Decoding fails and the error handler throws the new code away
+    proj.disassemble = lambda eps, cont, on_error: on_error(eps[0], cont, lambda: None)
+    found = []
+    proj.resolve_jump_tables(found.append, lambda pc, cont, close: close())
+    assert found == [0]
+    assert proj.jump_tables == {}
+    assert list(proj.ob.branchlist) == branches
+    assert proj.ob.calls == calls
@@ -0,0 +1,45 @@
+import random
+
+from core.nonoverlap import isotonic_decreasing, vertical_nonoverlap, ordered_nonoverlap
+
+def cost(values: list[float], fit: list[float]) -> float:
+    return sum((a - b) ** 2 for a, b in zip(values, fit))
+
+def test_isotonic_decreasing():
+    assert isotonic_decreasing([]) == []
+    assert isotonic_decreasing([3, 2, 1]) == [3, 2, 1]
+    assert isotonic_decreasing([1, 2, 3]) == [2, 2, 2]
+    assert isotonic_decreasing([5, 1, 3, 0]) == [5, 2, 2, 0]
+
+def test_isotonic_decreasing_optimal():
+    random.seed(1)
+    for _ in range(50):
+        values = [random.uniform(-10, 10) for _ in range(random.randrange(1, 12))]
+        fit = isotonic_decreasing(values)
+        assert all(a >= b - 1e-9 for a, b in zip(fit, fit[1:]))
+        # Moving any pool of equal values up or down only makes it worse
+        for delta in (-0.01, 0.01):
+            for i in range(len(fit)):
+                moved = [v + delta if abs(v - fit[i]) < 1e-9 else v for v in fit]
+                if all(a >= b - 1e-9 for a, b in zip(moved, moved[1:])):
+                    assert cost(values, moved) >= cost(values, fit) - 1e-9
+
+def test_vertical_nonoverlap():
+    assert vertical_nonoverlap([], []) == []
+    # Blocks that fit stay where they are
+    assert vertical_nonoverlap([100, 0], [50, 50]) == [100, 0]
+    # Two blocks that want the same place are pushed apart evenly
+    assert vertical_nonoverlap([0, 0], [20, 20]) == [10, -10]
+
+    random.seed(2)
+    ideal_y = [random.gauss(0, 40) for _ in range(200)]
+    heights = [random.choice((20, 50, 80)) for _ in ideal_y]
+    ys = vertical_nonoverlap(ideal_y, heights)
+    order = sorted(range(len(ys)), key=lambda i: -ideal_y[i])
+    for a, b in zip(order, order[1:]):
+        assert ys[b] <= ys[a] - heights[a] + 1e-6
+
+def test_ordered_nonoverlap():
+    xs = ordered_nonoverlap([0, 0, 0], [10, 10, 10], sep=2)
+    assert xs == [-12, 0, 12]
+    assert ordered_nonoverlap([0, 100], [10, 10]) == [0, 100]
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from core.signatures import BytePattern, SignatureSet, load_signatures
+
+def test_pattern_syntax():
+    assert BytePattern("3C 1F 00").bytes == [(0x3C, 0xFF), (0x1F, 0xFF), (0x00, 0xFF)]
+    assert BytePattern("3C1F00").bytes == BytePattern("3C 1F 00").bytes
+    assert BytePattern("?? F? ?F").bytes == [(0, 0), (0xF0, 0xF0), (0x0F, 0x0F)]
+    assert BytePattern("80&C0").bytes == [(0x80, 0xC0)]
+    assert BytePattern("0x3C 1 ?").bytes == [(0x3C, 0xFF), (0x01, 0xFF), (0, 0)]
+
+    for text in ("", "123", "GG"):
+        with pytest.raises(ValueError): BytePattern(text)
+
+def test_wildcards():
+    buffer = bytearray(bytes.fromhex("00 3C 12 F5 84 3C 13 0F C4"))
+    assert [o for o, _ in SignatureSet([BytePattern("3C ?? F? 80&C0")]).search(buffer)] == [1]
+    assert [o for o, _ in SignatureSet([BytePattern("3C 1? ?F")]).search(buffer)] == [5]
+
+def test_overlapping_matches():
+    a = BytePattern("AA AA", "a")
+    b = BytePattern("AA ?? BB", "b")
+    c = BytePattern("?? BB", "c")
+    buffer = bytearray(bytes.fromhex("AA AA AA BB"))
+    res = [(o, str(p)) for o, p in SignatureSet([a, b, c]).search(buffer)]
+    # Every pattern is reported at every offset it matches, also where they overlap
+    assert sorted(res) == [(0, "a"), (1, "a"), (1, "b"), (2, "c")]
+
+def test_ranges():
+    signatures = SignatureSet()
+    signatures.add("AA AA", "a")
+    buffer = bytearray(bytes.fromhex("AA AA AA AA"))
+    # A match has to lie completely inside of a range
+    assert [o for o, _ in signatures.search(buffer, [(0, 3)])] == [0, 1]
+    assert [o for o, _ in signatures.search(buffer, [(1, 2), (2, 4)])] == [2]
+
+    # The combined regex follows patterns that are added later
+    signatures.add("AA AA AA", "b")
+    assert len(signatures.search(buffer)) == 5
+
+def test_load(tmp_path):
+    path = tmp_path / "signatures.json"
+    path.write_text(json.dumps({"memcpy": "3C ?? 0E"}))
+    signatures = load_signatures(path)
+    assert [str(p) for p in signatures.patterns] == ["memcpy"]
+    assert len(signatures.patterns[0]) == 3
@@ -0,0 +1,41 @@
+import pytest
+
+from core.sorted_map import SortedMap
+
+def test_build_and_lookup():
+    m = SortedMap([(30, "c"), (10, "a"), (20, "b"), (10, "A")])
+    assert list(m) == [10, 20, 30]
+    assert m.values() == ["A", "b", "c"]
+    assert m[20] == "b"
+    assert 20 in m and 25 not in m
+    assert m.get(25) is None and m.get(25, "x") == "x"
+    with pytest.raises(KeyError): m[25]
+
+def test_set_and_delete():
+    m = SortedMap[str]()
+    for k in (5, 1, 3): m[k] = str(k)
+    m[3] = "three"
+    assert list(m.items()) == [(1, "1"), (3, "three"), (5, "5")]
+    del m[1]
+    assert m.keys() == [3, 5]
+    with pytest.raises(KeyError): del m[1]
+
+def test_neighbours():
+    m = SortedMap([(10, "a"), (20, "b"), (30, "c")])
+    assert m.floor(9) is None
+    assert m.floor(10) == "a" and m.floor(29) == "b"
+    assert m.floor_index(9) == -1 and m.floor_index(30) == 2
+    assert m.higher(10) == "b" and m.higher(30) is None
+    assert m.range(10, 30) == ["a", "b"]
+    assert m.range(11, 31) == ["b", "c"]
+
+def test_splice():
+    m = SortedMap([(10, "a"), (20, "b"), (30, "c"), (40, "d")])
+    m.splice(20, 40, [(35, "y"), (25, "x")])
+    assert list(m.items()) == [(10, "a"), (25, "x"), (35, "y"), (40, "d")]
+    m.splice(0, 100, [])
+    assert len(m) == 0
+
+    # New items have to fit between the entries that are kept
+    m = SortedMap([(10, "a"), (20, "b"), (30, "c")])
+    with pytest.raises(AssertionError): m.splice(20, 30, [(5, "x")])
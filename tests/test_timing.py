@@ -0,0 +1,62 @@
+from roms import ORG, RET, T, NZ, call, jr, ld_a, image
+
+LOOP = ORG + 0x100
+SELF = ORG + 0x200
+A = ORG + 0x300
+B = ORG + 0x400
+TOP = ORG + 0x500
+
+def build(rom_project):
+    return rom_project(image(0x1000, {
+        0x000: call(TOP) + jr(T, -2),
+        0x100: ld_a(1) + jr(NZ, -4) + RET, # Loop back to its own entry
+        0x200: call(SELF) + RET,
+        0x300: call(B) + RET,
+        0x400: ld_a(2) + call(A) + RET,
+        0x500: call(LOOP) + call(SELF) + call(A) + RET,
+    }))
+
+def cycles(proj, ep: int) -> int:
+    return sum(block.cycles for block in proj.functions[ep].blocks.values())
+
+def test_loop_bound(rom_project):
+    proj = build(rom_project)
+    fun = proj.functions[LOOP]
+    header, exit = fun.blocks[LOOP].cycles, fun.blocks[LOOP + 4].cycles
+
+    timing = proj.wcet(fun)
+    assert timing.unbounded == [LOOP]
+    assert timing.wcet == header + exit
+    assert str(timing) == f">= {header + exit}"
+
+    proj.set_loop_bound(LOOP, 10)
+    timing = proj.wcet(fun)
+    assert timing.bounded
+    assert timing.wcet == 10 * header + exit
+    assert str(timing) == str(10 * header + exit)
+
+def test_recursion(rom_project):
+    proj = build(rom_project)
+
+    timing = proj.wcet(proj.functions[SELF])
+    assert timing.unbounded == [SELF]
+    assert timing.wcet == cycles(proj, SELF)
+
+    # Mutual recursion is cut off where it gets back to the function it started from
+    for ep, other in ((A, B), (B, A)):
+        proj.functions[A].timing = proj.functions[B].timing = None
+        timing = proj.wcet(proj.functions[ep])
+        assert timing.unbounded == [ep]
+        assert timing.wcet == cycles(proj, A) + cycles(proj, B)
+
+def test_callers(rom_project):
+    proj = build(rom_project)
+    proj.set_loop_bound(LOOP, 10)
+    timing = proj.wcet(proj.functions[TOP])
+    assert set(timing.unbounded) == {SELF, A}
+    assert timing.wcet == (cycles(proj, TOP) + proj.wcet(proj.functions[LOOP]).wcet
+        + cycles(proj, SELF) + cycles(proj, A) + cycles(proj, B))
+
+    # Removing the bound drops the cached estimates of the callers as well
+    proj.set_loop_bound(LOOP, None)
+    assert LOOP in proj.wcet(proj.functions[TOP]).unbounded
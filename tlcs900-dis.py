@@ -1,6 +1,8 @@
 import codecs
 import getopt
 import io
+import json
+import multiprocessing
 import os
 import shutil
 import sys
@@ -69,6 +71,55 @@ Options:
 
         Will not output any branching or label information.
 
+    -b, --batch <manifest>:
+        Disassembles all images listed in a JSON manifest instead of a
+        single input file. The manifest is a list of objects:
+            {"rom": <path>, "output": <path>,
+             "org": <entry_point>, "start": [<start>, ...], "range": [<start>, <end>]}
+        "org", "start" and "range" are optional, numbers may be given as
+        strings like "0xF00000". Relative paths are resolved against the
+        folder of the manifest. The other options apply to every image.
+
+    -j, --jobs <n>:
+        Number of worker processes for --batch, defaults to the number of CPUs.
+        Workers load the decoder once and are recycled after a few images
+        to keep the memory usage bounded.
+
+Project options, these work on a project folder saved by the GUI instead
+of an input file:
+
+    -p, --project <folder>:
+        Opens a project (.disproj) folder.
+
+    --signatures <file>:
+        Searches the project for byte signatures and prints every match.
+        The file is a JSON object of name -> pattern, patterns are hex bytes
+        with ?? as wildcard, see core/signatures.py.
+
+    --in <code|data>:
+        Only searches code or data sections with --signatures.
+
+    --diff <folder>:
+        Compares the functions of an older revision of the firmware with
+        the project and prints the modified, added and removed ones.
+
+    --carry-labels:
+        Copies the names of matched functions and labels from the project
+        given to --diff and saves the project.
+
+    --fingerprints <file>:
+        Index of the named functions of other projects, used to suggest
+        names for the functions of the project that still have default
+        names. The suggestions are printed with their score.
+
+    --reference <folder>:
+        Adds the named functions of a project to the --fingerprints index
+        and saves it. Can be given more than once, works without --project.
+
+    --apply-names:
+        Renames the functions to the names suggested by --fingerprints
+        and saves the project.
+
 
 The following options are enabled by default:
 
@@ -87,10 +138,315 @@ The following options are enabled by default:
 
 from disapi import InputBuffer, OutputBuffer, InsnPool, Insn, Label, insnentry_to_str
 
+# Number of images a batch worker processes before it is replaced
+IMAGES_PER_WORKER = 16
+# Names the special function registers
+MICROCONTROLLER = "TMP91C016"
+
+# Helper function to decode db statements
+def decode_db(buffer, encoding):
+
+    # Replace unprintable ascii characters with dots
+    if encoding == "ascii":
+        for i, v in enumerate(buffer):
+            if v < 0x20 or v > 0x7E:
+                buffer[i] = 0x2E
+        return buffer.decode("ascii")
+
+    # Else we go with a more general escape sequence
+    # This might not align perfectly, more codecs aren't
+    # supported as of now.
+    # TODO: Support more codecs, do ascii replace for derived encodings as well
+
+    buffer = buffer.decode(encoding, "replace") \
+        .replace("\0", ".") \
+        .replace("\n", ".") \
+        .replace("\r", ".") \
+        .replace("\a", ".") \
+        .replace("\t", ".") \
+        .replace("\uFFFD", ".")
+
+    return buffer
+
+# Disassembles a single image and writes it line by line to output, returns the number of instructions
+def disassemble(inputfile, output, bounds, entry_point, start_points, encoding = "ascii",
+                labels = True, branches = True, raw = False) -> int:
+    
+    file_len = os.path.getsize(inputfile)
+
+    with io.open(inputfile, 'rb') as f:
+        ib = InputBuffer(f, file_len, bounds, entry_point, microcontroller=microc.load_microcontroller(MICROCONTROLLER))
+        ob = OutputBuffer(None)
+
+        from tcls_900 import tlcs_900 as proc
+
+        pool = InsnPool(proc)
+        for sp in start_points:
+            insn = Insn(pool, ib, ob, sp)
+            pool.query(insn)
+
+    pool.poll_all()
+
+    if labels:
+        ob.compute_labels(entry_point, file_len + entry_point)  # Labels aren't computed by default
+
+    if not raw:
+        output("Result: ")
+        output("=" * (shutil.get_terminal_size((30, 0))[0] - 1))
+
+        # Labels
+        if labels:
+            output("\nLabels:\n")
+            output(", ".join(sorted(map(Label.to_str, ob.labels.values()))))
+
+        # Branches
+        if branches:
+            output("\nBranches:\n")
+            output(", ".join(map(str, ob.branchlist)))
+
+        # Instructions
+        output("\nInstructions:\n")
+
+    if entry_point != 0:
+        output("\t.org " + format(entry_point, "x") + "h")
+
+    # Padding for byte numbers
+    padding = len(str(file_len))
+
+    def output_db(nxt, last):
+        diff = nxt - last
+        if diff < 1: return
+
+        output("; Data Section at " + format(last, "X") + ": ")
+        while diff > 0:
+            i = nxt - diff
+            i2 = min(i + 7, nxt)
+            b = ib.buffer[i - entry_point:i2 - entry_point]
+
+            if not raw:
+                dstr = " ".join([format(i, "0>2X") for i in b])
+                # Decode and replace garbage sequences with dots
+                decoded = decode_db(b, encoding)
+                output("\t\t" + format(i, "X").ljust(padding) + ": " + dstr.ljust(20) + " | .db \"" + decoded + "\"")
+            else:
+                # In raw mode output actual hex codes
+                dstr = ", ".join([format(i, "0>2x") + "h" for i in b])
+                output("\t.db " + dstr)
+
+            diff -= 7
+
+    count = 0
+    last = entry_point
+    for k, v in sorted(ob.insnmap.items()):
+        # Fill with db statements
+        output_db(v[0].pc, last)
+
+        output("; Section at " + format(k, "X") + ": ")
+
+        for i in range(0, len(v)):
+            v2 = v[i]
+            #Label if present
+            label = ob.label(v2.pc)
+
+            if not raw:
+                if label is not None:
+                    output("\t" + str(label) + ":")
+
+                output("\t\t" + format(v2.pc, "X").ljust(padding) + ": " + " ".join([format(i, "0>2X") for i in v2.bytes(ib)]).ljust(20) + " | " + insnentry_to_str(v2, ob))
+            else:
+                if label is not None:
+                    output((str(label) + ": ").ljust(12) + insnentry_to_str(v2, ob))
+                else:
+                    output("".ljust(12) + insnentry_to_str(v2, ob))
+
+        count += len(v)
+        last = v2.pc + v2.length
+
+    if len(bounds) == 2:
+        end = bounds[1] - bounds[0]
+    elif len(bounds) == 1:
+        end = file_len - bounds[0]
+    else: end = file_len
+    output_db(min(file_len, end) + entry_point, last)
+
+    return count
+
+def parse_int(value) -> int:
+    return value if isinstance(value, int) else int(value, 0)
+
+def read_manifest(path) -> list[dict]:
+    with io.open(path, "r") as fp:
+        manifest = json.load(fp)
+
+    folder = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for i, entry in enumerate(manifest):
+        if "rom" not in entry or "output" not in entry:
+            raise ValueError(f"Manifest entry {i} needs a rom and an output")
+        org = parse_int(entry.get("org", 0))
+        start = entry.get("start", org)
+        start = list(map(parse_int, start if isinstance(start, list) else [start]))
+        if any(sp < org for sp in start):
+            raise ValueError(f"Manifest entry {i}: start address must be greater or equal to the entry point")
+        jobs.append({
+            "rom": os.path.join(folder, entry["rom"]),
+            "output": os.path.join(folder, entry["output"]),
+            "org": org,
+            "start": start,
+            "range": list(map(parse_int, entry.get("range", [])))
+        })
+    return jobs
+
+# Runs once per worker process, the decoder state is reused for every image it processes
+def init_worker():
+    microc.load_microcontroller(MICROCONTROLLER)
+    from tcls_900 import tlcs_900
+
+def run_job(args) -> tuple[str, float, int, str | None]:
+    job, encoding, labels, branches, raw = args
+    start = time.perf_counter()
+    try:
+        if not os.path.isfile(job["rom"]):
+            raise FileNotFoundError("Input file does not exist")
+        with io.open(job["output"], "w") as fp:
+            def output(*args):
+                fp.write(" ".join(args) + "\n")
+            count = disassemble(job["rom"], output, job["range"], job["org"], job["start"], encoding, labels, branches, raw)
+    except Exception as e:
+        return job["rom"], time.perf_counter() - start, 0, f"{type(e).__name__}: {e}"
+    return job["rom"], time.perf_counter() - start, count, None
+
+def run_batch(manifest, jobs, encoding, labels, branches, raw, timer) -> int:
+    try:
+        images = read_manifest(manifest)
+    except (OSError, ValueError) as e:
+        print("Invalid manifest: " + str(e), file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    failed = 0
+    total = 0
+    args = [(job, encoding, labels, branches, raw) for job in images]
+    # Results are streamed back, the listings only ever live in the worker that writes them
+    with multiprocessing.Pool(jobs, initializer=init_worker, maxtasksperchild=IMAGES_PER_WORKER) as pool:
+        for rom, elapsed, count, error in pool.imap_unordered(run_job, args):
+            if error is not None:
+                failed += 1
+                print(f"FAILED {rom}: {error}")
+            else:
+                total += count
+                print(f"{rom}: {count} instructions" + (f" in {elapsed:.3f} seconds" if timer else ""))
+
+    print(f"; {len(images) - failed} of {len(images)} images done, {total} instructions" +
+        (f" in {time.perf_counter() - start:.3f} seconds." if timer else "."))
+    return 1 if failed else 0
+
+def run_signatures(project, path, kind) -> int:
+    from core.signatures import load_signatures
+
+    try:
+        signatures = load_signatures(path)
+    except (OSError, ValueError) as e:
+        print("Invalid signatures: " + str(e), file=sys.stderr)
+        return 1
+
+    matches = project.search_signatures(signatures, kind=kind)
+    for pc, pattern in matches:
+        label = project.ob.label(pc)
+        print(format(pc, "X") + ": " + pattern.name + (" (" + str(label) + ")" if label is not None else ""))
+    print(f"; {len(matches)} matches for {len(signatures.patterns)} signatures.")
+    return 0
+
+def run_diff(project, old, carry_labels) -> int:
+    from core.diff import ProjectDiff
+
+    try:
+        diff = ProjectDiff(old, project)
+    except ValueError as e:
+        print("Can't diff projects: " + str(e), file=sys.stderr)
+        return 1
+    for line in diff.report():
+        print(line)
+    if carry_labels:
+        renamed = diff.carry_labels()
+        if renamed: project.write_to_file(project.project_folder)
+        print(f"; {renamed} labels carried over.")
+    return 0
+
+def run_fingerprints(project, path, references, apply_names) -> int:
+    from pathlib import Path
+    from core.fingerprint import FingerprintIndex
+
+    index = FingerprintIndex.load(Path(path))
+    if references:
+        for folder in references:
+            reference = read_project(folder)
+            if reference is None: return 1
+            try:
+                print(f"{folder}: {index.add_project(reference)} named functions")
+            except ValueError as e:
+                print("Can't index " + folder + ": " + str(e), file=sys.stderr)
+                return 1
+        index.save(Path(path))
+
+    if project is None: return 0
+    try:
+        suggestions = index.suggest(project)
+    except ValueError as e:
+        print("Can't suggest names: " + str(e), file=sys.stderr)
+        return 1
+    for suggestion in suggestions:
+        print(suggestion)
+    if apply_names:
+        renamed = index.apply(project, suggestions)
+        if renamed: project.write_to_file(project.project_folder)
+        print(f"; {renamed} functions renamed.")
+    return 0
+
+def read_project(folder):
+    from pathlib import Path
+    from core.project import Project, ProjectLoadException
+
+    try:
+        return Project.read_from_file(Path(folder))
+    except (ProjectLoadException, OSError) as e:
+        print("Can't open project " + folder + ": " + str(e), file=sys.stderr)
+        return None
+
+def run_project(folder, signatures = None, sections = None, diff = None, carry_labels = False,
+                fingerprints = None, references = None, apply_names = False) -> int:
+    from core.project import CodeSection, DataSection
+
+    project = None
+    if folder is not None:
+        project = read_project(folder)
+        if project is None: return 1
+
+    if signatures is not None:
+        kind = {"code": CodeSection, "data": DataSection}.get(sections)
+        if run_signatures(project, signatures, kind): return 1
+    if diff is not None:
+        old = read_project(diff)
+        if old is None: return 1
+        if run_diff(project, old, carry_labels): return 1
+    if fingerprints is not None:
+        if run_fingerprints(project, fingerprints, references, apply_names): return 1
+    return 0
+
 def main():
     # Command line arguments
     INPUTFILE   = None      # Input file, required
     OUTPUTFILE  = None      # Output file, optional if not silent
+    MANIFEST    = None      # Batch manifest, replaces the input file
+    PROJECT     = None      # Project folder, replaces the input file
+    SIGNATURES  = None      # Signature file to search the project for
+    SECTIONS    = None      # Kind of sections to search, code or data
+    DIFF        = None      # Older revision of the project to compare with
+    CARRY       = False     # Copies the labels of the older revision
+    FINGERPRINTS = None     # Fingerprint index to suggest function names from
+    REFERENCES  = []        # Projects to add to the fingerprint index
+    APPLY       = False     # Renames the functions to the suggested names
+    JOBS        = None      # Number of batch workers
     SILENT      = False     # Disables _stdout
     BOUNDS      = []        # Section to disassemble, defaults to entire file
     ENTRY_POINT = 0         # Equivalent to the .org directive, for alignment
@@ -104,9 +460,11 @@ def main():
     try:
         opts, args = getopt.gnu_getopt(
             args = sys.argv,
-            shortopts = "hsr:i:o:e:",
+            shortopts = "hsr:i:o:e:b:j:p:",
             longopts = ["ifile=","ofile=", "help", "encoding", "range", "start=", 
-                        "silent", "entry", "org=", "no-labels", "no-branches", "no-timer", "raw"])
+                        "silent", "entry", "org=", "no-labels", "no-branches", "no-timer", "raw",
+                        "batch=", "jobs=", "project=", "signatures=", "in=", "diff=", "carry-labels",
+                        "fingerprints=", "reference=", "apply-names"])
 
     except getopt.GetoptError as err:
         print_help()
@@ -136,6 +494,33 @@ def main():
             INPUTFILE = arg
         elif opt in ("-o", "--ofile"):
             OUTPUTFILE = arg
+        elif opt in ("-b", "--batch"):
+            MANIFEST = arg
+        elif opt in ("-j", "--jobs"):
+            try:
+                JOBS = int(arg)
+            except ValueError:
+                print("Invalid number of jobs specified.")
+                sys.exit(1)
+        elif opt in ("-p", "--project"):
+            PROJECT = arg
+        elif opt == "--signatures":
+            SIGNATURES = arg
+        elif opt == "--in":
+            if arg not in ("code", "data"):
+                print("Invalid section kind specified, must be code or data.")
+                sys.exit(1)
+            SECTIONS = arg
+        elif opt == "--diff":
+            DIFF = arg
+        elif opt == "--carry-labels":
+            CARRY = True
+        elif opt == "--fingerprints":
+            FINGERPRINTS = arg
+        elif opt == "--reference":
+            REFERENCES.append(arg)
+        elif opt == "--apply-names":
+            APPLY = True
         elif opt == "--encoding":
             try:
                 codecs.lookup(arg)
@@ -154,6 +539,25 @@ def main():
         else:
             print_help()
 
+    if MANIFEST is not None:
+        if not os.path.isfile(MANIFEST):
+            print("Manifest \"" + MANIFEST + "\" does not exist.", file=sys.stderr)
+            sys.exit(1)
+        if SILENT:
+            sys.stdout = open(os.devnull, 'a')
+        try:
+            sys.exit(run_batch(MANIFEST, JOBS, ENCODING, LABELS, BRANCHES, RAW, TIMER))
+        except KeyboardInterrupt:
+            print("\n! Received keyboard interrupt, quitting workers.\n")
+            sys.exit(1)
+
+    if PROJECT is None and (SIGNATURES is not None or DIFF is not None):
+        print("You must provide a project with [-p <folder>]", file=sys.stderr)
+        sys.exit(1)
+
+    if PROJECT is not None or FINGERPRINTS is not None:
+        sys.exit(run_project(PROJECT, SIGNATURES, SECTIONS, DIFF, CARRY, FINGERPRINTS, REFERENCES, APPLY))
+
     if INPUTFILE is None:
         print("You must provide an input file with [-i <inputfile>]", file=sys.stderr)
         sys.exit(1)
@@ -180,52 +584,10 @@ def main():
         # Silent flag overrides print to do nothing
         sys.stdout = open(os.devnull, 'a')
 
-    # Helper function to decode db statements
-    def decode_db(buffer):
-
-        # Replace unprintable ascii characters with dots
-        if ENCODING == "ascii":
-            for i, v in enumerate(buffer):
-                if v < 0x20 or v > 0x7E:
-                    buffer[i] = 0x2E
-            return buffer.decode("ascii")
-
-        # Else we go with a more general escape sequence
-        # This might not align perfectly, more codecs aren't
-        # supported as of now.
-        # TODO: Support more codecs, do ascii replace for derived encodings as well
-
-        buffer = buffer.decode(ENCODING, "replace") \
-            .replace("\0", ".") \
-            .replace("\n", ".") \
-            .replace("\r", ".") \
-            .replace("\a", ".") \
-            .replace("\t", ".") \
-            .replace("\uFFFD", ".")
-
-        return buffer
-
     try:
-        file_len = os.path.getsize(INPUTFILE)
-
         if TIMER:
             start = time.time()
 
-        microc.load_microcontroller("TMP91C016")
-
-        with io.open(INPUTFILE, 'rb') as f:
-            ib = InputBuffer(f, file_len, BOUNDS, ENTRY_POINT)
-            ob = OutputBuffer(OUTPUTFILE)
-
-            from tcls_900 import tlcs_900 as proc
-
-            pool = InsnPool(proc)
-            for sp in START_POINT:
-                insn = Insn(pool, ib, ob, sp)
-                pool.query(insn)
-
-        pool.poll_all()
-
         if OUTPUTFILE is not None:
             f2: TextIO = io.open(OUTPUTFILE, 'w')
 
@@ -235,85 +597,7 @@ def main():
         else:
             output = print
 
-        if LABELS:
-            ob.compute_labels(ENTRY_POINT, file_len + ENTRY_POINT)  # Labels aren't computed by default
-
-        if not RAW:
-            output("Result: ")
-            output("=" * (shutil.get_terminal_size((30, 0))[0] - 1))
-
-            # Labels
-            if LABELS:
-                output("\nLabels:\n")
-                output(", ".join(sorted(map(Label.to_str, ob.labels.values()))))
-
-            # Branches
-            if BRANCHES:
-                output("\nBranches:\n")
-                output(", ".join(map(str, ob.branchlist)))
-
-            # Instructions
-            output("\nInstructions:\n")
-
-        if ENTRY_POINT != 0:
-            output("\t.org " + format(ENTRY_POINT, "x") + "h")
-
-        # Padding for byte numbers
-        padding = len(str(file_len))
-
-        def output_db(nxt, last):
-            diff = nxt - last
-            if diff < 1: return
-
-            output("; Data Section at " + format(last, "X") + ": ")
-            while diff > 0:
-                i = nxt - diff
-                i2 = min(i + 7, nxt)
-                b = ib.buffer[i - ENTRY_POINT:i2 - ENTRY_POINT]
-
-                if not RAW:
-                    dstr = " ".join([format(i, "0>2X") for i in b])
-                    # Decode and replace garbage sequences with dots
-                    decoded = decode_db(b)
-                    output("\t\t" + format(i, "X").ljust(padding) + ": " + dstr.ljust(20) + " | .db \"" + decoded + "\"")
-                else:
-                    # In raw mode output actual hex codes
-                    dstr = ", ".join([format(i, "0>2x") + "h" for i in b])
-                    output("\t.db " + dstr)
-
-                diff -= 7
-
-        last = ENTRY_POINT
-        for k, v in sorted(ob.insnmap.items()):
-            # Fill with db statements
-            output_db(v[0].pc, last)
-
-            output("; Section at " + format(k, "X") + ": ")
-
-            for i in range(0, len(v)):
-                v2 = v[i]
-                #Label if present
-                label = ob.label(v2.pc)
-
-                if not RAW:
-                    if label is not None:
-                        output("\t" + str(label) + ":")
-
-                    output("\t\t" + format(v2.pc, "X").ljust(padding) + ": " + " ".join([format(i, "0>2X") for i in v2.bytes(ib)]).ljust(20) + " | " + insnentry_to_str(v2, ob))
-                else:
-                    if label is not None:
-                        output((str(label) + ": ").ljust(12) + insnentry_to_str(v2, ob))
-                    else:
-                        output("".ljust(12) + insnentry_to_str(v2, ob))
-
-            last = v2.pc + v2.length
-
-        if len(BOUNDS) == 2:
-            end = BOUNDS[1] - BOUNDS[0]
-        elif len(BOUNDS) == 1:
-            end = file_len - BOUNDS[0]
-        else: end = file_len
-        output_db(min(file_len, end) + ENTRY_POINT, last)
+        disassemble(INPUTFILE, output, BOUNDS, ENTRY_POINT, START_POINT, ENCODING, LABELS, BRANCHES, RAW)
 
         if TIMER:
             end = round(time.time() - start, 3)
@@ -326,4 +610,4 @@ def main():
         print("\n! Received keyboard interrupt, quitting threads.\n")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,54 @@
+# Benchmark for the call graph block placement, run with python -m tools.bench_call_graph
+# Compares against cvxpy if it is installed.
+import random, time
+
+from core.nonoverlap import vertical_nonoverlap
+
+BOX_HEIGHT = 20
+
+def fan_out(n: int) -> tuple[list[float], list[float]]:
+    # Blocks of a hub function, most of them with a few functions that all want to sit at the same height
+    ideal_y, heights = [], []
+    for _ in range(n):
+        count = random.choice((1, 1, 1, 2, 3, 8))
+        ideal_y.append(random.gauss(0, 50 * n ** 0.5))
+        heights.append(float(count * (BOX_HEIGHT + 10) + 20))
+    return ideal_y, heights
+
+def check(ideal_y: list[float], heights: list[float], ys: list[float]):
+    order = sorted(range(len(ys)), key=lambda i: -ideal_y[i])
+    for a, b in zip(order, order[1:]):
+        assert ys[b] <= ys[a] - heights[a] + 1e-6, "Blocks overlap"
+
+def reference(ideal_y: list[float], heights: list[float]) -> list[float] | None:
+    try:
+        import cvxpy as cp
+    except ImportError:
+        return None
+    order = sorted(range(len(ideal_y)), key=lambda i: -ideal_y[i])
+    y = cp.Variable(len(order))
+    objective = cp.Minimize(cp.sum_squares(y - [ideal_y[i] for i in order]))
+    constraints = [y[i] <= y[i - 1] - heights[order[i - 1]] for i in range(1, len(order))]
+    cp.Problem(objective, constraints).solve(solver=cp.OSQP)
+    res = [0.0] * len(order)
+    for i, v in zip(order, y.value): # type: ignore
+        res[i] = float(v)
+    return res
+
+def main():
+    random.seed(0)
+    for n in (10, 100, 1000, 10000, 100000):
+        ideal_y, heights = fan_out(n)
+        start = time.perf_counter()
+        ys = vertical_nonoverlap(ideal_y, heights)
+        elapsed = time.perf_counter() - start
+        check(ideal_y, heights, ys)
+
+        line = f"{n:>7} blocks: {elapsed * 1000:9.3f} ms"
+        if n <= 1000 and (ref := reference(ideal_y, heights)) is not None:
+            error = max(abs(a - b) for a, b in zip(ys, ref))
+            line += f", max deviation from cvxpy {error:.3f}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import math
 
-from typing import cast
+from typing import Iterable, cast
 from functools import cache
 from dataclasses import dataclass
 
@@ -16,7 +16,7 @@ def clear_cache():
 
 from . import main
 from .kivytypes import KWidget
-from .project import Section, CodeSection, get_jump_location
+from core.project import Section, CodeSection, get_jump_location
 from .main import LABEL_HEIGHT, app, FONT_HEIGHT
 from disapi import Loc
 
@@ -84,6 +84,98 @@ class Arrow:
     def __str__(self):
         return f"{self.start:X} -> {self.end:X}"
 
+# Arrows of the jumps in the sections and the column each of them is drawn in
+def layout_arrows(sections: Iterable[Section]) -> tuple[list[Arrow], dict[Arrow, int]]:
+    arrows : list[Arrow] = []
+    for section in sections:
+        if not isinstance(section, CodeSection): continue
+        for insn in section.instructions:
+            location = get_jump_location(insn)
+            
+            cond = False
+            if (insn.entry.opcode == "JR" or insn.entry.opcode == "JRL" or 
+                (insn.entry.opcode == "JP" and len(insn.entry.instructions) == 2)):
+                cc = insn.entry.instructions[0]
+                if cc == "F": continue
+                elif cc != "T": cond = True
+            elif insn.entry.opcode == "DJNZ": 
+                cond = True
+
+            if not location: continue
+            arrows.append(Arrow(min(insn.entry.pc, location.loc), max(insn.entry.pc, location.loc), insn.entry.pc < location.loc, [], cond))
+
+    arrows = sorted(arrows, key = lambda x: x.start)
+    
+    arrows2: list[Arrow] = []
+    active_arrows: list[Arrow] = []
+    for a1 in arrows:
+        active_arrows = list(filter(lambda a: a.end >= a1.start, active_arrows))
+
+        for a in active_arrows:
+            if a.cond == a1.cond:
+                if a.end == a1.end and a.direction == a1.direction == True:
+                    a.tips.append(a1.start)
+                    a.start = min(a1.start, a.start)
+                    break
+                elif a.start == a1.start and a.direction == a1.direction == False:
+                    a.tips.append(a1.end)
+                    a.end = max(a1.end, a.end)
+                    break
+        else:
+            arrows2.append(a1)
+            
+        active_arrows.append(a1)
+
+    arrows = arrows2
+
+    arrow_offsets: dict[Arrow, int] = {}
+    active_arrows = []
+    for a1 in arrows:
+        l = len(active_arrows)
+        #if l > 0:
+        #    mn = active_arrows[-1].end
+        #else: mn = 0
+        mn = a1.start
+        
+        filtered = []
+        width = 0
+        i = l - 1
+        while i >= 0:
+            cur = active_arrows[i]
+            w = arrow_offsets.get(cur, 0)
+            if cur.end >= mn:
+                if w >= width:
+                    filtered.append(cur) 
+                    width = w
+
+                mn = min(mn, cur.start)
+            i -= 1
+
+        active_arrows = list(reversed(filtered))
+        active_offsets = set(map(lambda x: arrow_offsets.get(x, 0), active_arrows))
+        max_offset = max(active_offsets, default = 0)
+
+        last_offset = arrow_offsets.get(active_arrows[-1], 0) if len(active_arrows) > 0 else 0
+        if last_offset == 0:
+            for a in reversed(active_arrows):
+                next = arrow_offsets.get(a, 0)
+                if next + 1 > MAX_OFFSET:
+                    arrow_offsets[a] = -1
+                    break
+
+                if next < 0: continue
+                if next + 1 not in active_offsets and next <= max_offset:
+                    arrow_offsets[a] = next + 1
+                    break
+
+                arrow_offsets[a] = next + 1
+                active_offsets.add(next + 1)
+        
+        arrow_offsets[a1] = 0
+        active_arrows.append(a1)
+        
+    return list(arrows), arrow_offsets
+
 class ArrowRenderer(KWidget, Widget):
     parent: "main.ListingPanel"
 
@@ -99,96 +191,8 @@ class ArrowRenderer(KWidget, Widget):
         Clock.schedule_once(lambda dt: self.redraw(), 0)
 
     def recompute_arrows(self):
-        arrows : list[Arrow] = []
-        for section in self.parent.get_sections():
-            if not isinstance(section, CodeSection): continue
-            for insn in section.instructions:
-                location = get_jump_location(insn)
-                
-                cond = False
-                if (insn.entry.opcode == "JR" or insn.entry.opcode == "JRL" or 
-                    (insn.entry.opcode == "JP" and len(insn.entry.instructions) == 2)):
-                    cc = insn.entry.instructions[0]
-                    if cc == "F": continue
-                    elif cc != "T": cond = True
-                elif insn.entry.opcode == "DJNZ": 
-                    cond = True
-
-                if not location: continue
-                arrows.append(Arrow(min(insn.entry.pc, location.loc), max(insn.entry.pc, location.loc), insn.entry.pc < location.loc, [], cond))
-
-        arrows = sorted(arrows, key = lambda x: x.start)
-        
-        arrows2: list[Arrow] = []
-        active_arrows: list[Arrow] = []
-        for a1 in arrows:
-            active_arrows = list(filter(lambda a: a.end >= a1.start, active_arrows))
-
-            for a in active_arrows:
-                if a.cond == a1.cond:
-                    if a.end == a1.end and a.direction == a1.direction == True:
-                        a.tips.append(a1.start)
-                        a.start = min(a1.start, a.start)
-                        break
-                    elif a.start == a1.start and a.direction == a1.direction == False:
-                        a.tips.append(a1.end)
-                        a.end = max(a1.end, a.end)
-                        break
-            else:
-                arrows2.append(a1)
-                
-            active_arrows.append(a1)
-
-        arrows = arrows2
-
-        arrow_offsets: dict[Arrow, int] = {}
-        active_arrows = []
-        for a1 in arrows:
-            l = len(active_arrows)
-            #if l > 0:
-            #    mn = active_arrows[-1].end
-            #else: mn = 0
-            mn = a1.start
-            
-            filtered = []
-            width = 0
-            i = l - 1
-            while i >= 0:
-                cur = active_arrows[i]
-                w = arrow_offsets.get(cur, 0)
-                if cur.end >= mn:
-                    if w >= width:
-                        filtered.append(cur) 
-                        width = w
-
-                    mn = min(mn, cur.start)
-                i -= 1
-
-            active_arrows = list(reversed(filtered))
-            active_offsets = set(map(lambda x: arrow_offsets.get(x, 0), active_arrows))
-            max_offset = max(active_offsets, default = 0)
-
-            last_offset = arrow_offsets.get(active_arrows[-1], 0) if len(active_arrows) > 0 else 0
-            if last_offset == 0:
-                for a in reversed(active_arrows):
-                    next = arrow_offsets.get(a, 0)
-                    if next + 1 > MAX_OFFSET:
-                        arrow_offsets[a] = -1
-                        break
-
-                    if next < 0: continue
-                    if next + 1 not in active_offsets and next <= max_offset:
-                        arrow_offsets[a] = next + 1
-                        break
-
-                    arrow_offsets[a] = next + 1
-                    active_offsets.add(next + 1)
-            
-            arrow_offsets[a1] = 0
-            active_arrows.append(a1)
-            
-        self.arrows = list(arrows)
-        self.arrow_offsets = arrow_offsets
+        sections = self.parent.get_sections()
+        self.arrows, self.arrow_offsets = self.parent.get_layout("arrows", lambda: layout_arrows(sections))
 
     @cache
     def get_offset(self, pc: int):
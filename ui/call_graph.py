@@ -3,7 +3,7 @@ from dataclasses import dataclass
 from ui.dock.dock import SerializableTab
 from ui.function_graph import SCALE_FACTOR, ScatterPlaneNoTouch
 from ui.main import FONT_NAME, NavigationAction, app
-from ui.project import Function
+from core.project import Function
 from kivy.uix.stencilview import StencilView
 from kivy.uix.widget import Widget
 from kivy.uix.boxlayout import BoxLayout
@@ -20,6 +20,7 @@ from ui.sections import open_context_menu
 
 from .kivytypes import KWidget
 from .arrow import COLORS
+from core.nonoverlap import vertical_nonoverlap
 from .context_menu import ContextMenuBehavior
 
 FONT_SIZE = 14
@@ -62,15 +63,21 @@ class CallGraphTab(SerializableTab):
     
     @classmethod
     def deserialize(cls, data: dict) -> "CallGraphTab":
-
+        tab = cls.deserialize_lazy(data)
+        tab.build_content(data)
+        return tab
+    
+    @classmethod
+    def deserialize_lazy(cls, data: dict) -> "CallGraphTab":
         functions = app().project.functions
         assert functions
-        fun = functions[data["function"]]
-        tab = CallGraphTab(fun)
-        panel = CallGraphPanel(fun, tab)
+        return CallGraphTab(functions[data["function"]])
+    
+    def build_content(self, data: dict):
+        self.text = self.fun.name
+        panel = CallGraphPanel(self.fun, self)
         panel.graph.deserialize(data)
-        tab.add_widget(panel)
-        return tab
+        self.add_widget(panel)
     
     def deserialize_post(self, data: dict):
         if "zoom" in data:
@@ -102,51 +109,10 @@ class Icon:
     x: float
     y: float
 
-import cvxpy as cp
-import numpy as np
-
-def vertical_nonoverlap_qp(ideal_y, heights):
-    """
-    Adjust y positions (top of each block) to avoid vertical overlaps
-    while minimizing total movement.
-    """
-    n = len(ideal_y)
-    if n == 0:
-        return []
-
-    # Ensure arrays are 1D floats
-    ideal_y = np.array(ideal_y, dtype=float).flatten()
-    heights = np.array(heights, dtype=float).flatten()
-
-    # Sort blocks top-to-bottom
-    idx_sort = np.argsort(-ideal_y)
-    ideal_y_sorted = ideal_y[idx_sort]
-    heights_sorted = heights[idx_sort]
-
-    # Optimization variables
-    y = cp.Variable(n)
-
-    # Objective: minimize squared distance from ideal positions
-    objective = cp.Minimize(cp.sum_squares(y - ideal_y_sorted))
-
-    # Constraints: no overlap
-    constraints = [y[i] <= y[i-1] - heights_sorted[i-1] for i in range(1, n)]
-
-    # Solve
-    prob = cp.Problem(objective, constraints)
-    prob.solve(solver=cp.OSQP)  # OSQP is usually robust
-
-    # Restore original order
-    y_opt = np.zeros(n)
-    for i, yi in zip(idx_sort, y.value): #type: ignore
-        y_opt[i] = yi
-
-    return y_opt.tolist()
-
 def shift_layer(blocks: list[Block]):
     ys = [block.y - len(block.function) * (BOX_HEIGHT + 10) / 2 + (BOX_HEIGHT + 10) / 2 for block in blocks]
     heights = [float(len(block.function) * (BOX_HEIGHT + 10) + 20) for block in blocks]
-    optimized_ys = vertical_nonoverlap_qp(ys, heights)
+    optimized_ys = vertical_nonoverlap(ys, heights)
     for block, y in zip(blocks, optimized_ys):
         block.y = y
 
@@ -245,10 +211,11 @@ class CallGraph(KWidget, ContextMenuBehavior, Widget):
         center_callees = self.callees[0][0]
         center_callers = self.callers[0][0]
 
-        callee_functions = list({all_functions[ep] for i, ep in self.fun.callees})
+        calls = app().project.get_calls()
+        callee_functions = [all_functions[ep] for ep in calls.callees(self.fun.ep)]
         self.callees.append([Block(center_callees, [self.fun], callee_functions, len(self.fun.name) * FONT_WIDTH + 85, 0, 0, 1)])
         
-        caller_functions = list({all_functions[ep] for i, ep in self.fun.callers})
+        caller_functions = [all_functions[ep] for ep in calls.callers(self.fun.ep)]
         self.callers.append([Block(center_callers, [self.fun], caller_functions, max(map(lambda c: len(c.name) * FONT_WIDTH + 85, caller_functions), default=0), 0, 0, -1)])
 
         self.update_graphics()
@@ -302,11 +269,8 @@ class CallGraph(KWidget, ContextMenuBehavior, Widget):
             blocks.append(next_layer)
 
         y_offset = f * (BOX_HEIGHT + 10)
-        fun_list = []
-        callees = set(map(lambda c: c[1], fun.callees if column >= 0 else fun.callers))
-        for ep in callees:
-            callee = all_functions[ep]
-            fun_list.append(callee)
+        calls = app().project.get_calls()
+        fun_list = [all_functions[ep] for ep in (calls.callees(fun.ep) if column >= 0 else calls.callers(fun.ep))]
 
         if len(fun_list) > 0:
             next_layer.insert(insert_index, Block(
@@ -401,6 +365,7 @@ class CallGraph(KWidget, ContextMenuBehavior, Widget):
                             Rectangle(pos=(x, offset_y - BOX_HEIGHT), size=(len(fun.name) * FONT_WIDTH + 10, BOX_HEIGHT))
 
     def update_graphics(self):
+        calls = app().project.get_calls()
 
         def draw_box(text: str, x: float, y: float, cycle: bool = False, color = (1, 1, 1, 1)):
             label = CoreLabel(text=text, font_size=14 * SCALE_FACTOR, font_name=FONT_NAME)
@@ -458,7 +423,7 @@ class CallGraph(KWidget, ContextMenuBehavior, Widget):
 
                 offset_y = y
                 for f, fun in enumerate(block.function):
-                    render_plus = len(fun.callees) > 0 if index > 0 else len(fun.callers) > 0
+                    render_plus = (calls.out_degree(fun.ep) if index > 0 else calls.in_degree(fun.ep)) > 0
                     if render_plus and not any(map(lambda b: b.prev == block and b.path[-1] == fun, next_layer or [])):
                         # Render plus icon if there are callees and the next layer for the function is not open
                         x2, y2 = (x + len(fun.name) * FONT_WIDTH + 10) if index > 0 else x - 10, offset_y - BOX_HEIGHT / 2 - 5
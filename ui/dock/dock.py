@@ -1,6 +1,7 @@
 from enum import Enum
 from typing import Generator, cast
 from abc import ABC, abstractmethod
+from importlib import import_module
 
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.splitter import Splitter
@@ -188,15 +189,24 @@ class DockPanel(KWidget, BoxLayout, Child):
 
         return res
 
-    def add_widget(self, widget: "DockTab", index: int = 0):
+    # lazy keeps restored tabs without content until they get selected
+    def add_widget(self, widget: "DockTab", index: int = 0, lazy: bool = False):
         widget.dock_panel = self
         self._tab_strip.add_widget(widget, index)
         if self._current_widget:
             super().remove_widget(self._current_widget._content)
         self._current_widget = widget
-        super().add_widget(self._current_widget._content)
+        if lazy: super().add_widget(widget._content)
+        else: self._show(widget)
         Clock.schedule_once(lambda dt: self._calculate_tab_size(), 0)
 
+    # Restored tabs build their content the first time they are shown
+    def _show(self, widget: "DockTab"):
+        data = widget.restore_content()
+        super().add_widget(widget._content)
+        if data is not None:
+            cast(SerializableTab, widget).deserialize_post(data)
+
     def remove_widget(self, widget: "DockTab"):
         assert widget.dock_panel == self
         widget.dock_panel = None
@@ -209,7 +219,7 @@ class DockPanel(KWidget, BoxLayout, Child):
             tab_list = self.tab_list
             if len(tab_list) > 0:
                 self._current_widget = tab_list[max(0, index - 1)]
-                super().add_widget(self._current_widget._content)
+                self._show(self._current_widget)
 
         Clock.schedule_once(lambda dt: self._calculate_tab_size(), 0)
     
@@ -218,7 +228,7 @@ class DockPanel(KWidget, BoxLayout, Child):
         if self._current_widget:
             super().remove_widget(self._current_widget._content)
         self._current_widget = widget
-        super().add_widget(self._current_widget._content)
+        self._show(widget)
 
     def _calculate_tab_size(self):
         w = 0
@@ -268,6 +278,7 @@ class TabXButton(XButton):
 
     def on_press(self):
         parent: DockTab = self.parent
+        parent.closed()
         if parent.dock_panel:
             dock_panel = parent.dock_panel
             parent.dock_panel.remove_widget(self.parent)
@@ -295,6 +306,8 @@ class DockTab(KWidget, RelativeLayout):
     def __init__(self, **kwargs):
         self.root: Dock | None = None
         self.dock_panel: DockPanel | None = None
+        # Saved state of a restored tab whose content isn't built yet
+        self.pending: dict | None = None
         self.button = DockButton()
         self.xbutton = TabXButton()
         super().__init__(**kwargs)
@@ -329,7 +342,19 @@ class DockTab(KWidget, RelativeLayout):
     # This is for being able to have a callback when the content changes
     def refresh(self, **kwargs): pass
 
+    # Called when the user closes the tab
+    def closed(self): pass
+
+    # Builds the content if the tab is still pending, returns the saved state it was built from
+    def restore_content(self) -> dict | None: return None
+
 serializable_panels = {}
+# Panels whose module is only imported once a saved tab of that type gets restored
+lazy_panels: dict[str, str] = {}
+
+def register_lazy_panel(name: str, module: str):
+    lazy_panels[name] = module
+
 class SerializableTab(DockTab):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -348,11 +373,33 @@ class SerializableTab(DockTab):
 
     def deserialize_post(self, data: dict): pass
 
+    # Tabs that are expensive to build can be restored without content, it is built
+    # with build_content the first time the tab is shown. Returns None if the type
+    # doesn't support it.
+    @classmethod
+    def deserialize_lazy(cls, data: dict) -> "SerializableTab | None": return None
+
+    def build_content(self, data: dict): pass
+
+    def restore_content(self) -> dict | None:
+        if self.pending is None: return None
+        data, self.pending = self.pending, None
+        self.build_content(data)
+        return data
+
     @staticmethod
-    def deserialize_panel(data: dict) -> "SerializableTab":
+    def deserialize_panel(data: dict, lazy: bool = False) -> "SerializableTab":
         panel_type = data.get("type")
+        if panel_type and panel_type not in serializable_panels and panel_type in lazy_panels:
+            import_module(lazy_panels[panel_type])
         if panel_type and panel_type in serializable_panels:
             panel_cls = serializable_panels[panel_type]
+            if lazy:
+                panel = panel_cls.deserialize_lazy(data)
+                if panel:
+                    panel.pending = data
+                    panel.add_widget(Widget())
+                    return panel
             panel = panel_cls.deserialize(data)
             return panel
         raise ValueError("Unknown panel type: " + str(panel_type))
@@ -544,7 +591,7 @@ class Dock(KWidget, BaseDock):
 
     def refresh(self, **kwargs):
         for panel in self.iterate_panels():
-            panel.refresh(**kwargs)
+            if panel.pending is None: panel.refresh(**kwargs)
 
     def unfocus_all(self):
         self.active_panel = None
@@ -1,5 +1,6 @@
 
 from typing import Any
+from threading import Thread
 from kivy.core.window import Window
 from kivy.uix.widget import Widget
 from kivy.uix.relativelayout import RelativeLayout
@@ -11,7 +12,8 @@ from kivy.properties import ObjectProperty
 from tcls_900.tlcs_900 import Reg
 
 from .sections import EditableLabel
-from .project import Function
+from core.project import Function
+from core.timing import Timing
 from .main import HideableTextInput, EscapeTrigger, app, iter_all_children_of_type
 from .context_menu import ContextMenuBehavior
 from .table.table import DataTableRow, ResizableRecycleTable
@@ -68,8 +70,11 @@ class AnalyzerFilter(HideableTextInput, EscapeTrigger):
         Clock.schedule_once(lambda dt: panel.ids["analyzer_table"].filter(self.text), 0)
 
 
-HEADER_NAMES = ["name", "navigation", "address", "frequency", "complexity", "input", "clobber", "output", "stack"]
-COLUMN_WIDTHS = [dp(200), dp(100), dp(100), dp(100), dp(100), dp(200), dp(200), dp(200), dp(100)]
+HEADER_NAMES = ["name", "navigation", "address", "frequency", "complexity", "wcet", "input", "clobber", "output", "stack"]
+COLUMN_WIDTHS = [dp(200), dp(100), dp(100), dp(100), dp(100), dp(100), dp(200), dp(200), dp(200), dp(100)]
+WCET_COLUMN = 5
+# Shown until the estimate of a function is done
+PENDING = "..."
 
 class AnalyzerButtons(RelativeLayout):
     parent: "AnalyzerTableRow"
@@ -139,7 +144,6 @@ class AnalyzerTable(ResizableRecycleTable):
     def __init__(self, **kwargs):
         super().__init__(headers = HEADER_NAMES, data = [], column_widths=COLUMN_WIDTHS, cols=5, **kwargs)
         self.viewclass = "AnalyzerTableRow"
-        self.original_data = []
 
     def on_kv_post(self, base_widget):
         super().on_kv_post(base_widget)
@@ -148,11 +152,19 @@ class AnalyzerTable(ResizableRecycleTable):
     def refresh(self, **kwargs):
         for label in iter_all_children_of_type(self.body, AnalyzerLabel):
             label.refresh(**kwargs)
+        # Function names are part of the filter keys, they are rebuilt on the next filter
+        self.row_keys = None
+
+    def column_key(self, column: int, value):
+        if isinstance(value, Function): return value.ep
+        if column == WCET_COLUMN:
+            return value.wcet if isinstance(value, Timing) else -1
+        return value
 
     def update_data(self):
         project = app().project
         assert project.functions is not None
-        self.original_data = []
+        rows = []
         for fun in project.functions.values():
             if not fun.state: continue
             row = []
@@ -166,6 +178,8 @@ class AnalyzerTable(ResizableRecycleTable):
             row.append(fun.frequency)
             # complexity
             row.append(len(fun.blocks))
+            # worst case states, only if known already, the rest is estimated in the background
+            row.append(fun.timing or PENDING)
             # callers
             #callers = set(map(lambda c: c[1], fun.callers))
             #row.append(", ".join(map(lambda c: c.name, callers)))
@@ -186,13 +200,19 @@ class AnalyzerTable(ResizableRecycleTable):
             else:
                 row.append("overflow")
 
-            self.original_data.append(row)
+            rows.append(row)
 
-        self.data = self.original_data.copy()
-        self.body.update_data()
+        self.set_rows(rows)
+        pending = [row for row in rows if row[WCET_COLUMN] is PENDING]
+        if pending: Thread(target=self._estimate, args=(pending,), daemon=True).start()
 
-    def filter(self, text: str | None = None):
-        self.data = self.original_data.copy()
-        if text is not None: 
-            self.data = list(filter(lambda row: any(map(lambda r: text.casefold() in str(r).casefold(), row)), self.data))
-        self.body.update_data()
\ No newline at end of file
+    def _estimate(self, rows: list[list]):
+        project = app().project
+        for row in rows:
+            project.wcet(row[0])
+
+        def update(dt):
+            for row in rows:
+                row[WCET_COLUMN] = row[0].timing or PENDING
+            self.invalidate()
+        Clock.schedule_once(update, 0)
\ No newline at end of file
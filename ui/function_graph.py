@@ -1,11 +1,11 @@
-import json
+from concurrent.futures import Future
 
 from kivy.uix.widget import Widget
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.scatter import ScatterPlane
 from kivy.uix.stencilview import StencilView
 from kivy.uix.label import Label
-from kivy.graphics import Triangle, Color, Line, Rectangle
+from kivy.graphics import Triangle, Color, Line, Rectangle, InstructionGroup, PushMatrix, PopMatrix, Translate
 from kivy.metrics import dp
 from kivy.utils import colormap, get_color_from_hex
 from kivy.clock import Clock
@@ -17,8 +17,8 @@ from kivy.graphics import Canvas
 from kivy.metrics import Metrics
 
 from .kivytypes import KWidget
-from .project import Function, Section
-from .main import graph_tmpfolder, app, FONT_NAME, NavigationAction
+from core.project import Function, Section
+from .main import app, FONT_NAME, NavigationAction
 from .sections import section_to_markup, LocationLabel, open_context_menu
 from .context_menu import ContextMenuBehavior, show_context_menu, MenuItem, MenuHandler
 
@@ -40,7 +40,7 @@ class NavigationGraph(NavigationAction):
         dock = app().main_dock
         if not dock: return
         for tab in dock.iterate_panels():
-            if isinstance(tab, GraphTab):
+            if isinstance(tab, GraphTab) and tab.pending is None:
                 if isinstance(self.location, int):
                     tab.content.move_to_location(self.location, history=False)
                 else:
@@ -49,12 +49,14 @@ class NavigationGraph(NavigationAction):
 class GraphTab(SerializableTab):
     content: "FunctionPanel"
 
-    def __init__(self, text: str, **kwargs):
-        super().__init__(text=text, closeable=True, source="ui/resources/graph.png", **kwargs)
+    def __init__(self, fun: Function, **kwargs):
+        super().__init__(text=fun.name, closeable=True, source="ui/resources/graph.png", **kwargs)
+        self.fun = fun
+        self.prefetch: Future | None = None
 
     def serialize(self) -> dict:
         data = super().serialize()
-        data["function"] = self.content.fun.ep
+        data["function"] = self.fun.ep
         data["x"] = self.content.scatter.x
         data["y"] = self.content.scatter.y
         data["zoom"] = self.content.scatter.scale
@@ -62,15 +64,29 @@ class GraphTab(SerializableTab):
     
     @classmethod
     def deserialize(cls, data: dict) -> "GraphTab":
-        ep = data["function"]
         functions = app().project.functions
         assert functions
-        fun = functions[ep]
-        tab = GraphTab(fun.name)
-        panel = FunctionPanel(fun, tab)
-        tab.add_widget(panel)
+        tab = GraphTab(functions[data["function"]])
+        tab.build_content(data)
         return tab
     
+    @classmethod
+    def deserialize_lazy(cls, data: dict) -> "GraphTab":
+        functions = app().project.functions
+        assert functions
+        tab = GraphTab(functions[data["function"]])
+        # The layout is computed in the background until the tab gets selected
+        tab.prefetch = app().layout_cache.request(tab.fun, app().project)
+        return tab
+    
+    def build_content(self, data: dict):
+        self.text = self.fun.name
+        self.add_widget(FunctionPanel(self.fun, self))
+
+    def closed(self):
+        if self.prefetch and self.pending is not None:
+            app().layout_cache.cancel(self.prefetch)
+    
     def deserialize_post(self, data: dict):
         if "zoom" in data:
             self.content.scatter._set_scale(data["zoom"])
@@ -81,7 +97,8 @@ class GraphTab(SerializableTab):
         self.text = self.content.fun.name
         ep = kwargs.get("ep")
 
-        if not ep or any(map(lambda l: l.ep == ep, self.content.svg.labels)): # Check if any label matches the updated function ep, only update if so
+        labels = (l for block_labels in self.content.svg.block_labels.values() for l in block_labels)
+        if not ep or any(map(lambda l: l.ep == ep, labels)): # Check if any label matches the updated function ep, only update if so
             self.content.svg.update_graph()
             self.content.svg.update_graphics()
 
@@ -127,6 +144,9 @@ def find_font_height():
 SCALE_FACTOR = 4
 SVG_FONT_WIDTH, SVG_FONT_HEIGHT = find_font_height()
 
+# Below this zoom level block text is unreadable, only the outlines are drawn
+LOD_SCALE = 0.35
+
 
 class CodeBlockRect:
     def __init__(self, ep: int, x: int, y: int, width: int, height: int):
@@ -150,11 +170,21 @@ class FunctionSvg(KWidget, ContextMenuBehavior, Widget):
         self.first_block: CodeBlockRect | None = None
         self.current_block: CodeBlockRect | None = None
 
-        self.bind(pos=self.update_graphics, size=self.update_graphics)
+        self.origin = (0.0, 0.0)
+        self.translate = Translate()
+        self.fill_group = InstructionGroup()
+        self.text_group = InstructionGroup()
+        self.text_groups: dict[int, InstructionGroup] = {}
+        self.block_labels: dict[int, list[LocationLabel]] = {}
+        self.visible_blocks: set[int] = set()
+        self.show_text = True
+        self.trigger_viewport = Clock.create_trigger(self.update_viewport)
+
+        self.bind(pos=self.on_pos)
         self.update_graph()
 
     def update_graph(self):
-        self.graphfile = self.fun.graph_json(graph_tmpfolder(), app().project.ob)
+        self.layout = app().layout_cache.get(self.fun, app().project)
 
     def trigger_context_menu(self, touch):
         if self.collide_point(touch.x, touch.y):
@@ -222,9 +252,91 @@ class FunctionSvg(KWidget, ContextMenuBehavior, Widget):
                 Line(width=1.1, rectangle=(self.current_block.x, self.current_block.y, self.current_block.width, self.current_block.height))
 
 
+    def on_pos(self, instance, pos):
+        # Everything on the canvas is drawn relative to the origin, only hit boxes have to move
+        dx, dy = pos[0] - self.origin[0], pos[1] - self.origin[1]
+        self.origin = tuple(pos)
+        self.translate.xy = pos
+        for block in self.code_blocks.values():
+            block.x += dx
+            block.y += dy
+        for labels in self.block_labels.values():
+            for label in labels:
+                label.x += dx
+                label.y += dy
+        self.trigger_viewport()
+
+    def viewport(self) -> tuple[float, float, float, float]:
+        stencil = self.panel.stencil
+        x0, y0 = self.to_widget(*stencil.to_window(stencil.x, stencil.y))
+        x1, y1 = self.to_widget(*stencil.to_window(stencil.right, stencil.top))
+        return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+    def update_viewport(self, *args):
+        show_text = self.panel.scatter.scale >= LOD_SCALE
+        if show_text != self.show_text:
+            self.show_text = show_text
+            # Filled blocks give structure to the graph when the text is hidden
+            self.fill_group.clear()
+            if not show_text:
+                self.fill_group.add(Color(1, 1, 1, 0.25))
+                for block in self.code_blocks.values():
+                    self.fill_group.add(Rectangle(pos=(block.x - self.x, block.y - self.y), size=(block.width, block.height)))
+
+        visible: set[int] = set()
+        if show_text:
+            x0, y0, x1, y1 = self.viewport()
+            for ep, block in self.code_blocks.items():
+                if block.x < x1 and block.x + block.width > x0 and block.y < y1 and block.y + block.height > y0:
+                    visible.add(ep)
+
+        if visible == self.visible_blocks: return
+        self.visible_blocks = visible
+        self.text_group.clear()
+        self.labels = []
+        for ep in visible:
+            self.text_group.add(self.block_text(ep))
+            self.labels.extend(self.block_labels[ep])
+
+    def block_text(self, ep: int) -> InstructionGroup:
+        # Text textures are created the first time a block becomes visible
+        group = self.text_groups.get(ep)
+        if group is not None: return group
+
+        rect = self.code_blocks[ep]
+        x, y = rect.x - self.x, rect.y - self.y
+
+        block = self.fun.blocks[ep]
+        lines, labels = [], []
+        section_to_markup(block.insn, lines, labels)
+        for label in labels:
+            label.x = rect.x + label.x * SVG_FONT_WIDTH / SCALE_FACTOR + 8
+            label.y = rect.y + ((len(lines) - label.y - 1) * SVG_FONT_HEIGHT * 1.05) / SCALE_FACTOR + 8
+            label.width = label.width * SVG_FONT_WIDTH / SCALE_FACTOR
+            label.height = label.height * SVG_FONT_HEIGHT / SCALE_FACTOR
+        self.block_labels[ep] = labels
+
+        group = InstructionGroup()
+        group.add(Color(1, 1, 1, 1))
+        for i, line in enumerate(lines):
+            label = MarkupLabel(markup=True, font_size=14 * SCALE_FACTOR, font_name=FONT_NAME)
+            label.text = line
+            label.refresh()
+
+            group.add(Rectangle(
+                texture=label.texture, 
+                size=(label.texture.size[0] / SCALE_FACTOR, 
+                      label.texture.size[1] / SCALE_FACTOR), 
+                pos=(x + 8, 
+                     y + (len(lines) - i - 1) * SVG_FONT_HEIGHT * 1.05 / SCALE_FACTOR + 8)
+            ))
+        self.text_groups[ep] = group
+        return group
+
+    # Builds the retained graphics for the current layout. Panning and zooming only
+    # transform them, block text is added and removed by update_viewport.
     def update_graphics(self, *args):
-        with open(self.graphfile) as fp:
-            data = json.load(fp)
+        data = self.layout
 
         _,_,gw,gh = data["bb"].split(",")
         self.width = float(gw)
@@ -234,10 +346,19 @@ class FunctionSvg(KWidget, ContextMenuBehavior, Widget):
             return int(inches * 72)
         
         self.code_blocks = {}
+        self.text_groups = {}
+        self.block_labels = {}
+        self.visible_blocks = set()
+        self.labels = []
+        self.origin = (self.x, self.y)
+        self.show_text = True
+        self.fill_group = InstructionGroup()
+        self.text_group = InstructionGroup()
 
         self.canvas.clear()
-        self.labels.clear()
         with self.canvas:
+            PushMatrix()
+            self.translate = Translate(self.x, self.y)
             if "edges" in data:
                 for line in data["edges"]:
                     points = parse_pos(line["pos"])
@@ -246,8 +367,6 @@ class FunctionSvg(KWidget, ContextMenuBehavior, Widget):
                         Color(1, 1, 1, 1)
                     else: Color(*colormap[line["color"]])
 
-                    points = [(x + self.x, y + self.y) for x, y in points]
-
                     endpoint = points[0]
                     control_points = points[1:]
 
@@ -278,9 +397,6 @@ class FunctionSvg(KWidget, ContextMenuBehavior, Widget):
 
                     # Draw arrowhead at endpoint using last segment
                     last_seg = segments[-1]
-                    # Tangent at t=1 (end of last segment)
-                    tx, ty = cubic_bezier_tangent(last_seg, 1)
-                    tx, ty = normalize(tx, ty)
 
                     arrow_length = 12
                     arrow_width = 9
@@ -314,40 +430,22 @@ class FunctionSvg(KWidget, ContextMenuBehavior, Widget):
                 for i, box in enumerate(data["objects"]):
                     x,y = map(float, box["pos"].split(","))
                     w,h = to_px(float(box["width"])), to_px(float(box["height"]))
-                    x = self.x + x - w/2
-                    y = self.y + y - h/2
+                    x = x - w/2
+                    y = y - h/2
 
                     ep = int(box["name"])
-                    block = CodeBlockRect(ep, x, y, w, h)
+                    block = CodeBlockRect(ep, self.x + x, self.y + y, w, h)
                     self.code_blocks[ep] = block
                     if i == 0: self.first_block = block
-
-                    block = self.fun.blocks[ep]
-                    lines, labels = [], []
-                    section_to_markup(block.insn, lines, labels)
-                    for label in labels:
-                        label.x = x + label.x * SVG_FONT_WIDTH / SCALE_FACTOR + 8
-                        label.y = y + ((len(lines) - label.y - 1) * SVG_FONT_HEIGHT * 1.05) / SCALE_FACTOR + 8
-                        label.width = label.width * SVG_FONT_WIDTH / SCALE_FACTOR
-                        label.height = label.height * SVG_FONT_HEIGHT / SCALE_FACTOR
-
-                    self.labels.extend(labels)
-
-                    for i, line in enumerate(lines):
-                        label = MarkupLabel(markup=True, font_size=14 * SCALE_FACTOR, font_name=FONT_NAME)
-                        label.text = line
-                        label.refresh()
-
-                        Rectangle(
-                            texture=label.texture, 
-                            size=(label.texture.size[0] / SCALE_FACTOR, 
-                                  label.texture.size[1] / SCALE_FACTOR), 
-                            pos=(x + 8, 
-                                 y + (len(lines) - i - 1) * SVG_FONT_HEIGHT * 1.05 / SCALE_FACTOR + 8)
-                        )
                         
                     Line(width=1.1, rectangle=(x, y, w, h))
 
+            self.canvas.add(self.fill_group)
+            self.canvas.add(self.text_group)
+            PopMatrix()
+
+        self.update_viewport()
+
 class ScatterPlaneNoTouch(ScatterPlane):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -384,6 +482,9 @@ class FunctionPanel(BoxLayout):
         self.add_widget(self.stencil)
         self.svg.update_graphics()
 
+        self.scatter.bind(transform=lambda *args: self.svg.trigger_viewport())
+        self.stencil.bind(pos=lambda *args: self.svg.trigger_viewport(), size=lambda *args: self.svg.trigger_viewport())
+
     def block_pos(self, block: CodeBlockRect) -> tuple[int, int]:
         x = self.stencil.x + self.stencil.width / 2 - (block.x + block.width / 2) * self.scatter.scale
         y = self.stencil.y + self.stencil.height / 2 - (block.y + block.height / 2) * self.scatter.scale
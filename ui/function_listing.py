@@ -1,6 +1,4 @@
-from typing import Iterable, Union, cast
-from itertools import groupby
-from pytreemap import TreeSet
+from typing import Any, Callable, Iterable, cast
 import logging
 
 from kivy.metrics import dp
@@ -10,20 +8,26 @@ from kivy.uix.splitter import Splitter
 from kivy.uix.textinput import TextInput
 from kivy.uix.relativelayout import RelativeLayout
 from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.treeview import TreeView, TreeViewLabel
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.label import Label
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.spinner import Spinner
-from kivy.properties import BooleanProperty, ObjectProperty
+from kivy.properties import BooleanProperty, NumericProperty, ObjectProperty
 
 from disapi import insnentry_to_str
 from tcls_900.tlcs_900 import Mem, Reg
 
 from .kivytypes import KWidget
 from .minimap import Minimap
-from .project import Function, Section, Instruction
+from core.project import Function, Section
+from core.sorted_map import SortedMap
+from core.query import Predicate
+from core.signatures import BytePattern
 from .sections import RV, ScrollBar, SearchInput
-from .main import app, FONT_NAME, iter_all_children_of_type
+from .main import app, FONT_NAME
 from .arrow import ArrowRenderer
+from .context_menu import ContextMenuBehavior, show_context_menu, MenuHandler, MenuItem
 
 from .dock.dock import SerializableTab
 
@@ -37,10 +41,11 @@ class ListingPanelBase(Widget):
         self.search_input: SearchInput = cast(SearchInput, None)
         self.search_spinner: Spinner = cast(Spinner, None)
 
-        self.search_item: str | bytes | None = None
+        self.search_item: str | bytes | BytePattern | Predicate | None = None
         self.highlighted: int | None = None
         self.highlighted_list: list[int] = []
-        self.highlighted_set: TreeSet = TreeSet()
+        # Highlighted offsets mapped to themselves, floor finds the one before an address
+        self.highlighted_set: SortedMap[int] = SortedMap()
         self.highlight_index = -1
 
         Window.bind(on_key_down=self._keydown)
@@ -63,7 +68,7 @@ class ListingPanelBase(Widget):
             self.end_highlight()
 
     def _set_selection_end(self):
-        if isinstance(self.search_item, bytearray):
+        if isinstance(self.search_item, (bytearray, BytePattern)):
             self.rv.selection_end = self.rv.selection_start + len(self.search_item) - 1
         else:
             sections = self.get_sections()
@@ -73,7 +78,7 @@ class ListingPanelBase(Widget):
                         self.rv.selection_end = insn.entry.pc + insn.entry.length - 1
                         break
 
-    def highlight_list(self, highlights: list[int], search_string: str | bytearray):
+    def highlight_list(self, highlights: list[int], search_string: str | bytearray | BytePattern | Predicate):
         if len(highlights) == 0:
             self.end_highlight()
             return
@@ -86,24 +91,22 @@ class ListingPanelBase(Widget):
     def highlight(self, fun: Function, callee: int | None = None, caller: int | None = None):
         self.search_item = None
         self.highlighted = callee if callee is not None else caller
+        calls = app().project.get_calls()
         if callee:
-            self.highlighted_list = list(set([index for index, callee in fun.callees if callee == self.highlighted]))
+            self.highlighted_list = list(set(calls.sites(fun.ep, callee)))
         elif caller:
-            self.highlighted_list = list(set([index for index, _ in fun.callers]))
+            self.highlighted_list = list(set([index for index, _ in calls.caller_sites(fun.ep)]))
 
         logging.info("Highlighting %d occurrences of %s of function %s", len(self.highlighted_list), 
                      "callee" if callee is not None else "caller", fun.name)
         self._highlight_post()
         
     def _highlight_post(self):
-        self.highlighted_set = TreeSet()
+        self.highlighted_set = SortedMap((i, i) for i in self.highlighted_list)
         self.highlighted_list.sort()
         if len(self.highlighted_list) == 0:
             self.highlighted = None
             return
-        
-        for i in self.highlighted_list:
-            self.highlighted_set.add(i)
 
         self.highlight_index = 0
         self.rv.selection_start = self.rv.selection_end = self.highlighted_list[self.highlight_index]
@@ -151,6 +154,10 @@ class ListingPanelBase(Widget):
     
     def get_sections(self) -> Iterable[Section]:
         return app().project.sections.values()
+
+    # Layout data derived from the sections, computed by the views that need it
+    def get_layout(self, name: str, compute: Callable[[], Any]) -> Any:
+        return compute()
     
     def serialize(self, data: dict):
         data["scroll_x"] = self.scrollbar.view.scroll_x
@@ -181,174 +188,207 @@ class ListingPanel(ListingPanelBase, RelativeLayout):
         self.minimap = self.ids["minimap"]
 
     def update(self):
-        self.minimap.update()
-
-class ListingViewLabel(TreeViewLabel):
-    parent: "FunctionListingDetails"
-
-    def refresh(self): pass
-
-class InOutViewLabelMem(ListingViewLabel):
-    def __init__(self, mem_list: list[int], **kwargs):
-        self.mem_list = mem_list
-        super().__init__(**kwargs)
-        self.refresh()
-
-    def refresh(self):
-        label = app().project.ob.label(self.mem_list[0])
-        if len(self.mem_list) > 1:
-            text = f"{self.mem_list[0]:X}-{self.mem_list[-1]:X}"
-        else:
-            text = f"{self.mem_list[0]:X}"
-
-        if label: text = f"{label.name} ({text})"
+        self.minimap.update_highlights()
 
+# Node of the details tree, text is a function for nodes that show names which can change
+class DetailsNode:
+    def __init__(self, text: str | Callable[[], str], ep: int | None = None, is_open: bool = False, mono: bool = False,
+                 loop: int | None = None):
         self.text = text
-
-class ClobberViewLabel(ListingViewLabel):
-    def __init__(self, ep: int, do_group: bool, **kwargs):
-        self.ep = ep
-        self.do_group = do_group
-        super().__init__(**kwargs)
-        self.refresh()
+        self.ep = ep # Location in the listing to scroll to on touch
+        self.is_open = is_open
+        self.mono = mono
+        self.loop = loop # Loop header whose bound can be set from the context menu
+        self.children: list[DetailsNode] = []
+
+    def add(self, node: "DetailsNode") -> "DetailsNode":
+        self.children.append(node)
+        return node
+
+    def get_text(self) -> str:
+        return self.text() if callable(self.text) else self.text
+
+    # Pre-order, including the node itself
+    def iterate(self) -> Iterable["DetailsNode"]:
+        yield self
+        for child in self.children:
+            yield from child.iterate()
+
+    # Fixed titles or the address for nodes that show names, stable when other nodes come and go
+    @property
+    def key(self) -> str:
+        if isinstance(self.text, str): return self.text
+        return format(self.ep, "X") if self.ep is not None else ""
+
+    # (path, node) for all nodes with children, the path is made of the keys from the root
+    def iterate_paths(self, path: str = "") -> Iterable[tuple[str, "DetailsNode"]]:
+        for child in self.children:
+            if not child.children: continue
+            child_path = path + "/" + child.key
+            yield child_path, child
+            yield from child.iterate_paths(child_path)
+
+class DetailsRow(RecycleDataViewBehavior, ContextMenuBehavior, Label):
+    level = NumericProperty(0)
+    is_leaf = BooleanProperty(True)
+    is_open = BooleanProperty(False)
+    odd = BooleanProperty(False)
+
+    def refresh_view_attrs(self, rv: "FunctionListingDetails", index, data):
+        self.details = rv
+        self.node: DetailsNode = data["node"]
+        # Formatted here so that only the rows on screen look up their labels
+        self.text = self.node.get_text()
+        super().refresh_view_attrs(rv, index, data)
 
     def on_touch_down(self, touch):
-        if super().on_touch_down(touch): return True
-        app().scroll_to_offset(self.ep, main_panel=self.parent.container.listing, history=False)
+        if not self.collide_point(*touch.pos): return False
+        if touch.button == "right": return True
+        toggle = touch.x < self.x + self.padding[0]
+        if self.node.children and (toggle or self.node.ep is None):
+            self.details.toggle_node(self.node)
+        elif self.node.ep is not None:
+            app().scroll_to_offset(self.node.ep, main_panel=self.details.container.listing, history=False)
         return True
 
-class ClobberViewLabelCall(ClobberViewLabel):
-    def __init__(self, ep: int, do_group: bool, call: Instruction, **kwargs):
-        self.call = call
-        super().__init__(ep, do_group, **kwargs)
-
-    def refresh(self):
-        self.text=f"{self.ep:X}: {insnentry_to_str(self.call.entry, app().project.ob)}"
-
-class ClobberViewLabelMem(ClobberViewLabel):
-
-    def __init__(self, ep: int, do_group: bool, mem_list: list[int], **kwargs):
-        self.mem_list = mem_list
-        super().__init__(ep, do_group, **kwargs)
+    def trigger_context_menu(self, touch) -> bool:
+        pc = self.node.loop
+        if pc is None or not self.collide_point(*touch.pos): return False
+        class Handler(MenuHandler):
+            def on_select(self, item):
+                if item == "set": app().open_loop_bound(pc, touch.x, touch.y)
+                elif item == "remove": app().set_loop_bound(pc, None)
 
-    def refresh(self):
-        label = app().project.ob.label(self.mem_list[0])
-        if len(self.mem_list) > 1:
-            text = f"{self.mem_list[0]:X}-{self.mem_list[-1]:X}"
-        else:
-            text = f"{self.mem_list[0]:X}"
-
-        if label: text = f"{label.name} ({text})"
-        if not self.do_group: text = f"{self.ep:X}: {text}"
-        self.text = text
-
-class FunctionListingDetails(KWidget, TreeView):
-    parent: ScrollView
+        show_context_menu(Handler(), [MenuItem("set", "Set loop bound")] +
+            ([MenuItem("remove", "Remove loop bound")] if pc in app().project.loop_bounds else []))
+        return True
 
+# The details are shown as a recycle view over the open part of the tree, so only
+# the visible rows have widgets and closed nodes never compute their text
+class FunctionListingDetails(KWidget, RecycleView):
     def __init__(self, function: Function, container: "FunctionListingContainer", **kwargs):
         self.fun = function
         self.container = container
+        super().__init__(viewclass="DetailsRow", bar_width=dp(10), scroll_type=["bars", "content"], **kwargs)
 
-        super().__init__(hide_root=True, size_hint=(1, None), **kwargs)
+        layout = RecycleBoxLayout(orientation="vertical", size_hint=(1, None), 
+                                  default_size=(None, dp(24)), default_size_hint=(1, None))
+        layout.bind(minimum_height=layout.setter("height"))
+        self.add_widget(layout)
 
-        node = TreeViewLabel(text="Name", is_open=True)
-        self.add_node(node)
-        self.name_node = TreeViewLabel(text=function.name)
-        self.add_node(self.name_node, node)
+        self.root = DetailsNode("")
+        self.build_tree()
+        self.update_rows()
 
-        node = TreeViewLabel(text="Address", is_open=True)
-        self.add_node(node)
-        self.add_node(TreeViewLabel(text=format(function.ep, "X")), node)
+    def build_tree(self):
+        function = self.fun
+        root = self.root
 
-        node = TreeViewLabel(text="Frequency", is_open=True)
-        self.add_node(node)
-        self.add_node(TreeViewLabel(text=str(function.frequency)), node)
+        node = root.add(DetailsNode("Name", is_open=True))
+        node.add(DetailsNode(lambda: function.name))
 
-        node = TreeViewLabel(text="Complexity", is_open=True)
-        self.add_node(node)
-        self.add_node(TreeViewLabel(text=str(len(function.blocks))), node)
+        node = root.add(DetailsNode("Address", is_open=True))
+        node.add(DetailsNode(format(function.ep, "X")))
 
-        def group_mems(mems: list[int]) -> list[list[int]]:
-            return [
-                [num for _, num in g]  # extract only the value
-                for _, g in groupby(enumerate(sorted(mems)), lambda x: x[1] - x[0])
-            ]
-        
-        def is_call(ep: int) -> Instruction | None:
-            for block in function.blocks.values():
-                for inst in block.insn:
-                    if inst.entry.pc == ep and inst.entry.opcode in ("CALL", "CALR"):
-                        return inst
-            return None
-
-        assert function.state is not None
-
-        def add_registers(name: str, registers: set[Union[Reg, int]]):
-            node = TreeViewLabel(text=f"{name} Registers")
-            self.add_node(node)
-            for reg in sorted([reg for reg in registers if isinstance(reg, Reg)], key=lambda r: r.addr):
-                self.add_node(TreeViewLabel(text=str(reg), font_name=FONT_NAME), node)
-
-            node = TreeViewLabel(text=f"{name} Memory")
-            self.add_node(node)
-
-            mems = [mem for mem in registers if isinstance(mem, int)]
-            for mem_list in group_mems(mems):
-                self.add_node(InOutViewLabelMem(mem_list=mem_list, font_name=FONT_NAME), node)
-
-        add_registers("Input", function.state.input)
-        add_registers("Output", function.state.output)
-        
-        node = TreeViewLabel(text=f"Clobbers")
-        self.add_node(node)
-        for ep, group in groupby(sorted(function.state.clobbers, key=lambda e: e[2]), key=lambda e: e[2]):
-            group = list(group)
-            node2 = node
-            do_group = False
-            call = is_call(ep)
-            if call:
-                node2 = ClobberViewLabelCall(ep, do_group, call, font_name=FONT_NAME)
-                self.add_node(node2, node)
-                do_group = True
-            
-            regs: list[Reg] = []
-            mems: list[int] = []
-            for _, value, _ in group:
-                if isinstance(value, Reg):
-                    regs.append(value)
-                else:
-                    mems.append(value)
+        node = root.add(DetailsNode("Frequency", is_open=True))
+        node.add(DetailsNode(str(function.frequency)))
 
-            for reg in regs:
-                text = str(reg) 
-                if not do_group: text = f"{ep:X}: {text}"
-                self.add_node(ClobberViewLabel(ep, do_group, text=text, font_name=FONT_NAME), node2)
+        node = root.add(DetailsNode("Complexity", is_open=True))
+        node.add(DetailsNode(str(len(function.blocks))))
 
-            for mem_list in group_mems(mems):
-                self.add_node(ClobberViewLabelMem(ep, do_group, mem_list=mem_list, font_name=FONT_NAME), node2)
+        self.timing_node = root.add(DetailsNode("Timing"))
+        self.add_timing(self.timing_node)
 
-            self.bind(minimum_size=lambda _, value: setattr(self, 'height', value[1]))
+        summary = function.get_summary()
 
-    def toggle_node(self, node):
-        super().toggle_node(node)
-        self.refresh()
+        def mem_text(mem_list: list[int], ep: int | None = None) -> Callable[[], str]:
+            def text() -> str:
+                label = app().project.ob.label(mem_list[0])
+                if len(mem_list) > 1:
+                    res = f"{mem_list[0]:X}-{mem_list[-1]:X}"
+                else:
+                    res = f"{mem_list[0]:X}"
+                if label: res = f"{label.name} ({res})"
+                if ep is not None: res = f"{ep:X}: {res}"
+                return res
+            return text
+
+        def add_registers(name: str, regs: list[Reg], mems: list[list[int]]):
+            node = root.add(DetailsNode(f"{name} Registers"))
+            for reg in regs:
+                node.add(DetailsNode(str(reg), mono=True))
+
+            node = root.add(DetailsNode(f"{name} Memory"))
+            for mem_list in mems:
+                node.add(DetailsNode(mem_text(mem_list), mono=True))
+
+        add_registers("Input", summary.input_regs, summary.input_mems)
+        add_registers("Output", summary.output_regs, summary.output_mems)
+
+        node = root.add(DetailsNode("Clobbers"))
+        for group in summary.clobbers:
+            ep = group.ep
+            if group.call:
+                call = group.call
+                parent = node.add(DetailsNode(lambda call=call: f"{call.entry.pc:X}: {insnentry_to_str(call.entry, app().project.ob)}", ep, mono=True))
+                for reg in group.regs:
+                    parent.add(DetailsNode(str(reg), ep, mono=True))
+                for mem_list in group.mems:
+                    parent.add(DetailsNode(mem_text(mem_list), ep, mono=True))
+            else:
+                for reg in group.regs:
+                    node.add(DetailsNode(f"{ep:X}: {reg}", ep, mono=True))
+                for mem_list in group.mems:
+                    node.add(DetailsNode(mem_text(mem_list, ep), ep, mono=True))
+
+    def add_timing(self, node: DetailsNode):
+        function = self.fun
+        loop_bounds = app().project.loop_bounds
+        timing = app().project.wcet(function)
+        node.add(DetailsNode(f"WCET: {timing} states"))
+        for ep in timing.unbounded:
+            if ep in function.blocks:
+                node.add(DetailsNode(f"{ep:X}: no loop bound", ep, mono=True, loop=ep))
+            else:
+                node.add(DetailsNode(f"{ep:X}: unbounded in callee", mono=True))
+        for ep in sorted(function.blocks):
+            if ep in loop_bounds:
+                node.add(DetailsNode(f"{ep:X}: loop bound {loop_bounds[ep]}", ep, mono=True, loop=ep))
+        for ep, block in sorted(function.blocks.items()):
+            node.add(DetailsNode(f"{ep:X}: {block.cycles} states", ep, mono=True))
+
+    # Flattens the open part of the tree into the rows of the recycle view
+    def update_rows(self):
+        rows = []
+        def visit(node: DetailsNode, level: int):
+            for child in node.children:
+                rows.append({
+                    "node": child,
+                    "font_name": FONT_NAME if child.mono else "Roboto",
+                    "level": level,
+                    "is_leaf": not child.children,
+                    "is_open": child.is_open,
+                    "odd": len(rows) % 2 == 1
+                })
+                if child.is_open: visit(child, level + 1)
+        visit(self.root, 0)
+        self.data = rows
+
+    def toggle_node(self, node: DetailsNode):
+        node.is_open = not node.is_open
+        self.update_rows()
 
     def refresh(self):
-        for label in iter_all_children_of_type(self, ListingViewLabel):
-            label.refresh()
-
-        self.name_node.text = self.fun.name
+        # Changing a loop bound drops the estimates of all functions
+        if self.fun.timing is None:
+            self.timing_node.children = []
+            self.add_timing(self.timing_node)
+        self.update_rows()
 
     def serialize(self, data: dict):
-        open_state = []
-        node: TreeViewLabel
-        for node in self.iterate_all_nodes():
-            open_state.append({
-                "is_open": node.is_open
-            })
         data["tree"] = {
-            "open_state": open_state,
-            "scroll_y": self.parent.scroll_y,
+            "open": {path: node.is_open for path, node in self.root.iterate_paths()},
+            "scroll_y": self.scroll_y,
             "splitter_width": self.container.splitter.width,
             "toggled": self.container.listing.toggled
         }
@@ -356,11 +396,14 @@ class FunctionListingDetails(KWidget, TreeView):
     def deserialize_post(self, data: dict):
         if "tree" in data:
             tree = data["tree"]
-            if "open_state" in tree:
-                for node, node_data in zip(self.iterate_all_nodes(), tree["open_state"]):
-                    node.is_open = node_data.get("is_open", node.is_open)
+            # The old open_state list was by position, it doesn't survive nodes being added
+            if "open" in tree:
+                open_state = tree["open"]
+                for path, node in self.root.iterate_paths():
+                    node.is_open = open_state.get(path, node.is_open)
+                self.update_rows()
             if "scroll_y" in tree:
-                self.parent.scroll_y = tree["scroll_y"]
+                self.scroll_y = tree["scroll_y"]
             if "splitter_width" in tree:
                 self.container.splitter.width = tree["splitter_width"]
             if "toggled" in tree:
@@ -379,9 +422,7 @@ class FunctionListingContainer(BoxLayout):
 
         self.details = FunctionListingDetails(function, self)
         self.splitter = Splitter(size_hint=(None, 1), width=dp(400), sizable_from='right')
-        scrollview = ScrollView(size_hint=(1, 1))
-        scrollview.add_widget(self.details)
-        self.splitter.add_widget(scrollview)
+        self.splitter.add_widget(self.details)
         self.add_widget(self.splitter)
 
         self.listing = FunctionListing(function)
@@ -398,15 +439,17 @@ class FunctionListing(ListingPanel):
 
     def __init__(self, function: Function, **kwargs):
         self.fun = function
-        self.sections: list[Section] | None = None
         super().__init__(**kwargs)
 
     def get_sections(self):
-        if self.sections: return self.sections
-        self.sections = list(
-            sorted(map(lambda b: b.to_section(), self.fun.blocks.values()), 
-                   key=lambda s: s.offset))
-        return self.sections
+        return self.fun.get_sections()
+
+    # The sections of a function only change with analysis, all listings of it share their layout
+    def get_layout(self, name: str, compute: Callable[[], Any]) -> Any:
+        layout = self.fun.layouts.get(name)
+        if layout is None:
+            layout = self.fun.layouts[name] = compute()
+        return layout
     
     def toggle(self):
         self.toggled = not self.toggled
@@ -416,8 +459,9 @@ class FunctionListing(ListingPanel):
 class ListingTab(SerializableTab):
     _content: FunctionListingContainer
 
-    def __init__(self, text: str, **kwargs):
-        super().__init__(text=text, closeable=True, source="ui/resources/code-listing.png", **kwargs)
+    def __init__(self, fun: Function, **kwargs):
+        super().__init__(text=fun.name, closeable=True, source="ui/resources/code-listing.png", **kwargs)
+        self.fun = fun
 
     @property
     def content(self) -> FunctionListing:
@@ -425,7 +469,7 @@ class ListingTab(SerializableTab):
 
     def serialize(self) -> dict:
         res = super().serialize()
-        res["function"] = self.content.fun.ep
+        res["function"] = self.fun.ep
         self.content.serialize(res)
         self._content.details.serialize(res)
         return res
@@ -437,14 +481,19 @@ class ListingTab(SerializableTab):
     
     @classmethod
     def deserialize(cls, data: dict) -> "ListingTab":
-        ep = data["function"]
+        tab = cls.deserialize_lazy(data)
+        tab.build_content(data)
+        return tab
+    
+    @classmethod
+    def deserialize_lazy(cls, data: dict) -> "ListingTab":
         functions = app().project.functions
         assert functions
-        fun = functions[ep]
-        tab = ListingTab(fun.name)
-        listing = FunctionListingContainer(fun)
-        tab.add_widget(listing)
-        return tab
+        return ListingTab(functions[data["function"]])
+    
+    def build_content(self, data: dict):
+        self.text = self.fun.name
+        self.add_widget(FunctionListingContainer(self.fun))
 
     def deserialize_post(self, data: dict):
         self.content.deserialize_post(data)
@@ -0,0 +1,127 @@
+import json, os, threading, logging
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import md5
+from pathlib import Path
+
+from core.project import Function, Project
+from core.layered_layout import LAYOUT_VERSION
+
+# Number of layouts kept in memory
+MAX_LAYOUTS = 256
+# Number of functions laid out in the background after analysis
+PREFETCH_LIMIT = 64
+
+Sizes = dict[int, tuple[float, float]]
+
+# Function graph layouts are expensive, they are cached in memory and on disk.
+# The key is a hash over the block structure and the node sizes, so any change
+# to the function or to the text inside of a block results in a new layout.
+# Layouts of older versions of the layout algorithm are never looked up again.
+class LayoutCache:
+    def __init__(self, folder: Path | None = None, workers: int = 2):
+        self.folder = folder
+        self.layouts: OrderedDict[str, dict] = OrderedDict()
+        self.pending: dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="layout")
+
+        if folder: folder.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(fun: Function, project: Project) -> tuple[str, Sizes]:
+        sizes = fun.block_sizes(project.get_text())
+        h = md5(f"{LAYOUT_VERSION}:{fun.ep}".encode())
+        for ep in sorted(fun.blocks):
+            block = fun.blocks[ep]
+            h.update(repr((ep, block.len, sorted(block.succ), sizes[ep])).encode())
+        return h.hexdigest(), sizes
+
+    def _remember(self, key: str, layout: dict):
+        with self.lock:
+            self.layouts[key] = layout
+            self.layouts.move_to_end(key)
+            while len(self.layouts) > MAX_LAYOUTS:
+                self.layouts.popitem(last=False)
+
+    def _lookup(self, key: str) -> dict | None:
+        with self.lock:
+            layout = self.layouts.get(key)
+            if layout is not None:
+                self.layouts.move_to_end(key)
+                return layout
+
+        if self.folder:
+            try:
+                with open(self.folder / (key + ".json"), "r") as fp:
+                    layout = json.load(fp)
+                self._remember(key, layout)
+                return layout
+            except (FileNotFoundError, json.JSONDecodeError): pass
+        return None
+
+    def _compute(self, key: str, fun: Function, sizes: Sizes) -> dict:
+        try:
+            layout = self._lookup(key)
+            if layout is not None: return layout
+
+            layout = fun.graph_layout(sizes)
+            self._remember(key, layout)
+            if self.folder:
+                tmp = self.folder / (key + ".tmp")
+                with open(tmp, "w") as fp:
+                    json.dump(layout, fp)
+                os.replace(tmp, self.folder / (key + ".json"))
+            return layout
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def _submit(self, key: str, fun: Function, sizes: Sizes) -> Future:
+        with self.lock:
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pool.submit(self._compute, key, fun, sizes)
+                self.pending[key] = future
+            return future
+
+    def get(self, fun: Function, project: Project) -> dict:
+        key, sizes = self.key(fun, project)
+        with self.lock:
+            layout = self.layouts.get(key)
+        if layout is not None: return layout
+        # Blocks until the layout is done, jobs that are already running are reused
+        return self._submit(key, fun, sizes).result()
+
+    def prefetch(self, functions: list[Function], project: Project):
+        for fun in functions[:PREFETCH_LIMIT]:
+            if fun.state is None: continue
+            try:
+                key, sizes = self.key(fun, project)
+            except KeyError:
+                logging.warning("Can't lay out function %s", fun.name)
+                continue
+            with self.lock:
+                if key in self.layouts: continue
+            self._submit(key, fun, sizes)
+
+    # Starts laying out a single function in the background, None if it's already done
+    def request(self, fun: Function, project: Project) -> Future | None:
+        try:
+            key, sizes = self.key(fun, project)
+        except KeyError:
+            logging.warning("Can't lay out function %s", fun.name)
+            return None
+        with self.lock:
+            if key in self.layouts: return None
+        return self._submit(key, fun, sizes)
+
+    # Jobs that are already running can't be cancelled, their result is kept
+    def cancel(self, future: Future):
+        if future.cancel():
+            with self.lock:
+                for key, f in list(self.pending.items()):
+                    if f is future: del self.pending[key]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -1,8 +1,9 @@
 from pathlib import Path
-import json, shutil, tempfile, sys, traceback, logging
+import json, sys, traceback, logging
 
 from abc import ABC, abstractmethod
-from typing import Any, Callable, TypeVar, Type, Generator, cast
+from threading import Thread
+from typing import Any, Callable, TypeVar, Type, Generator, cast, TYPE_CHECKING
 from platformdirs import PlatformDirs
 from configparser import ConfigParser
 
@@ -18,6 +19,7 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.floatlayout import FloatLayout
 from kivy.event import EventDispatcher
 from kivy.utils import get_color_from_hex
+from kivy.properties import NumericProperty, StringProperty
 
 # Patch widget class TODO Handle on_leave when children move out of view
 def on_mouse_move(self: Widget, pos):
@@ -50,10 +52,6 @@ LABEL_HEIGHT = FONT_SIZE + dp(5)
 FONT_NAME = "ui/resources/RobotoMono"
 BG_COLOR = get_color_from_hex("#1F1F1F")
 
-_graph_tmpfolder: str
-def graph_tmpfolder() -> str:
-    return _graph_tmpfolder
-
 def app() -> "DisApp":
     return cast("DisApp", App.get_running_app())
 
@@ -111,22 +109,32 @@ class NavigationListing(NavigationAction):
         except ValueError as e:
             pass # Invalid location
 
-from .project import Section, Project
+from core.project import Section, Project, ProjectListener
+from core.startup import profile
 from .main_menu import build_menu
 from .sections import RV
-from .function_graph import GraphTab, FunctionPanel
 from .buttons import IconButton
-from .function_analyzer import AnalyzerPanel, AnalyzerFilter, AnalyzerTab
 from .context_menu import ContextMenuBehavior
-from .popup import FunctionAnalyzerPopup
-from .dock.dock import BaseDock, Dock, Orientation, SerializableTab, DockSplitter, DockPanel
-from .call_graph import CallGraphPanel, CallGraphTab
+from .popup import FunctionAnalyzerPopup, show_invalid_insn
+from .dock.dock import BaseDock, Dock, Orientation, SerializableTab, DockSplitter, DockPanel, register_lazy_panel
 from .function_listing import FunctionListingContainer, FunctionListing, ListingPanel, ListingPanelBase, ListingTab
-from .memory_view import MemoryViewTab
+from .graph_layout import LayoutCache
+from .arrow import clear_cache
+
+if TYPE_CHECKING:
+    from .function_graph import GraphTab
+    from .function_analyzer import AnalyzerPanel, AnalyzerFilter
+
+# Views that aren't needed for the first frame are imported once they get opened
+register_lazy_panel("GraphTab", "ui.function_graph")
+register_lazy_panel("CallGraphTab", "ui.call_graph")
+register_lazy_panel("AnalyzerTab", "ui.function_analyzer")
+register_lazy_panel("MemoryViewTab", "ui.memory_view")
 
+# Edits a single value in place, commit is called with the text once the input loses focus
 class RenameInput(BoxLayout, EscapeTrigger):
     input: TextInput
-    ep: int
+    commit: Callable[[str], None]
 
     def on_kv_post(self, base_widget):
         self.input = self.children[0]
@@ -134,7 +142,7 @@ class RenameInput(BoxLayout, EscapeTrigger):
 
     def _on_focus(self, instance, value):
         if not value:
-            app().project.rename_label(self.ep, self.input.text)
+            self.commit(self.input.text)
             self.hide()
 
     def hide(self):
@@ -145,12 +153,15 @@ class RenameInput(BoxLayout, EscapeTrigger):
     def show(self, ep: int, x: int, y: int):
         label = app().project.ob.label(ep)
         if not label: return
+        self.edit(label.name, x, y, lambda text: app().project.rename_label(ep, text))
+
+    def edit(self, text: str, x: int, y: int, commit: Callable[[str], None]):
         app().main_dock.unfocus_all()
-        self.ep = ep
+        self.commit = commit
         self.pos = (x, y)
         self.disabled = False
         self.opacity = 1
-        self.input.text = label.name
+        self.input.text = text
         self.input.focus = True
 
     def on_escape(self, obj):
@@ -158,6 +169,11 @@ class RenameInput(BoxLayout, EscapeTrigger):
 
 class MainWindow(FloatLayout): pass
 
+# Shown while the project is read on a background thread
+class LoadingScreen(FloatLayout):
+    text = StringProperty("")
+    value = NumericProperty(0)
+
 class GotoPosition(HideableTextInput, EscapeTrigger):
     def _on_focus(self, instance, value, *largs):
         if not value: self.hide()
@@ -213,21 +229,36 @@ class MainDockTab(SerializableTab):
     def deserialize_post(self, dict):
         self.content.deserialize_post(dict)
 
+class AppProjectListener(ProjectListener):
+    def label_renamed(self, ep: int):
+        app().main_dock.refresh(ep = ep)
+
+    def sections_changed(self):
+        clear_cache()
+
 class DisApp(App):
     _any_hovered = False
 
-    def __init__(self, project: Project):
+    # project is either loaded already or the folder to load it from after the window opens
+    def __init__(self, project: Project | Path):
         super().__init__()
-        self.project = project
+        self.project_folder: Path | None = None
+        self.project_listener = AppProjectListener()
+        if isinstance(project, Project):
+            self.project = project
+            project.listeners.append(self.project_listener)
+        else:
+            self.project_folder = project
 
         self.goto_position: GotoPosition
         self.window: MainWindow
         self.back_button: IconButton
         self.forward_button: IconButton
         self.y_splitter: Splitter
-        self.analyzer_panel: AnalyzerPanel | None = None
+        self.analyzer_panel: "AnalyzerPanel | None" = None
         self.dis_panel: ListingPanel
-        self.analyzer_filter: AnalyzerFilter
+        self.analyzer_filter: "AnalyzerFilter"
+        self.loading_screen: LoadingScreen | None = None
         self.main_dock: Dock
         self.rename_input: RenameInput
 
@@ -239,15 +270,52 @@ class DisApp(App):
         self.shift_down = False
 
         self.global_event_bus = GlobalEventBus()
+        self.layout_cache = LayoutCache(dirs.user_cache_path / "layouts")
+    
+    def build(self):
+        Window.clearcolor = BG_COLOR
 
+        if self.project_folder:
+            self.loading_screen = LoadingScreen(text="Loading " + self.project_folder.name)
+            return self.loading_screen
+        return self.build_main()
+
+    def on_start(self):
+        if self.project_folder:
+            Thread(target=self._read_project, args=(self.project_folder,), daemon=True).start()
+
+    def _read_project(self, folder: Path):
+        def progress(text: str, value: float):
+            def update(dt):
+                if not self.loading_screen: return
+                self.loading_screen.text = text
+                self.loading_screen.value = value
+            Clock.schedule_once(update, 0)
+
+        try:
+            project = Project.read_from_file(folder, progress)
+        except Exception as e:
+            logging.exception("Error loading project %s", folder)
+            progress(f"Couldn't load {folder.name}: {e}", 0)
+            return
+        
+        Clock.schedule_once(lambda dt: self._project_loaded(project), 0)
+
+    def _project_loaded(self, project: Project):
+        self.project = project
+        project.listeners.append(self.project_listener)
+
+        Window.remove_widget(self.loading_screen)
+        self.loading_screen = None
+        self.root = self.build_main()
+        Window.add_widget(self.root)
+
+    def build_main(self):
         Window.bind(mouse_pos=self.on_mouse_move)
         Window.bind(on_mouse_up=ContextMenuBehavior.on_mouse_up)
         Window.bind(on_mouse_down=ContextMenuBehavior.on_mouse_down)
         Window.bind(on_key_down=self._keydown)
         Window.bind(on_key_up=self._keyup)
-    
-    def build(self):
-        Window.clearcolor = BG_COLOR
 
         self.window = MainWindow()
         self.app_menu = self.window.ids["app_menu"]
@@ -261,17 +329,22 @@ class DisApp(App):
         self.forward_button.bind(on_press=lambda w: self.go_forward())
 
         build_menu()
-        if not self.load_ui_state():
-            self.main_dock.clear_widgets()
-            self.dis_panel = ListingPanel(is_root=True)
-            tab = MainDockTab(text=self.project.filename)
-            tab.add_widget(self.dis_panel)
-            self.main_dock.add_tab(tab)
+        with profile.phase("ui state"):
+            if not self.load_ui_state():
+                self.main_dock.clear_widgets()
+                self.dis_panel = ListingPanel(is_root=True)
+                tab = MainDockTab(text=self.project.filename)
+                tab.add_widget(self.dis_panel)
+                self.main_dock.add_tab(tab)
 
         Clock.schedule_once(lambda dt: self.on_post(), 0)
         return self.window
 
     def on_post(self):
+        if profile.enabled:
+            print(profile.report())
+            profile.enabled = False
+
         if not self.project.functions:
             self.analyze_functions(lambda: None)
 
@@ -309,18 +382,23 @@ class DisApp(App):
                     dock.panel = DockPanel(root, dock)
                     BoxLayout.add_widget(dock, dock.panel)
 
+                    # Only the tab that ends up visible gets built, the others when they are selected
                     tab_index = data.get("tab_index", 0)
                     for i, tab_data in enumerate(reversed(data["tab"])):
-                        tab = SerializableTab.deserialize_panel(tab_data)
+                        tab = SerializableTab.deserialize_panel(tab_data, lazy=True)
                         if tab:
                             tab.root = root
-                            dock.panel.add_widget(tab)
-                            tab.deserialize_post(tab_data)
+                            dock.panel.add_widget(tab, lazy=True)
+                            if tab.pending is None: tab.deserialize_post(tab_data)
                             if i == tab_index: tab.select()
                             if tab_data.get("active", False):
                                 nonlocal active_tab
                                 active_tab = tab
 
+                    current = dock.panel._current_widget
+                    if current and current.pending is not None:
+                        dock.panel.select_widget(current)
+
                 if "second" in data:
                     assert dock.splitter
                     dock.second_panel = BaseDock(root, dock)
@@ -361,7 +439,11 @@ class DisApp(App):
                 tabs = []
                 for tab in panel.panel.iterate_panels():
                     if isinstance(tab, SerializableTab):
-                        data = tab.serialize()
+                        if tab.pending is not None:
+                            # Never shown since it was restored
+                            data = dict(tab.pending)
+                            data.pop("active", None)
+                        else: data = tab.serialize()
                         if tab.root and tab.root.is_active(tab):
                             data["active"] = True
                         tabs.append(data)
@@ -453,12 +535,12 @@ class DisApp(App):
     def switch_to_listing(self, main_panel: ListingPanelBase | None = None):
         if main_panel:
             for tab in self.main_dock.iterate_panels():
-                if tab.content == main_panel:
+                if tab.pending is None and tab.content == main_panel:
                     tab.select()
                     break
             else: 
                 if isinstance(main_panel, FunctionListing):
-                    tab = ListingTab(text=main_panel.fun.name)
+                    tab = ListingTab(main_panel.fun)
                     tab.add_widget(main_panel.parent)
                     self.main_dock.add_tab(tab, reverse=True)
         else:
@@ -498,14 +580,14 @@ class DisApp(App):
 
         panel: FunctionListingContainer | None = None
         for tab in self.main_dock.iterate_panels():
-            if isinstance(tab, ListingTab) and tab.content.fun == fun:
-                tab.content.highlight(fun, highlight_callee, highlight_caller)
+            if isinstance(tab, ListingTab) and tab.fun == fun:
                 tab.select()
+                tab.content.highlight(fun, highlight_callee, highlight_caller)
                 panel = tab.content.parent
                 break
         
         if not panel:
-            tab = ListingTab(text=fun.name)
+            tab = ListingTab(fun)
             panel = FunctionListingContainer(fun)
             if highlight_callee is not None or highlight_caller is not None:
                 Clock.schedule_once(lambda dt: panel.listing.highlight(fun, highlight_callee, highlight_caller), 0)
@@ -515,21 +597,26 @@ class DisApp(App):
 
         app().update_position_history(NavigationListing(panel.listing, fun.ep))
     
-    def open_function_graph(self, ep: int, rescale=True, callback: Callable[[GraphTab], None] | None = None):
+    def open_function_graph(self, ep: int, rescale=True, callback: "Callable[[GraphTab], None] | None" = None):
+        from .function_graph import GraphTab, FunctionPanel
         fun = self.find_function(ep)
         if not fun: return
 
         for tab in self.main_dock.iterate_panels():
-            if isinstance(tab, GraphTab) and tab.content.fun == fun:
+            if isinstance(tab, GraphTab) and tab.fun == fun:
                 tab.select()
                 return
         
-        tab = GraphTab(fun.name)
+        tab = GraphTab(fun)
         panel = FunctionPanel(fun, tab)
         tab.add_widget(panel)
 
         app().main_dock.add_tab(tab, reverse=True)
 
+        # Callees are likely to be opened next
+        functions = self.project.functions
+        self.layout_cache.prefetch([functions[f] for f in self.project.get_calls().callees(fun.ep)], self.project)
+
         def after(dt):
             panel.move_to_initial_pos()
             if callback: callback(tab)
@@ -537,6 +624,7 @@ class DisApp(App):
         Clock.schedule_once(after, 0)
 
     def open_call_graph(self, ep: int):
+        from .call_graph import CallGraphPanel, CallGraphTab
         fun = self.find_function(ep)
         if not fun: return
 
@@ -557,6 +645,23 @@ class DisApp(App):
         if not label: return
         self.rename_input.show(ep, x, y)
 
+    def open_loop_bound(self, pc: int, x: int, y: int):
+        def commit(text: str):
+            if not text.strip():
+                self.set_loop_bound(pc, None)
+                return
+            try:
+                bound = int(text, 0)
+            except ValueError: return
+            if bound > 0: self.set_loop_bound(pc, bound)
+
+        bound = self.project.loop_bounds.get(pc)
+        self.rename_input.edit(str(bound) if bound is not None else "", x, y, commit)
+
+    def set_loop_bound(self, pc: int, bound: int | None):
+        self.project.set_loop_bound(pc, bound)
+        self.main_dock.refresh()
+
     def _keydown(self, window, keyboard: int, keycode: int, text: str, modifiers: list[str]):
         if "ctrl" in modifiers:
             if keycode == 10: # ctrl + g
@@ -591,12 +696,15 @@ class DisApp(App):
             return True
         
     def close_tabs(self):
+        from .function_graph import GraphTab
         for tab in self.main_dock.iterate_panels():
             if isinstance(tab, (GraphTab, ListingTab)):
                 tab.close()
         
     def load_project(self, project: Project):
+        self.project.listeners.remove(self.project_listener)
         self.project = project
+        project.listeners.append(self.project_listener)
 
         # Clear history
         self.position = 0
@@ -616,6 +724,31 @@ class DisApp(App):
         self.dis_panel.arrows.redraw()
         self.dis_panel.minimap.update()
         
+    def resolve_jump_tables(self):
+        def callback(found: int):
+            logging.info("Resolved %d jump and call tables", found)
+            self.dis_panel.rv.update_data()
+            self.dis_panel.arrows.recompute_arrows()
+            self.dis_panel.arrows.redraw()
+            self.dis_panel.minimap.update()
+
+        self.project.resolve_jump_tables(callback, show_invalid_insn)
+
+    def recover_data_pointers(self):
+        from .memory_view import MemoryViewTab
+        found = self.project.recover_data_pointers()
+        logging.info("Typed %d data labels", found)
+        if not found: return
+
+        self.dis_panel.rv.update_data()
+        self.dis_panel.arrows.recompute_arrows()
+        self.dis_panel.arrows.redraw()
+        self.dis_panel.minimap.update()
+        for tab in self.main_dock.iterate_panels():
+            if isinstance(tab, MemoryViewTab):
+                tab.content.rv.update_data()
+                tab.content.recalculate()
+
     def analyze_functions(self, callback):
         wait: ClockEvent = None
         total_amount = 0
@@ -631,6 +764,10 @@ class DisApp(App):
             popup.dismiss()
             callback()
 
+            # Lay out the most referenced functions in the background
+            functions = sorted(app().project.functions.values(), key=lambda f: f.frequency if f.state else 0, reverse=True)
+            self.layout_cache.prefetch(functions, app().project)
+
         def progress(i: int, fun: str):
             popup.value = i
             popup.current = fun
@@ -644,6 +781,7 @@ class DisApp(App):
         popup.open()
         
     def open_function_list(self):
+        from .function_analyzer import AnalyzerPanel, AnalyzerTab
         tab = AnalyzerTab()
 
         if not self.analyzer_panel:
@@ -659,6 +797,7 @@ class DisApp(App):
         tab.select()
 
     def open_memory_view(self):
+        from .memory_view import MemoryViewTab
         for tab in self.main_dock.iterate_panels():
             if isinstance(tab, MemoryViewTab):
                 tab.select()
@@ -689,19 +828,14 @@ class DisApp(App):
         return DisApp._any_hovered
     
     def on_stop(self):
-        try:
-            shutil.rmtree(_graph_tmpfolder)
-        except FileNotFoundError: pass
-        self.save_ui_state()
+        self.layout_cache.shutdown()
+        if not self.loading_screen: self.save_ui_state()
         super().on_stop()
 
-def main(project: Project):
+def main(project: Project | Path):
     global config
     config = ConfigParser()
     config.read(config_file)
 
-    global _graph_tmpfolder
-    _graph_tmpfolder = tempfile.mkdtemp()
-
     app = DisApp(project)
     app.run()
@@ -10,7 +10,7 @@ from kivy.core.window import Window
 from kivy_garden.contextmenu import AppMenuTextItem, ContextMenu, ContextMenuTextItem, AbstractMenuItem
 
 from .main import app
-from .project import Project
+from core.project import Project
 
 class MenuHandler(ABC):
     def on_close(self): pass
@@ -32,6 +32,8 @@ main_menu = [
     ]),
     MenuItem(None, "Analyze", [
         MenuItem("functions", "Functions"),
+        MenuItem("jump_tables", "Resolve Jump Tables"),
+        MenuItem("data_pointers", "Recover Data Pointers"),
         MenuItem("memory", "Memory View")
     ])
 ]
@@ -43,6 +45,10 @@ class MainMenuHandler(MenuHandler):
                 app().analyze_functions(lambda: app().open_function_list())
 
             else: app().open_function_list()
+        elif item == "jump_tables":
+            app().resolve_jump_tables()
+        elif item == "data_pointers":
+            app().recover_data_pointers()
         elif item == "memory":
             app().open_memory_view()
         elif item == "save":
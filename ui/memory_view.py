@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from functools import cache
+from bisect import bisect_left
 
 import math
 from typing import cast
@@ -16,7 +17,7 @@ from kivy.uix.recycleboxlayout import RecycleBoxLayout
 
 from ui.kivytypes import KWidget
 
-from .project import DATA_PER_ROW, MAX_SECTION_LENGTH, CodeSection, DataSection, Instruction, Section, VirtualByteArray
+from core.project import DATA_PER_ROW, MAX_SECTION_LENGTH, CodeSection, DataSection, Instruction, Section, VirtualByteArray
 from .main import BG_COLOR, FONT_HEIGHT, app
 from .sections import RV, EditableLabel, ScrollBar, SectionBase, SectionData, FONT_SIZE, FONT_NAME, LABEL_HEIGHT
 from .function_listing import ListingPanelBase
@@ -90,22 +91,19 @@ class MemoryView(ListingPanelBase, RelativeLayout):
         data["selection_start"] = self.rv.selection_start
         data["selection_end"] = self.rv.selection_end
 
-        expanded_sections: list[int] = []
+        # Offsets of the rows in front of expanded sections, row indices change with the labels
+        expanded: list[int] = []
         for d in self.rv.data:
             if "collapse" in d:
-                expanded_sections.append(d["collapse"])
-        data["expanded_sections"] = expanded_sections
+                expanded.append(self.rv.data[d["collapse"] - 1]["section"].offset)
+        data["expanded_offsets"] = expanded
 
     def deserialize_post(self, data: dict):
-        if "expanded_sections" in data:
-            expanded_sections: list[int] = data["expanded_sections"]
-            for collapse_index in expanded_sections:
-                collapsed_sections = self.rv.data[collapse_index-1]["collapsed_sections"]
-                if collapsed_sections is not None:
-                    del self.rv.data[collapse_index-1]["collapsed_sections"]
-                    collapsed_sections[-1]["collapse"] = collapse_index
-                    collapsed_sections[-1]["collapse_size"] = len(collapsed_sections)
-                    self.rv.data[collapse_index:collapse_index] = collapsed_sections
+        if "expanded_offsets" in data:
+            expanded = set(data["expanded_offsets"])
+            for i, d in enumerate(self.rv.data):
+                if "collapsed_sections" in d and d["section"].offset in expanded:
+                    self.rv.expand(i)
             self.recalculate()
 
         if "scroll_y" in data:
@@ -138,6 +136,31 @@ def directive_from_label(type: int | None) -> str:
     if type == LWORD: return ".dd"
     return ".db"
 
+# Arrays and strings found by Project.recover_data_pointers
+def typename_of(label: Label) -> str:
+    if label.string: return f"char[{label.elements}]"
+    name = typename_from_label(label.type)
+    if label.stride is not None: name = f"struct[{label.stride}]"
+    if label.elements != 1: name += f"[{label.elements}]"
+    return name
+
+def stride_of(label: Label) -> int:
+    return label.stride or size_from_label(label.type)
+
+def label_size(label: Label) -> int:
+    return stride_of(label) * label.elements
+
+def element_instructions(label: Label, offset: int, length: int) -> list[Instruction]:
+    # One row per element, split into rows of DATA_PER_ROW bytes for long ones
+    res = []
+    stride = DATA_PER_ROW if label.string else stride_of(label)
+    directive = ".db" if label.string else directive_from_label(label.type)
+    for start in range(offset, offset + length, stride):
+        end = min(start + stride, offset + length)
+        for row in range(start, end, DATA_PER_ROW):
+            res.append(Instruction(InsnEntry(row, min(DATA_PER_ROW, end - row), directive, (0,))))
+    return res
+
 class MemorySection(SectionBase):
     rv: "MemoryRV"
 
@@ -175,13 +198,13 @@ class MemorySection(SectionBase):
         if len(section.labels) > 0:
             label = app().project.ob.label(section.offset)
             assert label
-            self.ids["type"].text = typename_from_label(label.type)
+            self.ids["type"].text = typename_of(label)
             
 
 class MemorySnip(KWidget, Widget):
     parent: MemorySection
     view: MemoryView
-    collapsed_sections: list[dict] | None = ObjectProperty(None, allownone=True)
+    collapsed_sections: "CollapsedRows | None" = ObjectProperty(None, allownone=True)
     xoffset: int = NumericProperty(0)
 
     def __init__(self, **kwargs):
@@ -195,9 +218,8 @@ class MemorySnip(KWidget, Widget):
         with self.canvas:
             self.canvas.clear()
             if self.collapsed_sections is not None:
-                first: Section = self.collapsed_sections[0]["section"]
-                last: Section = self.collapsed_sections[-1]["section"]
-                label = CoreLabel(text=f"... ({last.offset + last.length - first.offset} bytes collapsed) ...", font_size=FONT_SIZE, font_name=FONT_NAME, color=get_color_from_hex("#888888"))
+                collapsed = self.collapsed_sections
+                label = CoreLabel(text=f"... ({collapsed.end - collapsed.start} bytes collapsed) ...", font_size=FONT_SIZE, font_name=FONT_NAME, color=get_color_from_hex("#888888"))
                 label.refresh()
                 Rectangle(texture=label.texture, pos=(self.x + self.xoffset + dp(250), self.y), size=label.texture.size)
             elif self.collapse >= 0:
@@ -216,7 +238,7 @@ class MemorySnip(KWidget, Widget):
             collapsed_sections = self.parent.rv.data[self.collapse:self.collapse+self.collapse_size]
             del self.parent.rv.data[self.collapse:self.collapse+self.collapse_size]
             last = self.parent.rv.data[self.collapse-1]
-            last["collapsed_sections"] = collapsed_sections
+            last["collapsed_sections"] = CollapsedRows(self.parent.rv, collapsed_sections)
 
             # Subtract from all following collapse indices
             for d in self.parent.rv.data[self.collapse:]:
@@ -227,24 +249,41 @@ class MemorySnip(KWidget, Widget):
             section: Section = last["section"]
             Clock.schedule_once(lambda dt: self.parent.rv.scroll_to_offset(section.offset + section.length - 1))
         elif self.collapsed_sections is not None:
-            # Expand
-            del self.parent.rv.data[self.index]["collapsed_sections"]
-            self.collapsed_sections[-1]["collapse"] = self.index + 1
-            self.collapsed_sections[-1]["collapse_size"] = len(self.collapsed_sections)
-            self.parent.rv.data[self.index+1:self.index+1] = self.collapsed_sections
-            
-            # Add to all following collapse indices
-            for d in self.parent.rv.data[self.index + 1 + len(self.collapsed_sections):]:
-                if "collapse" in d:
-                    d["collapse"] += len(self.collapsed_sections)
-
+            collapsed_sections = self.parent.rv.expand(self.index)
             self.view.recalculate()
-            section: Section = self.collapsed_sections[-1]["section"]
+            section: Section = collapsed_sections[-1]["section"]
             Clock.schedule_once(lambda dt: self.parent.rv.scroll_to_offset(section.offset + section.length - 1))
         return True
 
 MIN_COLLAPSE_SIZE = DATA_PER_ROW * 5
 
+class CollapsedRows:
+    # Rows hidden behind a snip. Pieces are either existing rows or (start, end)
+    # ranges of external memory that are only split into rows when expanded.
+    def __init__(self, rv: "MemoryRV", pieces: list[dict | tuple[int, int]]):
+        self.rv = rv
+        self.pieces = pieces
+
+    @property
+    def start(self) -> int:
+        first = self.pieces[0]
+        if isinstance(first, tuple): return first[0]
+        return first["section"].offset
+
+    @property
+    def end(self) -> int:
+        last = self.pieces[-1]
+        if isinstance(last, tuple): return last[1]
+        section: Section = last["section"]
+        return section.offset + section.length
+
+    def rows(self) -> list[dict]:
+        rows = []
+        for piece in self.pieces:
+            if isinstance(piece, tuple): rows.extend(self.rv.virtual_rows(*piece))
+            else: rows.append(piece)
+        return rows
+
 class MemoryRV(RV):
     parent: MemoryView
     data: list[dict]
@@ -268,94 +307,116 @@ class MemoryRV(RV):
         if self.hovered != was_hovered:
             self.parent.overlaps.redraw()
 
+    def virtual_rows(self, start: int, end: int) -> list[dict]:
+        rows = []
+        for offset in range(start, end, MAX_SECTION_LENGTH):
+            length = min(MAX_SECTION_LENGTH, end - offset)
+            rows.append({"section": DataSection(offset, length, [], VirtualByteArray(length, 0x0)),
+                         "rv": self})
+        return rows
+
+    # Inserts the rows collapsed behind row index and returns them
+    def expand(self, index: int) -> list[dict]:
+        collapsed_sections = self.data[index]["collapsed_sections"].rows()
+        del self.data[index]["collapsed_sections"]
+        collapsed_sections[-1]["collapse"] = index + 1
+        collapsed_sections[-1]["collapse_size"] = len(collapsed_sections)
+        self.data[index+1:index+1] = collapsed_sections
+
+        # Add to all following collapse indices
+        for d in self.data[index + 1 + len(collapsed_sections):]:
+            if "collapse" in d:
+                d["collapse"] += len(collapsed_sections)
+        return collapsed_sections
+
     def update_data(self):
-        data = []
+        data: list[dict] = []
         section: Section
         project = app().project
-        
+
+        # Sorted data labels, every region looks up its labels with bisect
+        labels = sorted((l for l in project.ob.labels.values() if l.kind == LabelKind.DATA), key=lambda l: l.location)
+        locations = [l.location for l in labels]
+
+        # Unlabeled rows after the last label. The first one is shown, the rest is collapsed
+        # and only turned into rows when expanded.
+        run: list[dict | tuple[int, int]] = []
+        def flush():
+            if not run: return
+            first = run[0]
+            rest = run[1:]
+            if isinstance(first, tuple):
+                start, end = first
+                rows = self.virtual_rows(start, min(end, start + MAX_SECTION_LENGTH))
+                if end > start + MAX_SECTION_LENGTH:
+                    rest.insert(0, (start + MAX_SECTION_LENGTH, end))
+                first = rows[0]
+            data.append(first)
+            run.clear()
+
+            if not rest: return
+            collapsed = CollapsedRows(self, rest)
+            if collapsed.end - collapsed.start > MIN_COLLAPSE_SIZE:
+                first["collapsed_sections"] = collapsed
+            else:
+                data.extend(collapsed.rows())
+
         for region in project.addresses:
             if region.start == project.org:
                 for section in project.sections.values():
                     if isinstance(section, CodeSection): continue
                     label2 = project.ob.label(section.offset)
                     if label2 is not None and label2.kind == LabelKind.DATA and label2.type is not None:
-                        offset = size_from_label(label2.type)
-                        d = int.from_bytes(cast(bytearray, section.data[:offset]), "big")
-                        label_section = DataSection(section.offset, offset, [label2], section.data[0:offset], [Instruction(InsnEntry(section.offset, offset, directive_from_label(label2.type), (d,)))])
+                        if label2.elements != 1 or label2.string:
+                            offset = min(section.length, label_size(label2))
+                            insn = element_instructions(label2, section.offset, offset)
+                        else:
+                            offset = size_from_label(label2.type)
+                            d = int.from_bytes(cast(bytearray, section.data[:offset]), "big")
+                            insn = [Instruction(InsnEntry(section.offset, offset, directive_from_label(label2.type), (d,)))]
+                        label_section = DataSection(section.offset, offset, [label2], section.data[0:offset], insn)
+                        flush()
                         data.append({"section": label_section, 
                                     "rv": self})
                         if section.length - offset > 0:
                             rest_section = DataSection(section.offset + offset, section.length - offset, [], section.data[offset:])
-                            data.append({"section": rest_section, 
+                            run.append({"section": rest_section, 
                                         "rv": self})
-                    else:
+                    elif len(section.labels) > 0:
+                        flush()
                         data.append({"section": section, 
                                     "rv": self})
+                    else:
+                        run.append({"section": section, 
+                                    "rv": self})
             else:
-                labels = project.ob.labels.values()
-                label: Label
-                filtered_labels = []
-                for label in labels:
-                    if label.location >= region.start and label.location < region.start + region.size and label.kind == LabelKind.DATA:
-                        filtered_labels.append(label)
-                filtered_labels.sort(key=lambda l: l.location)
-
-                for i in range(len(filtered_labels)):
-                    label = filtered_labels[i]
+                region_end = region.start + region.size
+                lo = bisect_left(locations, region.start)
+                hi = bisect_left(locations, region_end)
+
+                for i in range(lo, hi):
+                    label = labels[i]
                     start = label.location
-                    end = region.start + region.size
-                    if i + 1 < len(filtered_labels):
-                        end = filtered_labels[i + 1].location
+                    end = locations[i + 1] if i + 1 < hi else region_end
                     size = end - start
 
                     if label.type is not None:
                         name = directive_from_label(label.type)
-                        labelsize = min(size, size_from_label(label.type))
-                        size -= labelsize
+                        labelsize = min(size, label_size(label))
                         vdata = VirtualByteArray(labelsize, 0x0)
-                        data.append({"section": DataSection(label.location, labelsize, [label], vdata, [Instruction(InsnEntry(start, labelsize, name, (0,)))]), 
+                        if label.elements != 1 or label.string:
+                            insn = element_instructions(label, start, labelsize)
+                        else: insn = [Instruction(InsnEntry(start, labelsize, name, (0,)))]
+                        flush()
+                        data.append({"section": DataSection(label.location, labelsize, [label], vdata, insn), 
                                     "rv": self})
                     else: labelsize = 0
-                    
-                    for r in range(0, size, MAX_SECTION_LENGTH):
-                        chunk_size = min(MAX_SECTION_LENGTH, size - r)
-                        vdata = VirtualByteArray(chunk_size, 0x0)
-                        data.append({"section": DataSection(start + r + labelsize, chunk_size, [], vdata), 
-                                    "rv": self})
-                        
-        new_data = []
-        i = 0
-        while i < len(data):
-            d = data[i]
-            new_data.append(d)
-            section: Section = d["section"]
-            collapsed_sections = []
-            i += 1
-            if i < len(data):
-                # Append one section, then collapse all following sections without labels
-                first_d = data[i]
-                next_d = first_d
-                if len(next_d["section"].labels) > 0:
-                    continue
-                new_data.append(next_d)
-                i += 1
-                while True:
-                    if i >= len(data): break
-                    next_d = data[i]
-                    next_section: Section = next_d["section"]
-                    if len(next_section.labels) > 0: 
-                        break
-                    collapsed_sections.append(next_d)
-                    i += 1
-                if collapsed_sections:
-                    first: Section = collapsed_sections[0]["section"]
-                    last: Section = collapsed_sections[-1]["section"]
-                    if last.offset - first.offset + last.length > MIN_COLLAPSE_SIZE:
-                        first_d["collapsed_sections"] = collapsed_sections
-                    else:
-                        new_data.extend(collapsed_sections)
 
-        self.data = new_data
+                    if size > labelsize:
+                        run.append((start + labelsize, end))
+            flush()
+
+        self.data = data
 
     def recalculate_height(self):
         for data in self.data:
@@ -396,7 +457,7 @@ class MemoryOverlaps(KWidget, Widget):
             if label.kind != LabelKind.DATA:
                 continue
 
-            size = size_from_label(label.type)
+            size = label_size(label)
             overlap = Overlap(section.offset, section.offset + size, 0)
             self.overlaps[section.offset] = overlap
             active_overlaps = [o for o in active_overlaps if o.start_offset < section.offset and o.end_offset > section.offset]
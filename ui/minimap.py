@@ -1,9 +1,11 @@
 from dataclasses import dataclass
 import math
 from itertools import groupby
+from bisect import bisect_left
 
 from kivy.uix.widget import Widget
 from kivy.graphics import Color, Rectangle
+from kivy.graphics.texture import Texture
 from kivy.utils import get_color_from_hex
 from kivy.clock import Clock
 from kivy.metrics import dp
@@ -11,7 +13,10 @@ from kivy.metrics import dp
 from . import main
 from .kivytypes import KWidget
 from .main import app, FONT_HEIGHT, LABEL_HEIGHT, BG_COLOR
-from .project import Section, CodeSection
+from core.project import Section, CodeSection
+
+# Maximum number of rows in the band texture
+BAND_RESOLUTION = 4096
 
 @dataclass
 class CacheEntry:
@@ -25,6 +30,10 @@ class Minimap(KWidget, Widget):
         super().__init__(**kwargs)
 
         self.cache: list[list[CacheEntry]] = [[], []]
+        self.pcs: list[int] = []
+        self.ys: list[float] = []
+        self.band: Texture | None = None
+        self.band_height = 0.0
         self.bind(pos=self.redraw, size=self.redraw)
 
     def on_kv_post(self, base_widget):
@@ -34,35 +43,74 @@ class Minimap(KWidget, Widget):
     def section_height(section: Section): 
         return len(section.instructions) * FONT_HEIGHT + (LABEL_HEIGHT if section.labels else 0)
 
+    # Sorted instruction pcs and their y offset, used to place highlights with bisect,
+    # and the extent of the code regions
+    def compute_layout(self) -> tuple[list[int], list[float], list[CacheEntry]]:
+        pcs: list[int] = []
+        ys: list[float] = []
+        code: list[CacheEntry] = []
+
+        offset = 0
+        for key, group in groupby(self.parent.get_sections(), key=type):
+            start = offset
+            for section in group:
+                if section.labels: offset += LABEL_HEIGHT
+                for insn in section.instructions:
+                    pcs.append(insn.entry.pc)
+                    ys.append(offset)
+                    offset += FONT_HEIGHT
+
+            if key == CodeSection and not isinstance(self.parent, main.FunctionListing):
+                code.append(CacheEntry(y=start, height=offset - start))
+
+        return pcs, ys, code
+
+    # Rebuilds the layout after the sections changed
     def update(self):
-        self.cache[0].clear()
-        self.cache[1].clear()
+        self.pcs = []
+        self.ys = []
+        self.cache[0] = []
+        self.band = None
 
-        sections = self.parent.get_sections()
         if not self.parent.rv: return
-        
-        if self.parent.highlighted is not None:
-            highlighted_set = self.parent.highlighted_set
+        self.pcs, self.ys, self.cache[0] = self.parent.get_layout("minimap", self.compute_layout)
 
-        offset = 0
-        for key, group in groupby(sections, key=type):
-            group = list(group)
-            height = sum(map(self.section_height, group))
-            if key == CodeSection and not isinstance(self.parent, main.FunctionListing):
-                self.cache[0].append(CacheEntry(y=offset, height=height))
+        self.update_highlights()
 
-            if self.parent.highlighted is not None:
-                offset_in_group = 0
-                for section in group:
-                    for insn in section.instructions:
-                        if insn.entry.pc in highlighted_set:
-                            self.cache[1].append(CacheEntry(y=offset + offset_in_group, height=FONT_HEIGHT))
-                        offset_in_group += FONT_HEIGHT
+    def update_highlights(self):
+        self.cache[1].clear()
 
-            offset += height
+        if self.parent.highlighted is not None:
+            pcs, ys = self.pcs, self.ys
+            for pc in self.parent.highlighted_list:
+                i = bisect_left(pcs, pc)
+                if i < len(pcs) and pcs[i] == pc:
+                    self.cache[1].append(CacheEntry(y=ys[i], height=FONT_HEIGHT))
 
         self.redraw()
 
+    # The code/data band only changes with the layout, it is rendered into a texture once
+    # and stretched over the widget
+    def get_band(self, total_height: float) -> Texture:
+        if self.band is not None and self.band_height == total_height:
+            return self.band
+
+        rows = max(1, min(int(total_height), BAND_RESOLUTION))
+        buf = bytearray(bytes(int(c * 255) for c in BG_COLOR) * rows)
+        color = bytes(int(c * 255) for c in get_color_from_hex("#66BB6A"))
+        for entry in self.cache[0]:
+            # Texture rows go bottom to top
+            start = rows - math.ceil((entry.y + entry.height) / total_height * rows)
+            end = rows - int(entry.y / total_height * rows)
+            for row in range(max(start, 0), min(max(end, start + 1), rows)):
+                buf[row * 4:row * 4 + 4] = color
+
+        self.band = Texture.create(size=(1, rows), colorfmt="rgba")
+        self.band.mag_filter = "nearest"
+        self.band.blit_buffer(bytes(buf), colorfmt="rgba", bufferfmt="ubyte")
+        self.band_height = total_height
+        return self.band
+
     def redraw(self, *args):
         if not self.parent.rv: return
         total_height = self.parent.rv.children[0].height
@@ -70,22 +118,15 @@ class Minimap(KWidget, Widget):
 
         self.canvas.after.clear()
         with self.canvas.after:
-            Color(*BG_COLOR)
-            Rectangle(pos=(self.x, self.y), size=(self.width, self.height))
-            
-            def draw(entries: list[CacheEntry]):
-                y = 0
-                for entry in entries:
-                    new_y = int(self.y + (1 - ((entry.y + entry.height) / total_height)) * self.height)
-                    if new_y == y: continue
-                    y = new_y
-
-                    height = (entry.height / total_height) * self.height
-                    Rectangle(pos=(self.x, y), size=(self.width, max(height, dp(1))))
-
-            Color(*get_color_from_hex("#66BB6A"))
-            draw(self.cache[0])
-            Color(*get_color_from_hex("#EF5350"))
-            draw(self.cache[1])
-
+            Color(1, 1, 1, 1)
+            Rectangle(pos=(self.x, self.y), size=(self.width, self.height), texture=self.get_band(total_height))
 
+            Color(*get_color_from_hex("#EF5350"))
+            y = 0
+            for entry in self.cache[1]:
+                new_y = int(self.y + (1 - ((entry.y + entry.height) / total_height)) * self.height)
+                if new_y == y: continue
+                y = new_y
+
+                height = (entry.height / total_height) * self.height
+                Rectangle(pos=(self.x, y), size=(self.width, max(height, dp(1))))
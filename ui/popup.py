@@ -17,6 +17,19 @@ class InvalidInsnPopup(KWidget, Popup):
     def on_close(self, *args):
         pass
 
+def show_invalid_insn(pc: int, cont, close):
+    # Error handler for Project.disassemble
+    popup = InvalidInsnPopup(instruction=pc)
+    def on_continue(popup):
+        cont()
+        popup.dismiss()
+    def on_close(popup):
+        close()
+        popup.dismiss()
+    popup.bind(on_continue=on_continue)
+    popup.bind(on_close=on_close)
+    popup.open()
+
 class FunctionAnalyzerPopup(KWidget, Popup):
     max = NumericProperty(0)
     value = NumericProperty(0)
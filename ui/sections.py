@@ -1,8 +1,6 @@
 import math
 import sys
 
-from pytreemap import TreeSet
-
 from kivy.uix.textinput import TextInput
 from kivy.uix.label import Label
 from kivy.uix.boxlayout import BoxLayout
@@ -22,9 +20,12 @@ from kivy.core.clipboard import Clipboard
 
 from . import main
 from .kivytypes import KWidget
-from .project import Section, DATA_PER_ROW, Instruction, MAX_SECTION_LENGTH
+from core.project import Section, DATA_PER_ROW, Instruction, MAX_SECTION_LENGTH
+from core.query import parse_query
+from core.signatures import BytePattern
 from .main import LABEL_HEIGHT, FONT_HEIGHT, FONT_SIZE, FONT_NAME, FONT_WIDTH, EscapeTrigger, HideableTextInput, NavigationListing, app, iter_all_children_of_type
 from .context_menu import ContextMenuBehavior, show_context_menu, MenuHandler, MenuItem
+from .popup import show_invalid_insn
 from disapi import Loc
 
 from tcls_900.tlcs_900 import Mem, MemReg
@@ -82,15 +83,12 @@ class RV(KWidget, RecycleView):
         Clock.schedule_once(post, 0)
 
     def update_data(self):
-        data = []
-        section: Section
-        for section in self.listing_panel.get_sections():
-            columns = len(section.instructions)
-            data.append({"section": section, 
-                         "height": columns * FONT_HEIGHT + (LABEL_HEIGHT if section.labels else 0),
-                         "rv": self})
+        def rows() -> list[tuple[Section, float]]:
+            return [(section, len(section.instructions) * FONT_HEIGHT + (LABEL_HEIGHT if section.labels else 0))
+                    for section in self.listing_panel.get_sections()]
 
-        self.data = data
+        self.data = [{"section": section, "height": height, "rv": self}
+                     for section, height in self.listing_panel.get_layout("rows", rows)]
 
     def scroll_to_offset(self, offset: int, history: bool = False) -> bool:
         scroll_pos = 0
@@ -444,7 +442,7 @@ class SectionData(KWidget, ContextMenuBehavior, SectionColumn):
                             a.dis_panel.arrows.redraw()
                             Clock.schedule_once(lambda dt: a.scroll_to_offset(rv.selection_start), 0)
                 
-                        a.project.disassemble(rv.selection_start, callback)
+                        a.project.disassemble(rv.selection_start, callback, show_invalid_insn)
                     elif item == "copy":
                         data = app().project.get_data_slice(rv.selection_start, rv.selection_end)
                         hex_data = " ".join(format(x, "0>2X") for x in data)
@@ -484,6 +482,7 @@ class LocationLabel:
 
 def section_to_markup(instructions: list[Instruction], text: list[str], labels: list[LocationLabel], widths: list[int] | None = None) -> int:
     max_width = 0
+    annotations = app().project.get_annotations()
     for insn in instructions:
         row_width = len(insn.entry.opcode) + 1
         row = f"[color=#569CD6]{insn.entry.opcode}[/color] "
@@ -528,6 +527,10 @@ def section_to_markup(instructions: list[Instruction], text: list[str], labels:
             if i < len(insn.entry.instructions) - 1:
                 row += ", "
                 row_width += 2
+        annotation = annotations.get(insn.entry.pc)
+        if annotation:
+            row += f"  [color=#6A9955]; {annotation}[/color]"
+            row_width += len(annotation) + 4
         max_width = max(max_width, row_width)
         if widths is not None: widths.append(row_width)
 
@@ -552,6 +555,8 @@ def open_context_menu(ep: int, is_fun: bool, touch, main_panel) -> bool:
                 app().open_rename(ep, touch.x, touch.y)
             elif item == "calls":
                 app().open_call_graph(ep)
+            elif item == "loop_bound":
+                app().open_loop_bound(ep, touch.x, touch.y)
     
     show_context_menu(Handler(), [
         MenuItem("goto", f"Go to {'function' if is_fun else 'label'}"),
@@ -560,7 +565,9 @@ def open_context_menu(ep: int, is_fun: bool, touch, main_panel) -> bool:
         MenuItem("listing", "Open function listing"),
     ] + ([
         MenuItem("calls", "Open call graph")
-    ] if is_fun else []))
+    ] if is_fun else [
+        MenuItem("loop_bound", "Set loop bound")
+    ]))
     return True
 
 class SectionMnemonic(KWidget, ContextMenuBehavior, SectionColumn):
@@ -605,7 +612,7 @@ class SectionMnemonic(KWidget, ContextMenuBehavior, SectionColumn):
                                 Rectangle(pos=(self.x + index * FONT_WIDTH, self.y + self.height - ((i + 1) * FONT_HEIGHT)), size=(len(search_item) * FONT_WIDTH, FONT_HEIGHT))
                                 index += len(search_item)
 
-                    elif isinstance(search_item, bytearray):
+                    elif isinstance(search_item, (bytearray, BytePattern)):
                         pass
                     elif insn.entry.pc in highlighted:
                         Color(*get_color_from_hex("#E695337A"))
@@ -737,15 +744,22 @@ class SearchInput(HideableTextInput, EscapeTrigger):
                 panel.highlight_list([i for i, _ in res], self.text)
             elif option == "Data":
                 try:
-                    search_bytes = bytearray(int(x, base=16) for x in self.text.split(" "))
+                    pattern = BytePattern(self.text)
                 except ValueError:
                     return
-                res = app().project.search_in_data(search_bytes, fun)
-                panel.highlight_list(res, search_bytes)
+                res = app().project.search_in_data(pattern, fun)
+                panel.highlight_list(res, pattern)
             elif option == "Text":
                 search_bytes = bytearray(self.text.encode())
                 res = app().project.search_in_data(search_bytes, fun)
                 panel.highlight_list(res, search_bytes)
+            elif option == "Query":
+                try:
+                    predicate = parse_query(self.text, app().project)
+                except ValueError:
+                    return
+                res = app().project.query(predicate, fun)
+                panel.highlight_list(res, predicate)
 
         else:
             super().keyboard_on_key_down(window, keycode, text, modifiers)
@@ -111,6 +111,15 @@ class ResizableRecycleTable(StencilView, BoxLayout):
         self.reverse = -1
         self.ordered_by = -1
 
+        # All rows, data only holds the ones that pass the filter in display order
+        self.rows: list[list] = list(data)
+        # Indices of the rows that match filter_text, None if there is no filter
+        self.matches: list[int] | None = None
+        self.filter_text = ""
+        self.row_keys: list[str] | None = None
+        # Column -> (permutation sorted by that column, rank of every row in it)
+        self.orders: dict[int, tuple[list[int], list[int]]] = {}
+
     def is_pos_inside_of_body(self, pos):
         return self.body.parent.collide_point(*self.body.parent.to_widget(*pos))
 
@@ -158,12 +167,70 @@ class ResizableRecycleTable(StencilView, BoxLayout):
                 else: widget.direction = 0
                 i += 1
 
-    def sort_data(self):
-        self.data.sort(key=lambda row: row[self.ordered_by], reverse=self.reverse == -1)
+    def column_key(self, column: int, value):
+        return value
+
+    def row_key(self, row: list) -> str:
+        # Cells are separated so that a filter can't match across them
+        return "\0".join(str(value).casefold() for value in row)
+
+    def set_rows(self, rows: list[list]):
+        self.rows = rows
+        self.invalidate()
+
+    # Has to be called when the values of the rows changed
+    def invalidate(self):
+        self.row_keys = None
+        self.orders = {}
+        text = self.filter_text
+        self.filter_text = ""
+        self.matches = None
+        self.filter(text or None)
+
+    def order(self, column: int) -> tuple[list[int], list[int]]:
+        res = self.orders.get(column)
+        if res is None:
+            keys = [self.column_key(column, row[column]) for row in self.rows]
+            permutation = sorted(range(len(self.rows)), key=keys.__getitem__)
+            rank = [0] * len(permutation)
+            for i, r in enumerate(permutation): rank[r] = i
+            res = self.orders[column] = (permutation, rank)
+        return res
+
+    def filter(self, text: str | None = None):
+        if not text:
+            self.matches = None
+            self.filter_text = ""
+        else:
+            text = text.casefold()
+            # A longer filter can only narrow down the previous matches
+            if self.row_keys is not None and self.matches is not None and text.startswith(self.filter_text):
+                candidates = self.matches
+            else: candidates = range(len(self.rows))
+            if self.row_keys is None:
+                self.row_keys = [self.row_key(row) for row in self.rows]
+            keys = self.row_keys
+            self.matches = [i for i in candidates if text in keys[i]]
+            self.filter_text = text
+        self.update_rows()
+
+    def update_rows(self):
+        if self.ordered_by >= 0 and self.ordered_by < len(self.headers):
+            permutation, rank = self.order(self.ordered_by)
+            if self.matches is None: indices = permutation
+            else: indices = sorted(self.matches, key=rank.__getitem__)
+            if self.reverse == -1: indices = indices[::-1]
+        elif self.matches is None: indices = range(len(self.rows))
+        else: indices = self.matches
+
+        rows = self.rows
+        self.data = [rows[i] for i in indices]
         self._update_ui()
 
+    def sort_data(self):
+        self.update_rows()
+
     def sort_by_column(self, col_index):
-        self.data.sort(key=lambda row: row[col_index], reverse=self.reverse == col_index)
         self.reverse = -1 if self.reverse == col_index else col_index
         self.ordered_by = col_index
-        self._update_ui()
+        self.update_rows()